@@ -46,12 +46,16 @@ INSTALLED_APPS = [
 
 MIDDLEWARE = [
     'django.middleware.security.SecurityMiddleware',
+    # Compresses large API responses; must wrap everything that edits content
+    'recipes.middleware.CompressionMiddleware',
     # IMPORTANT: Must be very high, preferably after SecurityMiddleware
     'corsheaders.middleware.CorsMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
     'django.contrib.auth.middleware.AuthenticationMiddleware',
+    # Must come after AuthenticationMiddleware so request.user is set
+    'recipes.middleware.ReplicaRoutingMiddleware',
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
 ]
@@ -83,12 +87,85 @@ WSGI_APPLICATION = 'core.wsgi.application'
 # Database
 # https://docs.djangoproject.com/en/5.0/ref/settings/#databases
 
-DATABASES = {
-    'default': {
-        'ENGINE': 'django.db.backends.sqlite3',
-        'NAME': BASE_DIR / 'db.sqlite3',
+# The backend is chosen from the environment so production can run on
+# Postgres while local development keeps the zero-setup SQLite file.
+#   DB_ENGINE=postgresql DB_NAME=... DB_USER=... DB_PASSWORD=... DB_HOST=...
+# Postgres needs a driver (pip install psycopg). Connection pooling is off
+# unless DB_POOL=1, which also needs `psycopg[pool]` (pip install "psycopg[pool]").
+DB_ENGINE = os.environ.get('DB_ENGINE', 'sqlite3').lower()
+
+if DB_ENGINE in ('postgres', 'postgresql'):
+    DB_POOL = os.environ.get('DB_POOL', '0') == '1'
+    DATABASES = {
+        'default': {
+            'ENGINE': 'django.db.backends.postgresql',
+            'NAME': os.environ.get('DB_NAME', 'recipes'),
+            'USER': os.environ.get('DB_USER', ''),
+            'PASSWORD': os.environ.get('DB_PASSWORD', ''),
+            'HOST': os.environ.get('DB_HOST', 'localhost'),
+            'PORT': os.environ.get('DB_PORT', '5432'),
+            # Django refuses persistent connections together with a pool, so
+            # the pool owns connection reuse when it is enabled.
+            'CONN_MAX_AGE': 0 if DB_POOL else int(os.environ.get('DB_CONN_MAX_AGE', '60')),
+            # Ping reused connections before handing them to a request
+            'CONN_HEALTH_CHECKS': True,
+            'OPTIONS': {
+                'pool': {
+                    'min_size': int(os.environ.get('DB_POOL_MIN_SIZE', '2')),
+                    'max_size': int(os.environ.get('DB_POOL_MAX_SIZE', '10')),
+                    'timeout': int(os.environ.get('DB_POOL_TIMEOUT', '10')),
+                },
+            } if DB_POOL else {},
+        }
     }
-}
+else:
+    DATABASES = {
+        'default': {
+            'ENGINE': 'django.db.backends.sqlite3',
+            'NAME': os.environ.get('DB_NAME', BASE_DIR / 'db.sqlite3'),
+            'CONN_MAX_AGE': int(os.environ.get('DB_CONN_MAX_AGE', '60')),
+            'CONN_HEALTH_CHECKS': True,
+            'OPTIONS': {
+                # WAL lets readers keep working while load_recipes holds its
+                # write transaction; NORMAL sync is safe under WAL.
+                'init_command': (
+                    'PRAGMA journal_mode=WAL;'
+                    'PRAGMA synchronous=NORMAL;'
+                    f"PRAGMA mmap_size={int(os.environ.get('DB_SQLITE_MMAP_SIZE', 128 * 1024 * 1024))};"
+                ),
+                # Seconds to wait on a locked database before raising
+                'timeout': int(os.environ.get('DB_SQLITE_TIMEOUT', '20')),
+                # Take the write lock when the transaction starts, so two
+                # writers queue on the busy timeout instead of deadlocking
+                'transaction_mode': 'IMMEDIATE',
+            },
+            # WAL only applies to file databases, so tests use one as well
+            'TEST': {
+                'NAME': BASE_DIR / 'test_db.sqlite3',
+            },
+        }
+    }
+
+# Read replicas for list/detail/search traffic, as a comma separated list of
+# hosts (Postgres) or database files (SQLite), e.g. DB_REPLICAS=replica.sqlite3.
+# Writes, and reads by a client that wrote in the last few seconds, stay on
+# the primary (see recipes.routers and recipes.middleware).
+DATABASE_REPLICAS = []
+for replica_num, replica in enumerate(
+        filter(None, os.environ.get('DB_REPLICAS', '').split(',')), 1):
+    alias = f'replica_{replica_num}'
+    location_key = 'HOST' if DB_ENGINE in ('postgres', 'postgresql') else 'NAME'
+    DATABASES[alias] = {
+        **DATABASES['default'],
+        location_key: replica.strip(),
+        # Tests run against the primary only
+        'TEST': {'MIRROR': 'default'},
+    }
+    DATABASE_REPLICAS.append(alias)
+
+DATABASE_ROUTERS = ['recipes.routers.PrimaryReplicaRouter']
+DATABASE_REPLICA_STICKY_SECONDS = int(
+    os.environ.get('DB_REPLICA_STICKY_SECONDS', '5'))
 
 # Password validation
 # https://docs.djangoproject.com/en/5.0/ref/settings/#auth-password-validators
@@ -129,6 +206,46 @@ STATICFILES_DIRS = [
 ]
 STATIC_ROOT = BASE_DIR / 'staticfiles'  # <--- Ensure this is present
 
+# Serve the built React app (frontend/dist) from Django itself when there is
+# no separate web server for it. Run `npm run build` and then
+# `python manage.py compress_frontend` to add .br/.gz files next to the assets.
+FRONTEND_DIST_DIR = BASE_DIR / 'frontend' / 'dist'
+SERVE_FRONTEND = os.environ.get('SERVE_FRONTEND', '1') == '1'
+
+# Response compression (recipes.middleware.CompressionMiddleware). Brotli is
+# offered when the `brotli` package is installed, gzip otherwise.
+COMPRESSION_MIN_SIZE = 1024  # bytes
+COMPRESSION_CONTENT_TYPES = [
+    'application/json',
+    'application/x-ndjson',
+    'text/csv',
+    'text/html',
+    'text/plain',
+    'text/css',
+    'text/javascript',
+    'application/javascript',
+]
+
+# Memory-mapped catalog snapshot shared by all workers on a host
+# (recipes.snapshot). Build it at deploy time with
+# `python manage.py build_catalog_snapshot`. When the catalog changes, workers
+# keep serving the old one while one of them rebuilds it in a background
+# thread; with CATALOG_SNAPSHOT_BACKGROUND_REBUILD=0 the request that notices
+# rebuilds it inline instead.
+CATALOG_SNAPSHOT_PATH = os.environ.get('CATALOG_SNAPSHOT_PATH', str(BASE_DIR / 'catalog.snapshot'))
+CATALOG_SNAPSHOT_BACKGROUND_REBUILD = os.environ.get('CATALOG_SNAPSHOT_BACKGROUND_REBUILD', '1') == '1'
+
+# Username of the account whose recipes form the shared catalog
+# (recipes.catalog). load_recipes imports into it by default, and the meal
+# planner and recommendations only choose from its recipes; everyone else's
+# stay private to them.
+CATALOG_OWNER = os.environ.get('CATALOG_OWNER', 'admin')
+
+# Saving a recipe or meal plan rescores the user's recommendations
+# (recipes.recommendations) after the commit, in a background thread; with
+# RECOMMENDATIONS_BACKGROUND_REFRESH=0 in the request instead
+RECOMMENDATIONS_BACKGROUND_REFRESH = os.environ.get('RECOMMENDATIONS_BACKGROUND_REFRESH', '1') == '1'
+
 # Media files (user-uploaded images for projects)
 MEDIA_URL = '/media/'
 MEDIA_ROOT = os.path.join(BASE_DIR, 'media')
@@ -145,9 +262,57 @@ REST_FRAMEWORK = {
     ],
     'DEFAULT_PERMISSION_CLASSES': [
         'rest_framework.permissions.IsAuthenticated',
-    ]
+    ],
+    'DEFAULT_RENDERER_CLASSES': [
+        # Uses orjson when installed, otherwise behaves like JSONRenderer
+        'recipes.renderers.FastJSONRenderer',
+        'rest_framework.renderers.BrowsableAPIRenderer',
+    ],
+    # Recipe generation budgets, counted in generated recipes (num_recipes)
+    'DEFAULT_THROTTLE_RATES': {
+        'generation_user': os.environ.get('GENERATION_USER_RATE', '10/hour'),
+        'generation_global': os.environ.get('GENERATION_GLOBAL_RATE', '600/hour'),
+    },
+}
+
+# Token bucket sizes for recipes.throttles: how many recipes can be generated
+# back to back before the rate above applies
+THROTTLE_BURSTS = {
+    'generation_user': 5,
+    'generation_global': 50,
 }
 
+# Recipe generation (GenerateRecipeAPIView)
+GENERATION_MAX_RECIPES = 5  # Upper bound for num_recipes per request
+# At most this many Gemini calls in flight across all workers; further
+# requests wait in a queue of GENERATION_MAX_QUEUE for up to
+# GENERATION_QUEUE_TIMEOUT seconds before being shed with a 429. The wait
+# holds a worker, so keep it short: clients retry after Retry-After instead
+GENERATION_MAX_CONCURRENT = int(os.environ.get('GENERATION_MAX_CONCURRENT', '8'))
+GENERATION_MAX_QUEUE = int(os.environ.get('GENERATION_MAX_QUEUE', '16'))
+GENERATION_QUEUE_TIMEOUT = float(os.environ.get('GENERATION_QUEUE_TIMEOUT', '1'))  # seconds
+GEMINI_TIMEOUT = 60  # seconds per Gemini request
+GEMINI_API_URL = os.environ.get(
+    'GEMINI_API_URL',
+    'https://generativelanguage.googleapis.com/v1beta/models/gemini-2.0-flash:generateContent')
+
+# Throttles, the generation semaphore and replica pinning keep their state in
+# the cache. Point REDIS_URL at a shared Redis so they hold across workers;
+# the local-memory fallback is per process.
+if os.environ.get('REDIS_URL'):
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.redis.RedisCache',
+            'LOCATION': os.environ['REDIS_URL'],
+        }
+    }
+else:
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        }
+    }
+
 # CORS Configuration (for development)
 CORS_ALLOWED_ORIGINS = [
     "http://localhost:5173",  # Default for Vite React App
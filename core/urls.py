@@ -15,10 +15,12 @@ Including another URLconf
     2. Add a URL to urlpatterns:  path('blog/', include('blog.urls'))
 """
 from django.contrib import admin
-from django.urls import path, include
+from django.urls import path, include, re_path
 from django.conf import settings
 from django.conf.urls.static import static
 
+from . import views
+
 urlpatterns = [
     path('admin/', admin.site.urls),
     # This line tells Django that any URL starting with 'api/'
@@ -32,3 +34,13 @@ if settings.DEBUG:
                           document_root=settings.MEDIA_ROOT)
     urlpatterns += static(settings.STATIC_URL,
                           document_root=settings.STATIC_ROOT)
+elif settings.SERVE_FRONTEND:
+    # Production: built frontend assets with long-lived cache headers, and
+    # index.html for the app root and client-side routes
+    urlpatterns += [
+        re_path(r'^%s/(?P<path>.+)$' % settings.STATIC_URL.strip('/'),
+                views.frontend_asset, name='frontend-asset'),
+        # Not /api or /admin, with or without the slash, so CommonMiddleware
+        # can still redirect them to it
+        re_path(r'^(?P<path>(?!(?:api|admin)(?:/|$)).*)$', views.react_app_view, name='frontend'),
+    ]
@@ -0,0 +1,79 @@
+"""
+Serves the built React frontend (frontend/dist) when Django runs without
+a separate web server in front of it (SERVE_FRONTEND).
+
+Files are looked up in FRONTEND_DIST_DIR, then STATIC_ROOT (admin and DRF
+assets after collectstatic). When the client accepts it, a pre-compressed
+sibling written by `manage.py compress_frontend` (app.js.br, app.js.gz) is
+sent instead of the original.
+"""
+import mimetypes
+import os
+import re
+
+from django.conf import settings
+from django.core.exceptions import SuspiciousFileOperation
+from django.http import FileResponse, Http404, HttpResponseNotModified
+from django.utils._os import safe_join
+from django.utils.cache import patch_vary_headers
+from django.utils.http import http_date
+from django.views.static import was_modified_since
+
+from recipes.compression import ENCODING_SUFFIXES, choose_encoding
+
+# Vite names built assets like index-BxK3a9Qe.js; their content never changes
+HASHED_ASSET_RE = re.compile(r'(^|/)assets/.+-[A-Za-z0-9_-]{8,}\.\w+$')
+IMMUTABLE_CACHE_CONTROL = 'public, max-age=31536000, immutable'
+# index.html and unhashed files must be revalidated so deploys show up
+REVALIDATE_CACHE_CONTROL = 'no-cache'
+
+
+def _find_file(path):
+    for root in (settings.FRONTEND_DIST_DIR, settings.STATIC_ROOT):
+        try:
+            full_path = safe_join(root, path)
+        except SuspiciousFileOperation:  # Path escapes the root
+            raise Http404
+        if os.path.isfile(full_path):
+            return full_path
+    raise Http404(f'"{path}" does not exist')
+
+
+def _serve(request, full_path, cache_control):
+    content_type, _ = mimetypes.guess_type(full_path)
+    encoding = None
+    candidates = [
+        coding for coding, suffix in ENCODING_SUFFIXES.items()
+        if os.path.isfile(full_path + suffix)]
+    if candidates:
+        encoding = choose_encoding(request.META.get('HTTP_ACCEPT_ENCODING', ''), candidates)
+    served_path = full_path + ENCODING_SUFFIXES[encoding] if encoding else full_path
+
+    stat = os.stat(served_path)
+    if not was_modified_since(request.META.get('HTTP_IF_MODIFIED_SINCE'), stat.st_mtime):
+        response = HttpResponseNotModified()
+    else:
+        # Content-Type from the original name, not the .br/.gz sibling
+        response = FileResponse(open(served_path, 'rb'),
+                                content_type=content_type or 'application/octet-stream')
+        # FileResponse adds one from the file name; assets are displayed, not downloaded
+        del response.headers['Content-Disposition']
+        response.headers['Last-Modified'] = http_date(stat.st_mtime)
+        if encoding:
+            response.headers['Content-Encoding'] = encoding
+    response.headers['Cache-Control'] = cache_control
+    if candidates:
+        patch_vary_headers(response, ('Accept-Encoding',))
+    return response
+
+
+def frontend_asset(request, path):
+    full_path = _find_file(path)
+    cache_control = (IMMUTABLE_CACHE_CONTROL if HASHED_ASSET_RE.search(path)
+                     else REVALIDATE_CACHE_CONTROL)
+    return _serve(request, full_path, cache_control)
+
+
+def react_app_view(request, path=''):
+    """index.html for the app root and any client-side route."""
+    return _serve(request, _find_file('index.html'), REVALIDATE_CACHE_CONTROL)
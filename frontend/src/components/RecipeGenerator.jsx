@@ -1,6 +1,18 @@
-import React, { useState } from 'react';
+import React, { useEffect, useRef, useState } from 'react';
 import axios from 'axios';
 
+// Wait this long after the last keystroke before looking up suggestions
+const SUGGEST_DELAY_MS = 150;
+
+// Clears a debounce timer ref and aborts the request held in a controller ref
+function cancelLookup(timer, request) {
+  clearTimeout(timer.current);
+  if (request.current) {
+    request.current.abort();
+    request.current = null;
+  }
+}
+
 // Accept isAuthenticated as a prop
 function RecipeGenerator({ API_BASE_URL, isAuthenticated }) {
   const [ingredients, setIngredients] = useState('');
@@ -10,6 +22,50 @@ function RecipeGenerator({ API_BASE_URL, isAuthenticated }) {
   const [generatedRecipes, setGeneratedRecipes] = useState([]);
   const [isLoading, setIsLoading] = useState(false);
   const [error, setError] = useState(null);
+  const [suggestions, setSuggestions] = useState([]);
+
+  // Pending suggestion lookup: the debounce timer and the request in flight
+  const suggestTimer = useRef(null);
+  const suggestRequest = useRef(null);
+
+  useEffect(() => () => cancelLookup(suggestTimer, suggestRequest), []);
+
+  // Suggest completions for the ingredient being typed (after the last comma),
+  // once typing pauses; a newer keystroke aborts the older lookup, so a slow
+  // response never replaces fresher suggestions
+  const handleIngredientsChange = (value) => {
+    setIngredients(value);
+    cancelLookup(suggestTimer, suggestRequest);
+    const parts = value.split(',');
+    const term = parts[parts.length - 1].trim();
+    if (!isAuthenticated || term.length < 2) {
+      setSuggestions([]);
+      return;
+    }
+    suggestTimer.current = setTimeout(async () => {
+      const controller = new AbortController();
+      suggestRequest.current = controller;
+      try {
+        const response = await axios.get(`${API_BASE_URL}ingredients/autocomplete/`, {
+          params: { q: term, limit: 8 },
+          signal: controller.signal,
+        });
+        if (controller.signal.aborted) {
+          return; // Answered just before a newer keystroke cancelled it
+        }
+        const prefix = parts.slice(0, -1).map((part) => part.trim()).concat('').join(', ');
+        setSuggestions(response.data.map((item) => prefix + item.name));
+      } catch (err) {
+        if (!axios.isCancel(err)) {
+          setSuggestions([]); // Suggestions are optional; typing still works
+        }
+      } finally {
+        if (suggestRequest.current === controller) {
+          suggestRequest.current = null;
+        }
+      }
+    }, SUGGEST_DELAY_MS);
+  };
 
   const handleSubmit = async (e) => {
     e.preventDefault();
@@ -50,11 +106,16 @@ function RecipeGenerator({ API_BASE_URL, isAuthenticated }) {
             type="text"
             id="ingredients"
             value={ingredients}
-            onChange={(e) => setIngredients(e.target.value)}
+            onChange={(e) => handleIngredientsChange(e.target.value)}
+            list="ingredient-suggestions"
+            autoComplete="off"
             placeholder="e.g., chicken, broccoli, rice"
             style={{ width: '100%', padding: '10px', borderRadius: '5px', border: '1px solid #ccc', color: 'white', backgroundColor: '#333' }} /* MODIFIED */
             disabled={!isAuthenticated}
           />
+          <datalist id="ingredient-suggestions">
+            {suggestions.map((suggestion) => <option key={suggestion} value={suggestion} />)}
+          </datalist>
         </div>
         <div>
           <label htmlFor="dietary" style={{ display: 'block', marginBottom: '5px', fontWeight: 'bold', color: '#333' }}>Dietary Preferences (comma-separated):</label>
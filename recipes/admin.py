@@ -1,11 +1,190 @@
 from django.contrib import admin
-from .models import Ingredient, DietaryPreference, Recipe, RecipeIngredient, MealPlan, ShoppingListItem
+from django.core.paginator import Paginator
+from django.db import connections
+from django.db.models import Q
+from django.utils.functional import cached_property
 
-admin.site.register(Ingredient)
-admin.site.register(DietaryPreference)
-admin.site.register(Recipe)
-admin.site.register(RecipeIngredient)
-admin.site.register(MealPlan)
-admin.site.register(ShoppingListItem)
+from .models import (Ingredient, DietaryPreference, Recipe, RecipeIngredient, RecipeTitleKey, MealPlan,
+                     RecommendationFeed, ShoppingListItem)
 
-# Register your models here.
+# Below this many rows an exact COUNT(*) is cheap enough
+ESTIMATED_COUNT_THRESHOLD = 100000
+# Sorts after any character that can follow a search prefix
+PREFIX_END = '\U0010ffff'
+
+
+def estimated_row_count(model, using):
+    """The planner's row estimate for `model`'s table, or None where unavailable."""
+    connection = connections[using]
+    if connection.vendor != 'postgresql':
+        return None
+    with connection.cursor() as cursor:
+        cursor.execute('SELECT reltuples::bigint FROM pg_class WHERE oid = %s::regclass',
+                       [model._meta.db_table])
+        row = cursor.fetchone()
+    # -1 until the table has been analyzed
+    return row[0] if row and row[0] >= 0 else None
+
+
+class EstimatedCountPaginator(Paginator):
+    """
+    Paginator for huge tables: an unfiltered changelist uses the table
+    statistics instead of COUNT(*), which has to scan every row.
+    """
+
+    @cached_property
+    def count(self):
+        queryset = self.object_list
+        if not queryset.query.where:
+            estimate = estimated_row_count(queryset.model, queryset.db)
+            if estimate is not None and estimate >= ESTIMATED_COUNT_THRESHOLD:
+                return estimate
+        return super().count
+
+
+def prefix_match(field, term, vendor):
+    """
+    Q for `field` starting with `term`, case-sensitively, in a form the
+    backend can answer from the column's index. PostgreSQL's LIKE 'term%'
+    uses the varchar_pattern_ops "_like" index Django creates. SQLite's LIKE
+    ignores case and scans the whole index, but a range on the column seeks.
+    Lower-case columns are searched with the term lower-cased instead.
+    """
+    if vendor == 'sqlite':
+        return Q(**{f'{field}__gte': term, f'{field}__lt': term + PREFIX_END})
+    return Q(**{f'{field}__startswith': term})
+
+
+def recipes_titled(term, vendor):
+    """Ids of the recipes with a title word starting with `term`, in any case (see recipes.search)."""
+    return RecipeTitleKey.objects.filter(prefix_match('key', term.lower(), vendor)).values('recipe_id')
+
+
+def ingredients_named(term, vendor):
+    """Ids of the ingredients whose name starts with `term`, in any case."""
+    # Names are stored lower case
+    return Ingredient.objects.filter(prefix_match('name', term.lower(), vendor)).values('pk')
+
+
+# search_fields answered from their own index, by (model, field)
+INDEXED_SEARCHES = {(Recipe, 'title'): recipes_titled, (Ingredient, 'name'): ingredients_named}
+
+
+class LargeTableAdmin(admin.ModelAdmin):
+    """
+    Base admin for tables with millions of rows: estimated counts, and a
+    search that matches the whole term as a prefix of the search_fields,
+    from an index rather than the default per-word icontains scan. Recipe
+    titles match at any word and ingredient names in any case, so "pie"
+    finds both "Apple Pie" and "Pie Crust"; other fields match the start,
+    case-sensitively (see prefix_match).
+
+    Each related search field is looked up in its own table and matched by
+    id, so the OR of several relations stays one index lookup per relation
+    instead of a filter on their join.
+    """
+    paginator = EstimatedCountPaginator
+    # Skips the second, unfiltered COUNT(*) on filtered changelists
+    show_full_result_count = False
+    search_help_text = 'Matches the start of the text; upper and lower case must match.'
+
+    def field_search(self, field, term, vendor):
+        relation, _, name = field.rpartition('__')
+        model = self.model._meta.get_field(relation).related_model if relation else self.model
+        search = INDEXED_SEARCHES.get((model, name))
+        if search is not None:
+            return Q(**{f'{relation or "pk"}__in': search(term, vendor)})
+        if relation:
+            return Q(**{f'{relation}__in': model.objects.filter(prefix_match(name, term, vendor)).values('pk')})
+        return prefix_match(name, term, vendor)
+
+    def get_search_results(self, request, queryset, search_term):
+        search_term = search_term.strip()
+        if not search_term:
+            return queryset, False
+        vendor = connections[queryset.db].vendor
+        query = Q()
+        for field in self.get_search_fields(request):
+            query |= self.field_search(field, search_term, vendor)
+        return queryset.filter(query), False
+
+
+@admin.register(Ingredient)
+class IngredientAdmin(LargeTableAdmin):
+    list_display = ('id', 'name')
+    ordering = ('name',)
+    # Also used by the ingredient autocomplete widgets below
+    search_fields = ('name',)
+    search_help_text = 'Matches the start of the name, in any case.'
+
+
+@admin.register(DietaryPreference)
+class DietaryPreferenceAdmin(admin.ModelAdmin):
+    list_display = ('id', 'name')
+    search_fields = ('name',)
+
+
+class RecipeIngredientInline(admin.TabularInline):
+    model = RecipeIngredient
+    extra = 0
+    autocomplete_fields = ('ingredient',)
+
+    def get_queryset(self, request):
+        return super().get_queryset(request).select_related('ingredient')
+
+
+@admin.register(Recipe)
+class RecipeAdmin(LargeTableAdmin):
+    list_display = ('id', 'title', 'user', 'cuisine', 'cooking_time_minutes', 'generated_by_ai')
+    list_select_related = ('user',)
+    list_filter = ('generated_by_ai',)
+    ordering = ('-id',)
+    search_fields = ('title',)
+    search_help_text = 'Matches the start of any word of the title, in any case.'
+    raw_id_fields = ('user', 'duplicate_of')
+    autocomplete_fields = ('dietary_preferences',)
+    inlines = (RecipeIngredientInline,)
+
+
+@admin.register(RecipeIngredient)
+class RecipeIngredientAdmin(LargeTableAdmin):
+    list_display = ('id', 'recipe', 'ingredient', 'quantity')
+    list_select_related = ('recipe', 'ingredient')
+    ordering = ('-id',)
+    search_fields = ('recipe__title', 'ingredient__name')
+    search_help_text = 'Matches the start of any word of the recipe title, or of the ingredient name, in any case.'
+    raw_id_fields = ('recipe',)
+    autocomplete_fields = ('ingredient',)
+
+
+@admin.register(MealPlan)
+class MealPlanAdmin(LargeTableAdmin):
+    list_display = ('id', 'name', 'user', 'start_date', 'end_date')
+    list_select_related = ('user',)
+    ordering = ('-id',)
+    search_fields = ('user__username',)
+    raw_id_fields = ('user', 'recipes')
+
+
+@admin.register(RecommendationFeed)
+class RecommendationFeedAdmin(LargeTableAdmin):
+    list_display = ('id', 'user', 'updated_at')
+    list_select_related = ('user',)
+    ordering = ('-updated_at',)
+    search_fields = ('user__username',)
+    raw_id_fields = ('user',)
+    # The packed arrays are rebuilt by build_recommendations, not edited
+    readonly_fields = ('recipe_ids', 'scores', 'updated_at')
+
+
+@admin.register(ShoppingListItem)
+class ShoppingListItemAdmin(LargeTableAdmin):
+    list_display = ('id', 'ingredient', 'quantity', 'meal_plan', 'is_checked')
+    # MealPlan.__str__ shows the owner's username
+    list_select_related = ('ingredient', 'meal_plan__user')
+    list_filter = ('is_checked',)
+    ordering = ('-id',)
+    search_fields = ('ingredient__name',)
+    search_help_text = 'Matches the start of the ingredient name, in any case.'
+    raw_id_fields = ('meal_plan',)
+    autocomplete_fields = ('ingredient',)
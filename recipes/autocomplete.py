@@ -0,0 +1,226 @@
+"""
+In-memory prefix index for ingredient autocomplete.
+
+Every normalized ingredient name is indexed once per word it contains, from
+that word to the end ("tablespoons butter" under both "tablespoons butter"
+and "butter"), in one sorted numpy array. A prefix query is then a pair of
+binary searches; matches are ranked by how many recipes use the ingredient.
+Queries of MIN_TYPO_LENGTH or more characters that find too few matches are
+retried with every prefix one edit away (a missing, extra, wrong or swapped
+letter), all looked up in a single vectorized searchsorted.
+
+The array holds only the first KEY_BYTES bytes of each key's UTF-8 encoding,
+which sort in the same order as the strings. Longer prefixes are looked up
+by their first KEY_BYTES bytes and the candidates checked against the names.
+
+The index is built from the catalog snapshot, so it costs no queries at
+worker startup, and is rebuilt in the background whenever the snapshot is:
+renamed and deleted ingredients and changed recipe counts show up with the
+snapshot rebuild that follows the change. New ingredients do not change the
+snapshot; they are read into a small side index of the ids past the
+snapshot's, on the same background refresh, and merged into the main index
+once there are MERGE_ROWS of them.
+"""
+import threading
+import time
+
+import numpy as np
+from django.conf import settings
+from django.db import connections
+from django.db.models import Count, Q
+
+from .catalog import catalog_recipes
+from .dedup import WORD_RE, normalize_words
+from .models import Ingredient
+from .snapshot import get_catalog_snapshot, latest_catalog_snapshot
+
+REFRESH_SECONDS = 2
+MERGE_ROWS = 1000
+MIN_TYPO_LENGTH = 4
+MAX_LIMIT = 50
+KEY_BYTES = 16
+
+# Sorts after every byte of a UTF-8 key
+_KEY_END = b'\xff'
+
+
+def _keys(name):
+    """The normalized name from the start of each of its words."""
+    normalized = normalize_words(name)
+    return [normalized[match.start():] for match in WORD_RE.finditer(normalized)]
+
+
+def _edits(term, alphabet):
+    """Strings one delete, transpose, replace or insert away from `term`."""
+    splits = [(term[:i], term[i:]) for i in range(len(term) + 1)]
+    edits = {left + right[1:] for left, right in splits if right}
+    edits.update(left + right[1] + right[0] + right[2:] for left, right in splits if len(right) > 1)
+    edits.update(left + char + right[1:] for left, right in splits if right for char in alphabet)
+    # Inserting at the end only makes the prefix longer, which matches less
+    edits.update(left + char + right for left, right in splits[:-1] for char in alphabet)
+    edits.discard(term)
+    return edits
+
+
+def _rank(match):
+    # Most used first, then shortest
+    _, name, count = match
+    return -count, len(name), name
+
+
+def _search(indexes, query, limit):
+    """Up to `limit` (id, name, recipe_count) from all `indexes`, prefix matches before typo matches."""
+    term = normalize_words(query)
+    if not term:
+        return []
+    prefix_matches, typo_matches = [], []
+    for index in indexes:
+        prefix, typos = index.matches(term, limit)
+        prefix_matches += prefix
+        typo_matches += typos
+    results = sorted(prefix_matches, key=_rank)[:limit]
+    found = {ingredient_id for ingredient_id, _, _ in results}
+    return results + sorted((match for match in typo_matches if match[0] not in found),
+                            key=_rank)[:limit - len(results)]
+
+
+class IngredientIndex:
+
+    def __init__(self, ingredient_ids, names, recipe_counts, snapshot=None):
+        self.ids = list(ingredient_ids)
+        self.names = list(names)
+        self.counts = np.asarray(recipe_counts, dtype=np.int64)
+        # The snapshot this index was built from, if any
+        self.snapshot = snapshot
+        self.last_id = max(self.ids, default=0)
+        self.checked_at = time.monotonic()
+        entries = sorted((key.encode(), row) for row, name in enumerate(self.names) for key in _keys(name))
+        self.keys = np.array([key[:KEY_BYTES] for key, _ in entries], dtype=f'S{KEY_BYTES}')
+        self.key_rows = np.array([row for _, row in entries], dtype=np.int64)
+        self.alphabet = ''.join(sorted(set(''.join(self.names).lower()) & set('abcdefghijklmnopqrstuvwxyz0123456789 ')))
+
+    @classmethod
+    def from_snapshot(cls, snapshot):
+        return cls(snapshot.ingredient_ids.tolist(), snapshot.ingredient_names(),
+                   snapshot.ingredient_counts, snapshot)
+
+    def merged(self, other):
+        """This index with `other`'s ingredients added."""
+        return IngredientIndex(self.ids + other.ids, self.names + other.names,
+                               np.concatenate([self.counts, other.counts]), self.snapshot)
+
+    def _key_rows(self, prefixes):
+        """Rows with a key whose first KEY_BYTES bytes start with any of the UTF-8 `prefixes`."""
+        bounds = np.array([prefix[:KEY_BYTES] for prefix in prefixes]
+                          + [(prefix + _KEY_END)[:KEY_BYTES] for prefix in prefixes], dtype=f'S{KEY_BYTES}')
+        starts = np.searchsorted(self.keys, bounds[:len(prefixes)])
+        ends = np.searchsorted(self.keys, bounds[len(prefixes):], side='right')
+        lengths = ends - starts
+        # All the ranges [start, end) at once
+        positions = np.repeat(starts - np.cumsum(lengths) + lengths, lengths) + np.arange(lengths.sum())
+        return np.unique(self.key_rows[positions])
+
+    def _prefix_rows(self, prefixes):
+        """Rows of the ingredients with a key starting with any of `prefixes`."""
+        encoded = [prefix.encode() for prefix in prefixes]
+        rows = self._key_rows([data for data in encoded if len(data) <= KEY_BYTES])
+        long_prefixes = tuple(prefix for prefix, data in zip(prefixes, encoded) if len(data) > KEY_BYTES)
+        if long_prefixes:
+            # Only their first KEY_BYTES bytes were compared; check the rest against the names
+            candidates = self._key_rows([prefix.encode() for prefix in long_prefixes]).tolist()
+            rows = np.union1d(rows, np.array([
+                row for row in candidates
+                if any(key.startswith(long_prefixes) for key in _keys(self.names[row]))], dtype=np.int64))
+        return rows
+
+    def _ranked(self, rows, limit, exclude=()):
+        rows = rows[~np.isin(rows, np.fromiter(exclude, dtype=np.int64))] if exclude else rows
+        if len(rows) > limit:
+            # Most used first; only the top `limit` need sorting
+            rows = rows[np.argpartition(-self.counts[rows], limit - 1)[:limit]]
+        return sorted(rows.tolist(), key=lambda row: (-self.counts[row], len(self.names[row]), self.names[row]))
+
+    def matches(self, term, limit):
+        """
+        Up to `limit` prefix matches of the normalized `term` and, if there
+        are fewer, up to `limit` typo matches, as (id, name, recipe_count).
+        """
+        prefix_rows = self._ranked(self._prefix_rows([term]), limit)
+        typo_rows = []
+        if len(prefix_rows) < limit and len(term) >= MIN_TYPO_LENGTH:
+            typo_rows = self._ranked(self._prefix_rows(sorted(_edits(term, self.alphabet))), limit,
+                                     exclude=prefix_rows)
+        return tuple([(self.ids[row], self.names[row], int(self.counts[row])) for row in rows]
+                     for rows in (prefix_rows, typo_rows))
+
+    def search(self, query, limit=10):
+        """Up to `limit` (id, name, recipe_count), prefix matches before typo matches."""
+        return _search([self], query, limit)
+
+
+_index_lock = threading.Lock()
+# The snapshot's index, the side index of ingredients added since, and the
+# background refresh if one is running
+_index = {'current': None, 'recent': None, 'refresh': None}
+
+
+def _recent_index(after_id):
+    """The ingredients with ids past `after_id`, which the snapshot predates, or None if there are none."""
+    rows = list(Ingredient.objects.filter(pk__gt=after_id).annotate(
+        recipe_count=Count('recipeingredient', filter=Q(recipeingredient__recipe__in=catalog_recipes())),
+    ).order_by('pk').values_list('pk', 'name', 'recipe_count'))
+    return IngredientIndex(*zip(*rows)) if rows else None
+
+
+def _refresh():
+    """
+    Rebuilds the index if the snapshot has been replaced, else merges the
+    side index into it once that has MERGE_ROWS ingredients, and re-reads
+    the side index; then swaps them in.
+    """
+    with _index_lock:
+        index, recent = _index['current'], _index['recent']
+    snapshot = get_catalog_snapshot()
+    if snapshot is not index.snapshot:
+        index = IngredientIndex.from_snapshot(snapshot)
+    elif recent is not None and len(recent.ids) >= MERGE_ROWS:
+        index = index.merged(recent)
+    recent = _recent_index(index.last_id)
+    with _index_lock:
+        _index['current'], _index['recent'] = index, recent
+
+
+def _refresh_in_background():
+    try:
+        _refresh()
+    finally:
+        # This thread's database connection
+        connections.close_all()
+        with _index_lock:
+            _index['refresh'] = None
+
+
+def search_ingredients(query, limit=10):
+    """
+    Searches this process's indexes. The main one is built on first use
+    from whatever snapshot is at hand; every REFRESH_SECONDS after, a
+    background thread refreshes them (see _refresh), and searches keep using
+    the current ones meanwhile. With CATALOG_SNAPSHOT_BACKGROUND_REBUILD off
+    the refresh runs first instead.
+    """
+    with _index_lock:
+        index = _index['current']
+        if index is None:
+            index = _index['current'] = IngredientIndex.from_snapshot(latest_catalog_snapshot())
+        stale = time.monotonic() - index.checked_at >= REFRESH_SECONDS
+        if stale:
+            index.checked_at = time.monotonic()
+            if settings.CATALOG_SNAPSHOT_BACKGROUND_REBUILD and _index['refresh'] is None:
+                thread = _index['refresh'] = threading.Thread(
+                    target=_refresh_in_background, name='ingredient-index-refresh', daemon=True)
+                thread.start()
+    if stale and not settings.CATALOG_SNAPSHOT_BACKGROUND_REBUILD:
+        _refresh()
+    with _index_lock:
+        indexes = [index for index in (_index['current'], _index['recent']) if index is not None]
+    return _search(indexes, query, limit)
@@ -0,0 +1,73 @@
+"""
+The shared recipe catalog: the recipes owned by the settings.CATALOG_OWNER
+account, which is where load_recipes imports the dataset by default.
+
+The catalog snapshot holds only these, so they are all the meal planner and
+recommendations ever choose from. Every other recipe is private to the user
+who saved it, as in the recipe detail and export endpoints.
+"""
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import F
+
+from .models import CatalogVersion, Recipe
+
+# Changes counted while inside defer_catalog_version()
+_deferred_changes = ContextVar('deferred_catalog_changes', default=None)
+
+
+def catalog_recipes():
+    """The catalog as a Recipe queryset."""
+    return Recipe.objects.filter(user__username=settings.CATALOG_OWNER)
+
+
+def is_catalog_recipe(recipe_id, owner=None):
+    """
+    Whether recipe `recipe_id` is in the catalog. Pass its owner when it is
+    at hand, e.g. loaded on the instance, to save the query.
+    """
+    if owner is not None:
+        return owner.username == settings.CATALOG_OWNER
+    return catalog_recipes().filter(pk=recipe_id).exists()
+
+
+def _increment_catalog_version():
+    counter = CatalogVersion.objects.filter(pk=1)
+    if not counter.update(version=F('version') + 1):
+        CatalogVersion.objects.get_or_create(pk=1)
+        counter.update(version=F('version') + 1)
+
+
+def bump_catalog_version():
+    """
+    Counts a change to what the catalog snapshot holds (see
+    recipes.snapshot.catalog_version) once the current transaction commits,
+    or right away outside one.
+    """
+    deferred = _deferred_changes.get()
+    if deferred is not None:
+        deferred.append(True)
+        return
+    transaction.on_commit(_increment_catalog_version)
+
+
+@contextmanager
+def defer_catalog_version():
+    """
+    Counts the catalog changes inside the block as one, on exit, for bulk
+    writers: a load_recipes run bumps the counter once, when it commits.
+    """
+    if _deferred_changes.get() is not None:
+        yield
+        return
+    changes = []
+    token = _deferred_changes.set(changes)
+    try:
+        yield
+    finally:
+        _deferred_changes.reset(token)
+    if changes:
+        bump_catalog_version()
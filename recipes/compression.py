@@ -0,0 +1,82 @@
+import gzip
+
+from django.utils.text import compress_sequence, compress_string
+
+try:
+    import brotli
+except ImportError:  # Optional: only gzip is offered without it
+    brotli = None
+
+# File suffix of each content coding, for pre-compressed files on disk
+ENCODING_SUFFIXES = {'br': '.br', 'gzip': '.gz'}
+
+
+def supported_encodings():
+    """Content codings this process can produce, most preferred first."""
+    return ('br', 'gzip') if brotli is not None else ('gzip',)
+
+
+def choose_encoding(accept_encoding, available=None):
+    """
+    Picks the coding from `available` (default: supported_encodings()) with
+    the highest q-value in an Accept-Encoding header, ties going to the
+    earlier entry. Returns None when the client accepts none of them.
+    """
+    available = supported_encodings() if available is None else available
+    qualities = {}
+    for item in accept_encoding.split(','):
+        coding, _, params = item.strip().partition(';')
+        quality = 1.0
+        params = params.strip()
+        if params.startswith('q='):
+            try:
+                quality = float(params[2:])
+            except ValueError:
+                quality = 0.0
+        qualities[coding.strip().lower()] = quality
+
+    best, best_quality = None, 0.0
+    for coding in available:
+        quality = qualities.get(coding, qualities.get('*', 0.0))
+        if quality > best_quality:
+            best, best_quality = coding, quality
+    return best
+
+
+def compress(content, encoding):
+    if encoding == 'br':
+        # Quality 5 is close to gzip's speed with noticeably smaller output
+        return brotli.compress(content, quality=5)
+    # A few random bytes in the header mitigate BREACH, like GZipMiddleware
+    return compress_string(content, max_random_bytes=100)
+
+
+def compress_stream(chunks, encoding):
+    if encoding == 'br':
+        return _brotli_sequence(chunks)
+    return compress_sequence(chunks, max_random_bytes=100)
+
+
+def _brotli_sequence(chunks):
+    compressor = brotli.Compressor(quality=5)
+    for chunk in chunks:
+        data = compressor.process(chunk)
+        if data:
+            yield data
+    yield compressor.finish()
+
+
+def compress_file(path, encoding):
+    """Writes the pre-compressed sibling of `path` (e.g. app.js.br) at maximum level."""
+    with open(path, 'rb') as source:
+        content = source.read()
+    if encoding == 'br':
+        compressed = brotli.compress(content, quality=11)
+    else:
+        compressed = gzip.compress(content, compresslevel=9, mtime=0)
+    if len(compressed) >= len(content):
+        return None
+    target = str(path) + ENCODING_SUFFIXES[encoding]
+    with open(target, 'wb') as output:
+        output.write(compressed)
+    return target
@@ -0,0 +1,108 @@
+"""
+Cross-process coordination on top of the Django cache. With a shared
+backend (Redis, Memcached) these hold across all workers; with the default
+local-memory cache they only cover a single process.
+"""
+import time
+import uuid
+from contextlib import contextmanager
+
+from django.core.cache import cache
+
+
+@contextmanager
+def cache_lock(key, timeout=2, wait=0.05):
+    """
+    Short mutual-exclusion lock for read-modify-write cache updates. If the
+    lock can't be taken within `wait` seconds (e.g. a crashed holder), the
+    block runs anyway: callers use it for throttling, where an occasional
+    race is cheaper than stalling the request.
+    """
+    lock_key = f'lock:{key}'
+    deadline = time.monotonic() + wait
+    acquired = cache.add(lock_key, 1, timeout)
+    while not acquired and time.monotonic() < deadline:
+        time.sleep(0.001)
+        acquired = cache.add(lock_key, 1, timeout)
+    try:
+        yield
+    finally:
+        if acquired:
+            cache.delete(lock_key)
+
+
+class SemaphoreFull(Exception):
+    """No slot became free in time, or the wait queue is full."""
+
+    def __init__(self, retry_after):
+        super().__init__('All slots are busy.')
+        self.retry_after = retry_after
+
+
+class CacheSemaphore:
+    """
+    Counting semaphore with `size` slots stored as cache keys, so at most
+    `size` holders run at once across processes. Slots expire after `lease`
+    seconds in case a holder dies without releasing. Callers that find no
+    free slot wait up to `queue_timeout` seconds; if `max_queue` callers are
+    already waiting, new ones are turned away immediately.
+    """
+
+    def __init__(self, name, size, max_queue, queue_timeout, lease):
+        self.name = name
+        self.size = size
+        self.max_queue = max_queue
+        self.queue_timeout = queue_timeout
+        self.lease = lease
+
+    def _slot_key(self, slot):
+        return f'semaphore:{self.name}:{slot}'
+
+    def _try_acquire(self, token):
+        for slot in range(self.size):
+            if cache.add(self._slot_key(slot), token, self.lease):
+                return slot
+        return None
+
+    def _release(self, slot, token):
+        key = self._slot_key(slot)
+        # Don't free a slot that expired and was taken by someone else
+        if cache.get(key) == token:
+            cache.delete(key)
+
+    @contextmanager
+    def slot(self):
+        token = uuid.uuid4().hex
+        slot = self._try_acquire(token)
+        if slot is None:
+            slot = self._wait_for_slot(token)
+        try:
+            yield
+        finally:
+            self._release(slot, token)
+
+    def _wait_for_slot(self, token):
+        waiters_key = f'semaphore:{self.name}:waiters'
+        cache.add(waiters_key, 0, self.queue_timeout * 2)
+        try:
+            waiting = cache.incr(waiters_key)
+        except ValueError:  # Expired between add and incr
+            cache.add(waiters_key, 1, self.queue_timeout * 2)
+            waiting = 1
+        try:
+            if waiting > self.max_queue:
+                raise SemaphoreFull(retry_after=self.queue_timeout)
+            deadline = time.monotonic() + self.queue_timeout
+            delay = 0.01
+            while time.monotonic() < deadline:
+                time.sleep(delay)
+                slot = self._try_acquire(token)
+                if slot is not None:
+                    return slot
+                delay = min(delay * 2, 0.25)
+            raise SemaphoreFull(retry_after=self.queue_timeout)
+        finally:
+            try:
+                cache.decr(waiters_key)
+            except ValueError:
+                pass
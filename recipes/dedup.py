@@ -0,0 +1,113 @@
+"""
+Near-duplicate recipe detection with MinHash signatures and LSH banding.
+
+A recipe is reduced to a set of shingles (its normalized title words and
+ingredient names). NUM_PERMUTATIONS min-hashes of that set form its
+signature, whose agreement rate with another signature estimates the
+Jaccard similarity of the two sets. The signature is split into BANDS
+bands; recipes sharing any band hash are candidates, which makes lookups a
+single indexed query on RecipeSignatureBand instead of a catalog scan.
+"""
+import hashlib
+import re
+
+import numpy as np
+
+from .models import RecipeSignature, RecipeSignatureBand
+
+NUM_PERMUTATIONS = 64
+BANDS = 16
+ROWS_PER_BAND = NUM_PERMUTATIONS // BANDS
+# Estimated Jaccard similarity from which two recipes count as duplicates
+DUPLICATE_THRESHOLD = 0.8
+
+WORD_RE = re.compile(r'[a-z0-9]+')
+
+
+def _hash64(text):
+    return int.from_bytes(hashlib.blake2b(text.encode(), digest_size=8).digest(), 'little')
+
+
+# Fixed multiply-shift hash family; derived from blake2b so signatures stay
+# comparable across processes and releases. Multipliers must be odd.
+_MULTIPLIERS = np.array([_hash64(f'a{i}') | 1 for i in range(NUM_PERMUTATIONS)], dtype=np.uint64)
+_OFFSETS = np.array([_hash64(f'b{i}') for i in range(NUM_PERMUTATIONS)], dtype=np.uint64)
+
+
+def normalize_words(text):
+    return ' '.join(WORD_RE.findall((text or '').lower()))
+
+
+def recipe_shingles(title, ingredient_names):
+    shingles = {f't:{word}' for word in normalize_words(title).split()}
+    shingles.update(f'i:{normalize_words(name)}' for name in ingredient_names if normalize_words(name))
+    return shingles
+
+
+def minhash(shingles):
+    """The MinHash signature (uint32 array) of a set of strings, or None if empty."""
+    if not shingles:
+        return None
+    hashes = np.fromiter((_hash64(shingle) for shingle in shingles), dtype=np.uint64)
+    with np.errstate(over='ignore'):  # Wrap-around is part of the hash
+        mixed = hashes[None, :] * _MULTIPLIERS[:, None] + _OFFSETS[:, None]
+    return (mixed >> np.uint64(32)).min(axis=1).astype(np.uint32)
+
+
+def recipe_signature(title, ingredient_names):
+    return minhash(recipe_shingles(title, ingredient_names))
+
+
+def band_hashes(signature):
+    """One signed 64-bit hash per band, as stored in RecipeSignatureBand."""
+    hashes = []
+    for band in range(BANDS):
+        rows = signature[band * ROWS_PER_BAND:(band + 1) * ROWS_PER_BAND]
+        digest = hashlib.blake2b(rows.tobytes(), digest_size=8, salt=band.to_bytes(2, 'little')).digest()
+        hashes.append(int.from_bytes(digest, 'little', signed=True))
+    return hashes
+
+
+def similarity(signature, other):
+    return float(np.count_nonzero(signature == other)) / NUM_PERMUTATIONS
+
+
+def best_match(signature, candidates):
+    """(recipe_id, similarity) of the closest candidate at or above the threshold, or None."""
+    best = None
+    for recipe_id, other in candidates:
+        score = similarity(signature, other)
+        if score >= DUPLICATE_THRESHOLD and (best is None or score > best[1]):
+            best = (recipe_id, score)
+    return best
+
+
+def find_duplicate(signature):
+    """
+    Returns the id of the indexed recipe that `signature` near-duplicates,
+    or None. Candidates and their signatures come from one indexed query.
+    """
+    if signature is None:
+        return None
+    candidates = RecipeSignature.objects.filter(
+        recipe__signature_bands__band_hash__in=band_hashes(signature)).values_list(
+            'recipe_id', 'minhash').distinct()
+    match = best_match(signature, (
+        (recipe_id, np.frombuffer(bytes(blob), dtype=np.uint32)) for recipe_id, blob in candidates))
+    return match[0] if match else None
+
+
+def index_signatures(entries):
+    """Adds (recipe_id, signature) pairs to the index, so later inserts match them."""
+    entries = [(recipe_id, signature) for recipe_id, signature in entries if signature is not None]
+    RecipeSignature.objects.bulk_create(
+        [RecipeSignature(recipe_id=recipe_id, minhash=signature.tobytes())
+         for recipe_id, signature in entries], batch_size=1000)
+    RecipeSignatureBand.objects.bulk_create(
+        [RecipeSignatureBand(recipe_id=recipe_id, band_hash=band_hash)
+         for recipe_id, signature in entries for band_hash in band_hashes(signature)],
+        batch_size=1000)
+
+
+def index_recipe(recipe, signature):
+    index_signatures([(recipe.pk, signature)])
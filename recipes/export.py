@@ -0,0 +1,170 @@
+"""
+Streaming recipe export, shared by the dump_recipes command and the
+/api/recipes/export/ endpoint.
+
+Recipes (joined with their nutrition) are read in id order through one
+server-side cursor, iterator(chunk_size=...). Each chunk then gets its
+ingredients and dietary preferences prefetched in a few values() queries,
+like the serializer fast path, and is encoded before the next chunk is read,
+so memory use depends on the chunk size, not on the size of the table.
+"""
+import csv
+import io
+import json
+from importlib.util import find_spec
+from itertools import islice
+
+from .models import Recipe, RecipeIngredient
+from .serializers import NUTRITION_FIELDS, RECIPE_ID_CHUNK_SIZE, chunks
+
+DEFAULT_CHUNK_SIZE = 1000
+
+CONTENT_TYPES = {
+    'csv': 'text/csv; charset=utf-8',
+    'ndjson': 'application/x-ndjson',
+    'parquet': 'application/vnd.apache.parquet',
+}
+
+COLUMNS = [
+    'id', 'user', 'title', 'instructions', 'cooking_time_minutes', 'cuisine',
+    'generated_by_ai', 'duplicate_of', 'dietary_preferences', 'ingredients',
+] + NUTRITION_FIELDS
+
+
+def available_formats():
+    """Export formats this process can produce."""
+    # Optional: Parquet needs pyarrow, which is only imported for an export
+    return ('csv', 'ndjson', 'parquet') if find_spec('pyarrow') is not None else ('csv', 'ndjson')
+
+
+def _batches(records, size):
+    records = iter(records)
+    while batch := list(islice(records, size)):
+        yield batch
+
+
+_EXPORT_VALUES = [
+    'id', 'user__username', 'title', 'instructions', 'cooking_time_minutes', 'cuisine',
+    'generated_by_ai', 'duplicate_of_id',
+] + ['nutrition__' + field for field in NUTRITION_FIELDS]
+
+
+def export_records(queryset=None, chunk_size=DEFAULT_CHUNK_SIZE):
+    """Yields one plain dict per recipe of `queryset` (default: all), keyed by COLUMNS."""
+    queryset = Recipe.objects.all() if queryset is None else queryset
+    rows = queryset.order_by('id').values_list(*_EXPORT_VALUES).iterator(chunk_size=chunk_size)
+    for chunk in _batches(rows, chunk_size):
+        # Prefetch the chunk's ingredients and preferences, as values rather
+        # than model instances
+        ids = [row[0] for row in chunk]
+        ingredients = {pk: [] for pk in ids}
+        preferences = {pk: [] for pk in ids}
+        for id_chunk in chunks(ids, RECIPE_ID_CHUNK_SIZE):
+            for recipe_id, name, quantity in RecipeIngredient.objects.filter(
+                    recipe_id__in=id_chunk).order_by('id').values_list(
+                        'recipe_id', 'ingredient__name', 'quantity'):
+                ingredients[recipe_id].append({'name': name, 'quantity': quantity})
+            for recipe_id, name in Recipe.dietary_preferences.through.objects.filter(
+                    recipe_id__in=id_chunk).order_by('dietarypreference_id').values_list(
+                        'recipe_id', 'dietarypreference__name'):
+                preferences[recipe_id].append(name)
+
+        for row in chunk:
+            record = dict(zip(COLUMNS[:8], row[:8]))
+            record['dietary_preferences'] = preferences[row[0]]
+            record['ingredients'] = ingredients[row[0]]
+            record.update(zip(NUTRITION_FIELDS, row[8:]))
+            yield record
+
+
+def encode_csv(records, batch_size=DEFAULT_CHUNK_SIZE):
+    """CSV with a header row; list columns are stored as JSON."""
+    buffer = io.StringIO()
+    writer = csv.DictWriter(buffer, fieldnames=COLUMNS)
+    writer.writeheader()
+    for batch in _batches(records, batch_size):
+        for record in batch:
+            writer.writerow(dict(
+                record,
+                dietary_preferences=json.dumps(record['dietary_preferences']),
+                ingredients=json.dumps(record['ingredients'])))
+        yield buffer.getvalue().encode()
+        buffer.seek(0)
+        buffer.truncate()
+    if buffer.tell():  # Header only, for an empty export
+        yield buffer.getvalue().encode()
+
+
+def encode_ndjson(records, batch_size=DEFAULT_CHUNK_SIZE):
+    """One JSON object per line."""
+    for batch in _batches(records, batch_size):
+        yield ''.join(json.dumps(record) + '\n' for record in batch).encode()
+
+
+class _ChunkSink(io.RawIOBase):
+    """Write-only file that keeps what was written until drain() hands it on."""
+
+    def __init__(self):
+        self.chunks = []
+        self.position = 0
+
+    def writable(self):
+        return True
+
+    def write(self, data):
+        self.chunks.append(bytes(data))
+        self.position += len(data)
+        return len(data)
+
+    def tell(self):
+        return self.position
+
+    def drain(self):
+        data = b''.join(self.chunks)
+        self.chunks = []
+        return data
+
+
+def _parquet_schema(pyarrow):
+    columns = [
+        ('id', pyarrow.int64()),
+        ('user', pyarrow.string()),
+        ('title', pyarrow.string()),
+        ('instructions', pyarrow.string()),
+        ('cooking_time_minutes', pyarrow.int64()),
+        ('cuisine', pyarrow.string()),
+        ('generated_by_ai', pyarrow.bool_()),
+        ('duplicate_of', pyarrow.int64()),
+        ('dietary_preferences', pyarrow.list_(pyarrow.string())),
+        ('ingredients', pyarrow.list_(pyarrow.struct(
+            [('name', pyarrow.string()), ('quantity', pyarrow.string())]))),
+    ]
+    for field in NUTRITION_FIELDS:
+        columns.append((field, pyarrow.int64() if field == 'calories' else pyarrow.float64()))
+    return pyarrow.schema(columns)
+
+
+def encode_parquet(records, batch_size=DEFAULT_CHUNK_SIZE):
+    """Parquet with one row group per batch; the footer comes last."""
+    import pyarrow
+    import pyarrow.parquet
+
+    schema = _parquet_schema(pyarrow)
+    sink = _ChunkSink()
+    writer = pyarrow.parquet.ParquetWriter(sink, schema, compression='zstd')
+    try:
+        for batch in _batches(records, batch_size):
+            writer.write_table(pyarrow.Table.from_pylist(batch, schema=schema))
+            yield sink.drain()
+    finally:
+        writer.close()
+    yield sink.drain()
+
+
+ENCODERS = {'csv': encode_csv, 'ndjson': encode_ndjson, 'parquet': encode_parquet}
+
+
+def export_recipes(fmt, queryset=None, chunk_size=DEFAULT_CHUNK_SIZE):
+    """Yields the export of `queryset` (default: every recipe) as bytes chunks."""
+    records = export_records(queryset, chunk_size=chunk_size)
+    return ENCODERS[fmt](records, batch_size=chunk_size)
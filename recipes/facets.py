@@ -0,0 +1,160 @@
+from collections import Counter
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+from django.apps import apps as global_apps
+from django.db import transaction
+from django.db.models import F, Q
+
+# (upper bound in minutes, label); recipes at or above the last bound are "Over 2 hours"
+COOKING_TIME_BUCKETS = [
+    (15, 'Under 15 min'),
+    (30, '15-30 min'),
+    (60, '30-60 min'),
+    (120, '1-2 hours'),
+]
+CALORIE_RANGES = [
+    (200, 'Under 200 kcal'),
+    (400, '200-400 kcal'),
+    (600, '400-600 kcal'),
+    (800, '600-800 kcal'),
+]
+
+
+# Recipe ids waiting for a refresh while inside defer_facet_updates()
+_deferred_recipe_ids = ContextVar('deferred_recipe_ids', default=None)
+
+
+def _bucket(value, buckets, overflow_label):
+    if value is None:
+        return None
+    for upper, label in buckets:
+        if value < upper:
+            return label
+    return overflow_label
+
+
+def cooking_time_bucket(minutes):
+    return _bucket(minutes, COOKING_TIME_BUCKETS, 'Over 2 hours')
+
+
+def calorie_range(calories):
+    return _bucket(calories, CALORIE_RANGES, '800+ kcal')
+
+
+def _facet_values(cuisine, cooking_time_minutes, calories, dietary_preferences):
+    values = {
+        ('cuisine', cuisine),
+        ('cooking_time', cooking_time_bucket(cooking_time_minutes)),
+        ('calories', calorie_range(calories)),
+    }
+    values.update(('dietary_preference', name) for name in dietary_preferences)
+    return {(facet, value) for facet, value in values if value}
+
+
+def _adjust_counts(pairs, delta):
+    FacetCount = global_apps.get_model('recipes', 'FacetCount')
+    for facet, value in pairs:
+        counts = FacetCount.objects.filter(facet=facet, value=value)
+        if not counts.update(count=F('count') + delta) and delta > 0:
+            FacetCount.objects.get_or_create(facet=facet, value=value)
+            counts.update(count=F('count') + delta)
+
+
+def refresh_recipe_facets(recipe_id):
+    """
+    Recomputes the facet values of one recipe and applies the difference to
+    FacetCount, so counts stay current without aggregating the catalog.
+    """
+    deferred = _deferred_recipe_ids.get()
+    if deferred is not None:
+        deferred.add(recipe_id)
+        return
+
+    Recipe = global_apps.get_model('recipes', 'Recipe')
+    RecipeFacet = global_apps.get_model('recipes', 'RecipeFacet')
+    recipe = Recipe.objects.filter(pk=recipe_id).values(
+        'cuisine', 'cooking_time_minutes', 'nutrition__calories').first()
+    if recipe is None:
+        return
+
+    with transaction.atomic():
+        wanted = _facet_values(
+            recipe['cuisine'], recipe['cooking_time_minutes'], recipe['nutrition__calories'],
+            Recipe.dietary_preferences.through.objects.filter(
+                recipe_id=recipe_id).values_list('dietarypreference__name', flat=True))
+        current = set(RecipeFacet.objects.filter(
+            recipe_id=recipe_id).values_list('facet', 'value'))
+
+        removed, added = current - wanted, wanted - current
+        if removed:
+            match = Q()
+            for facet, value in removed:
+                match |= Q(facet=facet, value=value)
+            RecipeFacet.objects.filter(match, recipe_id=recipe_id).delete()
+            _adjust_counts(removed, -1)
+        if added:
+            RecipeFacet.objects.bulk_create(
+                RecipeFacet(recipe_id=recipe_id, facet=facet, value=value) for facet, value in added)
+            _adjust_counts(added, 1)
+
+
+@contextmanager
+def defer_facet_updates():
+    """
+    Collects facet refreshes inside the block and runs them once per recipe
+    on exit, for bulk writers that save a recipe and its related rows in
+    several steps.
+    """
+    if _deferred_recipe_ids.get() is not None:
+        yield
+        return
+    recipe_ids = set()
+    token = _deferred_recipe_ids.set(recipe_ids)
+    try:
+        yield
+    finally:
+        _deferred_recipe_ids.reset(token)
+    for recipe_id in recipe_ids:
+        refresh_recipe_facets(recipe_id)
+
+
+def remove_recipe_facets(recipe_id):
+    """Takes a recipe that is about to be deleted out of the counts."""
+    RecipeFacet = global_apps.get_model('recipes', 'RecipeFacet')
+    facets = RecipeFacet.objects.filter(recipe_id=recipe_id)
+    _adjust_counts(set(facets.values_list('facet', 'value')), -1)
+    facets.delete()
+
+
+def rebuild_facets():
+    """Recomputes every recipe's facets and all counts from scratch."""
+    Recipe = global_apps.get_model('recipes', 'Recipe')
+    RecipeFacet = global_apps.get_model('recipes', 'RecipeFacet')
+    FacetCount = global_apps.get_model('recipes', 'FacetCount')
+
+    preferences = {}
+    for recipe_id, name in Recipe.dietary_preferences.through.objects.values_list(
+            'recipe_id', 'dietarypreference__name'):
+        preferences.setdefault(recipe_id, []).append(name)
+
+    with transaction.atomic():
+        RecipeFacet.objects.all().delete()
+        FacetCount.objects.all().delete()
+        counts = Counter()
+        batch = []
+        for recipe in Recipe.objects.values(
+                'id', 'cuisine', 'cooking_time_minutes', 'nutrition__calories').iterator(chunk_size=2000):
+            for facet, value in _facet_values(
+                    recipe['cuisine'], recipe['cooking_time_minutes'], recipe['nutrition__calories'],
+                    preferences.get(recipe['id'], ())):
+                batch.append(RecipeFacet(recipe_id=recipe['id'], facet=facet, value=value))
+                counts[facet, value] += 1
+            if len(batch) >= 2000:
+                RecipeFacet.objects.bulk_create(batch)
+                batch = []
+        RecipeFacet.objects.bulk_create(batch)
+        FacetCount.objects.bulk_create(
+            FacetCount(facet=facet, value=value, count=count)
+            for (facet, value), count in counts.items())
+    return len(counts)
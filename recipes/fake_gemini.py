@@ -0,0 +1,239 @@
+"""
+Local stand-in for the Gemini generateContent API, for load tests.
+
+Answers POST .../models/<model>:generateContent?key=... with the reply shape
+recipes.gemini reads (candidates[0].content.parts[0].text holding the
+recipes as a JSON array), after a latency drawn from a configurable
+distribution. A configurable share of requests fails instead: HTTP 503,
+HTTP 429, or a 200 whose text is not JSON, i.e. the failures the app has to
+handle from the real API.
+
+Recipes are drawn from canned payloads. By default each one gets a numbered
+title and a random mix of the canned ingredients, so that generated recipes
+are not near-duplicates of each other and take the app's full write path;
+a duplicate_rate share of them is returned verbatim to exercise deduplication.
+
+Point the app at it with GEMINI_API_URL, see the fake_gemini command.
+"""
+import itertools
+import json
+import random
+import re
+import threading
+import time
+from dataclasses import dataclass, field
+from http import HTTPStatus
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlsplit
+
+MODEL_PATH = '/v1beta/models/fake-gemini:generateContent'
+
+DEFAULT_PAYLOADS = [
+    {'title': 'Lemon Herb Chicken', 'instructions': '1. Marinate the chicken. 2. Roast for 35 minutes.',
+     'cooking_time_minutes': 45, 'cuisine': 'Mediterranean',
+     'ingredients': [{'name': 'chicken thighs', 'quantity': '4'}, {'name': 'lemon', 'quantity': '1'},
+                     {'name': 'garlic', 'quantity': '3 cloves'}, {'name': 'fresh thyme', 'quantity': '4 sprigs'},
+                     {'name': 'olive oil', 'quantity': '2 tablespoons'}]},
+    {'title': 'Vegetable Stir Fry', 'instructions': '1. Slice the vegetables. 2. Stir fry on high heat.',
+     'cooking_time_minutes': 20, 'cuisine': 'Chinese',
+     'ingredients': [{'name': 'broccoli', 'quantity': '1 head'}, {'name': 'red bell pepper', 'quantity': '1'},
+                     {'name': 'soy sauce', 'quantity': '3 tablespoons'}, {'name': 'ginger', 'quantity': '1 inch'},
+                     {'name': 'rice', 'quantity': '1 cup'}]},
+    {'title': 'Black Bean Tacos', 'instructions': '1. Warm the beans with spices. 2. Fill the tortillas.',
+     'cooking_time_minutes': 15, 'cuisine': 'Mexican',
+     'ingredients': [{'name': 'black beans', 'quantity': '1 can'}, {'name': 'corn tortillas', 'quantity': '8'},
+                     {'name': 'avocado', 'quantity': '1'}, {'name': 'lime', 'quantity': '1'},
+                     {'name': 'cumin', 'quantity': '1 teaspoon'}]},
+    {'title': 'Mushroom Risotto', 'instructions': '1. Toast the rice. 2. Add stock a ladle at a time.',
+     'cooking_time_minutes': 40, 'cuisine': 'Italian',
+     'ingredients': [{'name': 'arborio rice', 'quantity': '1 1/2 cups'}, {'name': 'mushrooms', 'quantity': '300 g'},
+                     {'name': 'vegetable stock', 'quantity': '1 l'}, {'name': 'parmesan', 'quantity': '50 g'},
+                     {'name': 'butter', 'quantity': '2 tablespoons'}]},
+]
+
+# "Generate 3 unique recipe(s)" in GenerateRecipeAPIView's prompt
+_COUNT_RE = re.compile(r'Generate (\d+) unique recipe')
+
+
+def parse_latency(spec):
+    """
+    A function of a random.Random returning seconds, from "fixed:S",
+    "uniform:LOW,HIGH", "exponential:MEAN" or "lognormal:MEDIAN,SIGMA".
+    """
+    kind, _, args = spec.partition(':')
+    try:
+        values = [float(value) for value in args.split(',')] if args else []
+    except ValueError:
+        raise ValueError(f'Invalid latency "{spec}": arguments must be numbers.')
+    shapes = {
+        'fixed': (1, lambda rng, s: s),
+        'uniform': (2, lambda rng, low, high: rng.uniform(low, high)),
+        'exponential': (1, lambda rng, mean: rng.expovariate(1 / mean) if mean > 0 else 0.0),
+        'lognormal': (2, lambda rng, median, sigma: median * rng.lognormvariate(0, sigma)),
+    }
+    if kind not in shapes:
+        raise ValueError(f'Invalid latency "{spec}": use one of {", ".join(shapes)}.')
+    arity, draw = shapes[kind]
+    if len(values) != arity or any(value < 0 for value in values):
+        raise ValueError(f'Invalid latency "{spec}": {kind} takes {arity} non-negative number(s).')
+    return lambda rng: max(draw(rng, *values), 0.0)
+
+
+@dataclass
+class FakeGeminiConfig:
+    latency: str = 'lognormal:1.5,0.4'
+    # Shares of requests answered with HTTP 503, HTTP 429 and non-JSON text
+    error_rate: float = 0.0
+    throttle_rate: float = 0.0
+    malformed_rate: float = 0.0
+    # Share of recipes returned exactly as canned
+    duplicate_rate: float = 0.0
+    payloads: list = field(default_factory=lambda: DEFAULT_PAYLOADS)
+    seed: int = None
+
+
+class FakeGemini:
+    """Reply generation and request counters, shared by the handler threads."""
+
+    def __init__(self, config):
+        self.config = config
+        self.draw_latency = parse_latency(config.latency)
+        # One quantity per name: a recipe can list an ingredient only once
+        self.ingredient_pool = sorted(
+            {item['name']: item['quantity'] for recipe in config.payloads for item in recipe['ingredients']}.items())
+        self._random = random.Random(config.seed)
+        self._serial = itertools.count(1)
+        self._lock = threading.Lock()
+        self.counts = {'requests': 0, 'ok': 0, 'error': 0, 'throttled': 0, 'malformed': 0, 'bad_request': 0}
+
+    def count(self, outcome):
+        with self._lock:
+            self.counts['requests'] += 1
+            self.counts[outcome] += 1
+
+    def stats(self):
+        with self._lock:
+            return dict(self.counts)
+
+    def plan(self):
+        """(latency in seconds, outcome) for the next request."""
+        with self._lock:
+            rng = self._random
+            latency = self.draw_latency(rng)
+            roll = rng.random()
+        config = self.config
+        for outcome, rate in (('error', config.error_rate), ('throttled', config.throttle_rate),
+                              ('malformed', config.malformed_rate)):
+            if roll < rate:
+                return latency, outcome
+            roll -= rate
+        return latency, 'ok'
+
+    def recipes(self, num_recipes):
+        recipes = []
+        with self._lock:
+            for _ in range(num_recipes):
+                base = self._random.choice(self.config.payloads)
+                if self._random.random() < self.config.duplicate_rate:
+                    recipes.append(base)
+                    continue
+                size = min(len(base['ingredients']) + 1, len(self.ingredient_pool))
+                recipes.append({
+                    **base,
+                    'title': f"{base['title']} {next(self._serial)}",
+                    'ingredients': [{'name': name, 'quantity': quantity}
+                                    for name, quantity in self._random.sample(self.ingredient_pool, size)],
+                })
+        return recipes
+
+    @staticmethod
+    def reply(text):
+        return {
+            'candidates': [{
+                'content': {'parts': [{'text': text}], 'role': 'model'},
+                'finishReason': 'STOP',
+                'index': 0,
+            }],
+            'usageMetadata': {'promptTokenCount': 0, 'candidatesTokenCount': 0, 'totalTokenCount': 0},
+            'modelVersion': 'fake-gemini',
+        }
+
+    @staticmethod
+    def error(code, status, message):
+        return {'error': {'code': code, 'message': message, 'status': status}}
+
+
+class FakeGeminiHandler(BaseHTTPRequestHandler):
+    # Keep-alive, like the app's pooled requests.Session expects
+    protocol_version = 'HTTP/1.1'
+
+    @property
+    def fake(self):
+        return self.server.fake
+
+    def send_json(self, status, body):
+        data = json.dumps(body).encode()
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json; charset=UTF-8')
+        self.send_header('Content-Length', str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def do_GET(self):
+        # Counters, for checking a load test's view of the errors it got
+        if urlsplit(self.path).path == '/stats':
+            self.send_json(HTTPStatus.OK, self.fake.stats())
+        else:
+            self.send_json(HTTPStatus.NOT_FOUND, FakeGemini.error(404, 'NOT_FOUND', 'Not found.'))
+
+    def do_POST(self):
+        url = urlsplit(self.path)
+        body = self.rfile.read(int(self.headers.get('Content-Length') or 0))
+        if not url.path.endswith(':generateContent'):
+            self.fake.count('bad_request')
+            return self.send_json(HTTPStatus.NOT_FOUND, FakeGemini.error(404, 'NOT_FOUND', 'Not found.'))
+        if not parse_qs(url.query).get('key'):
+            self.fake.count('bad_request')
+            return self.send_json(HTTPStatus.FORBIDDEN, FakeGemini.error(
+                403, 'PERMISSION_DENIED', 'Method doesn\'t allow unregistered callers.'))
+        try:
+            prompt = json.loads(body)['contents'][0]['parts'][0]['text']
+        except (ValueError, KeyError, IndexError, TypeError):
+            self.fake.count('bad_request')
+            return self.send_json(HTTPStatus.BAD_REQUEST, FakeGemini.error(
+                400, 'INVALID_ARGUMENT', 'Request contains an invalid argument.'))
+
+        latency, outcome = self.fake.plan()
+        time.sleep(latency)
+        self.fake.count(outcome)
+        if outcome == 'error':
+            self.send_json(HTTPStatus.SERVICE_UNAVAILABLE, FakeGemini.error(
+                503, 'UNAVAILABLE', 'The model is overloaded. Please try again later.'))
+        elif outcome == 'throttled':
+            self.send_json(HTTPStatus.TOO_MANY_REQUESTS, FakeGemini.error(
+                429, 'RESOURCE_EXHAUSTED', 'Resource has been exhausted (e.g. check quota).'))
+        elif outcome == 'malformed':
+            self.send_json(HTTPStatus.OK, FakeGemini.reply('Here are your recipes: [{"title": '))
+        else:
+            match = _COUNT_RE.search(prompt)
+            recipes = self.fake.recipes(int(match.group(1)) if match else 1)
+            self.send_json(HTTPStatus.OK, FakeGemini.reply(json.dumps(recipes)))
+
+    def log_message(self, format, *args):
+        # One line per request would swamp a load test's output
+        pass
+
+
+class FakeGeminiServer(ThreadingHTTPServer):
+    daemon_threads = True
+    # Load tests open many connections at once
+    request_queue_size = 128
+
+    def __init__(self, address, config):
+        super().__init__(address, FakeGeminiHandler)
+        self.fake = FakeGemini(config)
+
+    @property
+    def url(self):
+        host, port = self.server_address[:2]
+        return f'http://{host}:{port}{MODEL_PATH}'
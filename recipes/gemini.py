@@ -0,0 +1,66 @@
+"""
+Client for the Gemini generateContent API.
+
+Nothing is set up at import: `requests` is imported and the HTTP session
+(with its keep-alive connection pool) is built on the first call, so worker
+boot and management commands that never generate recipes don't pay for it.
+"""
+import json
+import threading
+
+from django.conf import settings
+
+
+class GeminiRequestError(Exception):
+    """Gemini could not be reached or answered with an HTTP error."""
+
+
+class GeminiResponseError(Exception):
+    """Gemini answered, but not with the JSON we asked for."""
+
+
+_session_lock = threading.Lock()
+_session = None
+
+
+def get_session():
+    global _session
+    with _session_lock:
+        if _session is None:
+            import requests
+            from requests.adapters import HTTPAdapter
+
+            session = requests.Session()
+            # One pooled connection per concurrent generation slot
+            session.mount('https://', HTTPAdapter(pool_maxsize=settings.GENERATION_MAX_CONCURRENT))
+            session.mount('http://', HTTPAdapter(pool_maxsize=settings.GENERATION_MAX_CONCURRENT))
+            session.headers['Content-Type'] = 'application/json'
+            _session = session
+        return _session
+
+
+def generate_content(payload, api_key):
+    """POSTs `payload` to generateContent and returns the decoded JSON reply."""
+    import requests
+
+    try:
+        response = get_session().post(
+            f'{settings.GEMINI_API_URL}?key={api_key}', data=json.dumps(payload),
+            timeout=settings.GEMINI_TIMEOUT)
+        response.raise_for_status()  # Raise an exception for HTTP errors (4xx or 5xx)
+        return response.json()
+    except requests.exceptions.JSONDecodeError as e:
+        raise GeminiResponseError(str(e)) from e
+    except requests.exceptions.RequestException as e:
+        raise GeminiRequestError(str(e)) from e
+
+
+def generated_json(result):
+    """Parses the JSON text of the first candidate in a generateContent reply, or []."""
+    if result.get('candidates') and result['candidates'][0].get('content') and result['candidates'][0]['content'].get('parts'):
+        # The LLM response is a string that needs to be parsed as JSON
+        try:
+            return json.loads(result['candidates'][0]['content']['parts'][0]['text'])
+        except ValueError as e:
+            raise GeminiResponseError(str(e)) from e
+    return []
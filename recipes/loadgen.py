@@ -0,0 +1,272 @@
+"""
+Open-loop load generator for the API, used by the load_test command.
+
+Requests start on a schedule at the target rate (evenly spaced or as Poisson
+arrivals) whether or not earlier ones have finished, and every latency is
+measured from the scheduled start. A closed loop, which sends the next request
+only when the last one returns, slows down along with the server and hides
+the queueing ("coordinated omission"); here a saturated server shows up as
+growing latencies and achieved throughput falling behind the target.
+
+Traffic is a weighted mix of scenarios, each a request for a random load test
+user: recipe list and detail, generation, meal plan optimization, shopping
+list and recommendations. Users are created with API tokens and a few copies
+of catalog recipes, so that the per-user endpoints have data to return, and
+their recommendation feeds are built before the run.
+"""
+import math
+import random
+import threading
+import time
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass, field
+from datetime import date, timedelta
+
+import numpy as np
+from django.contrib.auth.models import User
+from django.db import transaction
+from rest_framework.authtoken.models import Token
+
+from .catalog import catalog_recipes
+from .facets import defer_facet_updates
+from .models import Recipe, RecipeIngredient
+from .recommendations import build_feeds, get_catalog_features
+from .snapshot import get_catalog_snapshot
+
+DEFAULT_MIX = 'list=40,detail=30,shopping-list=15,meal-plan=10,generate=5'
+PERCENTILES = (50, 95, 99)
+# Ingredients for generation prompts
+GENERATE_INGREDIENTS = ['chicken', 'rice', 'tomatoes', 'spinach', 'chickpeas', 'salmon', 'mushrooms',
+                        'lentils', 'potatoes', 'tofu', 'garlic', 'lemon', 'pasta', 'beef', 'broccoli']
+
+
+@dataclass
+class LoadUser:
+    username: str
+    token: str
+    recipe_ids: list = field(default_factory=list)
+
+
+def _list(user, rng):
+    return 'GET', 'recipes/', None
+
+
+def _detail(user, rng):
+    # 404s, counted as errors, if the catalog was empty when users were set up
+    return 'GET', f'recipes/{rng.choice(user.recipe_ids or [0])}/', None
+
+
+def _generate(user, rng):
+    return 'POST', 'generate-recipe/', {
+        'ingredients': ', '.join(rng.sample(GENERATE_INGREDIENTS, 3)), 'num_recipes': 1}
+
+
+def _meal_plan(user, rng):
+    start = date.today() + timedelta(days=rng.randrange(30))
+    return 'POST', 'meal-plans/optimize/', {
+        'name': 'Load test plan', 'start_date': start.isoformat(),
+        'end_date': (start + timedelta(days=6)).isoformat(), 'meals_per_day': 2}
+
+
+def _shopping_list(user, rng):
+    return 'GET', 'shopping-list-items/', None
+
+
+def _recommendations(user, rng):
+    return 'GET', 'recommendations/', None
+
+
+SCENARIOS = {
+    'list': _list,
+    'detail': _detail,
+    'generate': _generate,
+    'meal-plan': _meal_plan,
+    'shopping-list': _shopping_list,
+    'recommendations': _recommendations,
+}
+
+
+def parse_mix(spec):
+    """{"list": 40.0, ...} from "list=40,detail=30,..."."""
+    mix = {}
+    for part in spec.split(','):
+        name, _, weight = part.strip().partition('=')
+        if name not in SCENARIOS:
+            raise ValueError(f'Unknown scenario "{name}"; choose from {", ".join(SCENARIOS)}.')
+        try:
+            mix[name] = float(weight)
+        except ValueError:
+            raise ValueError(f'Invalid weight for "{name}": {weight!r}.')
+        if mix[name] < 0:
+            raise ValueError(f'Invalid weight for "{name}": must not be negative.')
+    if not sum(mix.values()) > 0:
+        raise ValueError('The mix needs at least one positive weight.')
+    return mix
+
+
+def _copy_recipes(recipe_ids, user):
+    """
+    Copies catalog recipes, with their ingredients and preferences, to `user`.
+
+    Written with the ORM rather than through the API, which would take a
+    request per recipe and ingredient and count against the throttles. The
+    copies are linked to their originals (duplicate_of) and left out of the
+    dedup index, as generation does with a near-duplicate of another user's
+    recipe; prepare_users builds the feeds the API would have refreshed.
+    """
+    copies = []
+    with transaction.atomic(), defer_facet_updates():
+        for recipe in Recipe.objects.filter(pk__in=recipe_ids).prefetch_related('dietary_preferences'):
+            copy = Recipe.objects.create(
+                user=user, title=recipe.title, instructions=recipe.instructions,
+                cooking_time_minutes=recipe.cooking_time_minutes, cuisine=recipe.cuisine,
+                duplicate_of=recipe)
+            RecipeIngredient.objects.bulk_create(
+                RecipeIngredient(recipe=copy, ingredient_id=ingredient_id, quantity=quantity)
+                for ingredient_id, quantity in recipe.recipeingredient_set.values_list('ingredient_id', 'quantity'))
+            copy.dietary_preferences.set(recipe.dietary_preferences.all())
+            copies.append(copy.pk)
+    return copies
+
+
+def prepare_users(count, recipes_per_user=5, prefix='loadtest', seed=None):
+    """
+    Creates (or reuses) `count` users named <prefix>0, <prefix>1, ... with API
+    tokens, topping each up to `recipes_per_user` recipes copied from the
+    catalog, and builds their recommendation feeds.
+    """
+    rng = random.Random(seed)
+    catalog_ids = list(catalog_recipes().order_by('-id').values_list('id', flat=True)[:10000])
+    users, user_ids = [], []
+    for i in range(count):
+        user, _ = User.objects.get_or_create(username=f'{prefix}{i}')
+        token, _ = Token.objects.get_or_create(user=user)
+        recipe_ids = list(user.recipes.values_list('id', flat=True))
+        missing = min(recipes_per_user - len(recipe_ids), len(catalog_ids))
+        if missing > 0:
+            recipe_ids += _copy_recipes(rng.sample(catalog_ids, missing), user)
+        users.append(LoadUser(user.username, token.key, recipe_ids))
+        user_ids.append(user.pk)
+    # Otherwise each user's first recommendations request scores the catalog
+    build_feeds(get_catalog_features(get_catalog_snapshot(wait=True)), user_ids)
+    return users
+
+
+def _arrivals(rate, duration, poisson, rng):
+    """Scheduled start offsets, in seconds, of every request in the run."""
+    if not poisson:
+        # i / rate rather than a running sum, which drifts
+        return [i / rate for i in range(math.ceil(duration * rate))]
+    offsets, offset = [], 0.0
+    while offset < duration:
+        offsets.append(offset)
+        offset += rng.expovariate(rate)
+    return offsets
+
+
+@dataclass
+class RequestRecord:
+    scenario: str
+    offset: float  # Scheduled start, from the start of the run
+    latency: float  # From the scheduled start to the end of the response
+    lag: float  # From the scheduled start to when the request was sent
+    status: str  # HTTP status code, or the exception name
+
+
+def run_load(base_url, users, mix, rate, duration, warmup=0.0, concurrency=64,
+             poisson=False, timeout=70.0, seed=None):
+    """Drives the mix at `rate` requests per second; returns the RequestRecords."""
+    import requests
+    from requests.adapters import HTTPAdapter
+
+    rng = random.Random(seed)
+    base_url = base_url.rstrip('/') + '/'
+    names, weights = list(mix), list(mix.values())
+    local = threading.local()
+    records = []
+    records_lock = threading.Lock()
+
+    def session():
+        if not hasattr(local, 'session'):
+            local.session = requests.Session()
+            local.session.mount(base_url, HTTPAdapter(pool_maxsize=1))
+        return local.session
+
+    def send(scenario, scheduled, method, path, body, token):
+        sent = time.perf_counter()
+        try:
+            response = session().request(
+                method, base_url + path, json=body, timeout=timeout,
+                headers={'Authorization': f'Token {token}'})
+            response.content  # Read the whole body
+            status = str(response.status_code)
+        except requests.exceptions.RequestException as e:
+            status = type(e).__name__
+        done = time.perf_counter()
+        with records_lock:
+            records.append(RequestRecord(
+                scenario, scheduled - started, done - scheduled, sent - scheduled, status))
+
+    started = time.perf_counter() + 0.05
+    with ThreadPoolExecutor(max_workers=concurrency) as executor:
+        for offset in _arrivals(rate, warmup + duration, poisson, rng):
+            scenario = rng.choices(names, weights)[0]
+            user = rng.choice(users)
+            method, path, body = SCENARIOS[scenario](user, rng)
+            scheduled = started + offset
+            delay = scheduled - time.perf_counter()
+            if delay > 0:
+                time.sleep(delay)
+            executor.submit(send, scenario, scheduled, method, path, body, user.token)
+    return records
+
+
+def summarize(records, warmup, duration):
+    """
+    Per-scenario (and "all") request counts, throughput, status counts and
+    latency percentiles in milliseconds, leaving out the warmup. Throughput
+    counts responses over the run, or until the last response if later.
+    """
+    measured = [record for record in records if record.offset >= warmup]
+    # Until the last response: a server that falls behind takes longer than the schedule
+    span = max([duration] + [record.offset + record.latency - warmup for record in measured])
+    groups = {'all': measured}
+    for record in measured:
+        groups.setdefault(record.scenario, []).append(record)
+
+    summary = {}
+    for name, group in groups.items():
+        latencies = np.array([record.latency for record in group]) * 1000
+        statuses = Counter(record.status for record in group)
+        summary[name] = {
+            'requests': len(group),
+            'throughput': len(group) / span,
+            'errors': sum(count for status, count in statuses.items() if not status.startswith('2')),
+            'statuses': dict(sorted(statuses.items())),
+            'latency_ms': {
+                **{f'p{p}': float(np.percentile(latencies, p)) if len(group) else None for p in PERCENTILES},
+                'max': float(latencies.max()) if len(group) else None,
+            },
+            'max_lag_ms': max((record.lag for record in group), default=0.0) * 1000,
+        }
+    return summary
+
+
+def format_report(summary):
+    """The summary as a fixed-width table, "all" last."""
+    def ms(value):
+        return '-' if value is None else f'{value:.0f}'
+
+    header = f'{"scenario":<16}{"reqs":>7}{"req/s":>8}{"errors":>8}' + ''.join(
+        f'{f"p{p} ms":>9}' for p in PERCENTILES) + f'{"max ms":>9}  statuses'
+    lines = [header, '-' * len(header)]
+    for name in sorted(summary, key=lambda name: (name == 'all', name)):
+        row = summary[name]
+        latency = row['latency_ms']
+        lines.append(
+            f'{name:<16}{row["requests"]:>7}{row["throughput"]:>8.1f}{row["errors"]:>8}'
+            + ''.join(f'{ms(latency[f"p{p}"]):>9}' for p in PERCENTILES)
+            + f'{ms(latency["max"]):>9}  '
+            + ' '.join(f'{status}:{count}' for status, count in row['statuses'].items()))
+    return '\n'.join(lines)
@@ -0,0 +1,28 @@
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from recipes.snapshot import build_snapshot, catalog_version, load_snapshot
+
+
+class Command(BaseCommand):
+    help = ('Compiles the recipe catalog into the memory-mapped snapshot that workers '
+            'load at startup (CATALOG_SNAPSHOT_PATH).')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--path', type=str, default=settings.CATALOG_SNAPSHOT_PATH,
+                            help='Where to write the snapshot (default: CATALOG_SNAPSHOT_PATH).')
+        parser.add_argument('--force', action='store_true',
+                            help='Rebuild even if the existing snapshot is up to date.')
+
+    def handle(self, *args, **options):
+        path = options['path']
+        existing = load_snapshot(path)
+        if not options['force'] and existing is not None and existing.version == catalog_version():
+            self.stdout.write(self.style.SUCCESS(f'Snapshot {path} is up to date.'))
+            return
+
+        snapshot = build_snapshot(path)
+        size = sum(array.nbytes for array in snapshot.arrays.values())
+        self.stdout.write(self.style.SUCCESS(
+            f'Wrote {path}: {len(snapshot)} recipes, {len(snapshot.ingredient_ids)} ingredients, '
+            f'{len(snapshot.indices)} links ({size / 1024 / 1024:.1f} MB).'))
@@ -0,0 +1,35 @@
+import time
+
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand, CommandError
+
+from recipes.recommendations import USER_BATCH_SIZE, build_feeds, get_catalog_features, users_with_recipes
+from recipes.snapshot import get_catalog_snapshot
+
+
+class Command(BaseCommand):
+    help = ('Scores the catalog for every user with saved or planned recipes and stores '
+            'their recommendation feeds.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--user', type=str,
+                            help='Only rebuild the feed of this username.')
+        parser.add_argument('--batch-size', type=int, default=USER_BATCH_SIZE,
+                            help=f'Users scored per pass over the catalog (default: {USER_BATCH_SIZE}).')
+
+    def handle(self, *args, **options):
+        if options['user']:
+            try:
+                user_ids = [User.objects.get(username=options['user']).pk]
+            except User.DoesNotExist:
+                raise CommandError(f'User "{options["user"]}" does not exist.')
+        else:
+            user_ids = users_with_recipes()
+
+        started = time.monotonic()
+        # Batch runs score against an up-to-date catalog
+        features = get_catalog_features(get_catalog_snapshot(wait=True))
+        saved = build_feeds(features, user_ids, batch_size=options['batch_size'])
+        self.stdout.write(self.style.SUCCESS(
+            f'Built {saved} recommendation feeds over {len(features.snapshot)} recipes '
+            f'in {time.monotonic() - started:.1f}s.'))
@@ -0,0 +1,42 @@
+import os
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+from recipes.compression import ENCODING_SUFFIXES, compress_file, supported_encodings
+
+# Already compressed formats gain nothing
+SKIP_EXTENSIONS = {'.br', '.gz', '.png', '.jpg', '.jpeg', '.gif', '.webp', '.woff', '.woff2', '.zip'}
+
+
+class Command(BaseCommand):
+    help = 'Writes .br and .gz copies of the built frontend files for pre-compressed serving.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--dir', type=str, default=str(settings.FRONTEND_DIST_DIR),
+                            help='Directory to compress (default: FRONTEND_DIST_DIR).')
+        parser.add_argument('--min-size', type=int, default=settings.COMPRESSION_MIN_SIZE,
+                            help='Skip files smaller than this many bytes.')
+
+    def handle(self, *args, **options):
+        root = options['dir']
+        if not os.path.isdir(root):
+            raise CommandError(f'Directory "{root}" does not exist. Run `npm run build` first.')
+
+        written = 0
+        for dirpath, _, filenames in os.walk(root):
+            for filename in filenames:
+                path = os.path.join(dirpath, filename)
+                if (os.path.splitext(filename)[1].lower() in SKIP_EXTENSIONS
+                        or os.path.getsize(path) < options['min_size']):
+                    continue
+                for encoding in supported_encodings():
+                    if compress_file(path, encoding):
+                        written += 1
+                    else:
+                        # Don't leave a stale copy from an earlier build behind
+                        stale = path + ENCODING_SUFFIXES[encoding]
+                        if os.path.exists(stale):
+                            os.remove(stale)
+
+        self.stdout.write(self.style.SUCCESS(f'Wrote {written} compressed files in {root}.'))
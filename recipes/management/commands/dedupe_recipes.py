@@ -0,0 +1,120 @@
+from itertools import groupby
+
+import numpy as np
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from recipes.catalog import defer_catalog_version
+from recipes.dedup import band_hashes, best_match, index_signatures, recipe_signature
+from recipes.models import Recipe, RecipeIngredient, RecipeSignature, RecipeSignatureBand
+
+
+class Command(BaseCommand):
+    help = ('Finds near-duplicate recipes in one streaming pass over the table, links '
+            '(or deletes) them, and rebuilds the near-duplicate index.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--delete', action='store_true',
+                            help='Delete duplicates of the same owner\'s recipes instead of linking them '
+                                 'to the original; duplicates of other users\' recipes are still linked.')
+        parser.add_argument('--chunk-size', type=int, default=1000,
+                            help='Recipes read and indexed per batch (default: 1000).')
+
+    def handle(self, *args, **options):
+        # One transaction, so other connections keep matching against the old
+        # index until the rebuilt one commits, and a failed run leaves it as
+        # it was; the catalog changes count once
+        with transaction.atomic(), defer_catalog_version():
+            scanned, linked, deleted = self.rebuild(options['chunk_size'], options['delete'])
+        self.stdout.write(self.style.SUCCESS(
+            f'Scanned {scanned} recipes. Linked {linked} and deleted {deleted} near-duplicates.'))
+
+    def rebuild(self, chunk_size, delete):
+        """Rebuilds the index from scratch, keeping only one recipe per group; returns the counts."""
+        RecipeSignatureBand.objects.all().delete()
+        RecipeSignature.objects.all().delete()
+
+        # Earlier recipes win: both streams are ordered by recipe id
+        recipes = Recipe.objects.order_by('id').values_list('id', 'title').iterator(chunk_size=chunk_size)
+        ingredient_rows = RecipeIngredient.objects.order_by('recipe_id').values_list(
+            'recipe_id', 'ingredient__name').iterator(chunk_size=chunk_size * 10)
+        ingredients_by_recipe = groupby(ingredient_rows, key=lambda row: row[0])
+        pending = next(ingredients_by_recipe, None)
+
+        scanned = linked = deleted = 0
+        chunk = []
+        for recipe_id, title in recipes:
+            # Advance the ingredient stream to this recipe
+            while pending is not None and pending[0] < recipe_id:
+                pending = next(ingredients_by_recipe, None)
+            names = []
+            if pending is not None and pending[0] == recipe_id:
+                names = [name for _, name in pending[1]]
+                pending = next(ingredients_by_recipe, None)
+            chunk.append((recipe_id, recipe_signature(title, names)))
+            if len(chunk) >= chunk_size:
+                chunk_linked, chunk_deleted = self.process_chunk(chunk, delete)
+                linked += chunk_linked
+                deleted += chunk_deleted
+                scanned += len(chunk)
+                chunk = []
+        chunk_linked, chunk_deleted = self.process_chunk(chunk, delete)
+        return scanned + len(chunk), linked + chunk_linked, deleted + chunk_deleted
+
+    def process_chunk(self, chunk, delete):
+        """
+        Matches a chunk against the index and earlier rows of the chunk,
+        indexes the originals and links or deletes the duplicates; returns
+        how many were linked and deleted.
+        """
+        chunk = [(recipe_id, signature) for recipe_id, signature in chunk if signature is not None]
+        if not chunk:
+            return 0, 0
+        bands = {recipe_id: band_hashes(signature) for recipe_id, signature in chunk}
+
+        # Band hash -> ids of recipes already indexed with it
+        indexed = {}
+        all_hashes = list({band_hash for hashes in bands.values() for band_hash in hashes})
+        for start in range(0, len(all_hashes), 500):
+            for recipe_id, band_hash in RecipeSignatureBand.objects.filter(
+                    band_hash__in=all_hashes[start:start + 500]).values_list('recipe_id', 'band_hash'):
+                indexed.setdefault(band_hash, set()).add(recipe_id)
+        candidate_ids = set().union(*indexed.values()) if indexed else set()
+        signatures = {
+            recipe_id: np.frombuffer(bytes(blob), dtype=np.uint32)
+            for recipe_id, blob in RecipeSignature.objects.filter(
+                recipe_id__in=candidate_ids).values_list('recipe_id', 'minhash')}
+
+        originals, duplicate_of = [], {}
+        for recipe_id, signature in chunk:
+            candidates = set().union(*(indexed.get(band_hash, ()) for band_hash in bands[recipe_id]))
+            match = best_match(signature, ((other, signatures[other]) for other in candidates))
+            if match:
+                duplicate_of[recipe_id] = match[0]
+                continue
+            originals.append((recipe_id, signature))
+            # Later rows in this chunk can match it too
+            signatures[recipe_id] = signature
+            for band_hash in bands[recipe_id]:
+                indexed.setdefault(band_hash, set()).add(recipe_id)
+
+        index_signatures(originals)
+        # Drop stale links from earlier runs
+        Recipe.objects.filter(
+            pk__in=[recipe_id for recipe_id, _ in originals],
+            duplicate_of__isnull=False).update(duplicate_of=None)
+        deleted = set()
+        if delete:
+            # Only a user's own copies, never another user's private recipe
+            owners = dict(Recipe.objects.filter(
+                pk__in=[*duplicate_of, *duplicate_of.values()]).values_list('pk', 'user_id'))
+            deleted = {recipe_id for recipe_id, original_id in duplicate_of.items()
+                       if owners[recipe_id] == owners[original_id]}
+            Recipe.objects.filter(pk__in=deleted).delete()
+        by_original = {}
+        for recipe_id, original_id in duplicate_of.items():
+            if recipe_id not in deleted:
+                by_original.setdefault(original_id, []).append(recipe_id)
+        for original_id, recipe_ids in by_original.items():
+            Recipe.objects.filter(pk__in=recipe_ids).update(duplicate_of=original_id)
+        return len(duplicate_of) - len(deleted), len(deleted)
@@ -0,0 +1,59 @@
+import os
+
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand, CommandError
+
+from recipes.export import DEFAULT_CHUNK_SIZE, available_formats, export_recipes
+from recipes.models import Recipe
+
+
+class Command(BaseCommand):
+    help = ('Writes recipes with their ingredients as CSV, NDJSON or Parquet, streaming '
+            'the table in chunks so memory use stays flat.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--output', '-o', type=str, default='-',
+                            help='File to write (default: stdout, not available for Parquet).')
+        parser.add_argument('--format', choices=['csv', 'ndjson', 'parquet'],
+                            help='Output format (default: from the --output extension, else ndjson).')
+        parser.add_argument('--user', type=str,
+                            help='Only export recipes belonging to this username.')
+        parser.add_argument('--chunk-size', type=int, default=DEFAULT_CHUNK_SIZE,
+                            help=f'Recipes read per query (default: {DEFAULT_CHUNK_SIZE}).')
+
+    def handle(self, *args, **options):
+        output = options['output']
+        fmt = options['format']
+        if fmt is None:
+            extension = os.path.splitext(output)[1].lstrip('.').lower()
+            fmt = extension if extension in ('csv', 'ndjson', 'parquet') else 'ndjson'
+        if fmt not in available_formats():
+            raise CommandError(f'{fmt} export needs pyarrow installed.')
+        if fmt == 'parquet' and output == '-':
+            raise CommandError('Parquet is binary; pass --output FILE.')
+
+        queryset = Recipe.objects.all()
+        if options['user']:
+            try:
+                queryset = queryset.filter(user=User.objects.get(username=options['user']))
+            except User.DoesNotExist:
+                raise CommandError(f'User "{options["user"]}" does not exist.')
+
+        chunks = export_recipes(fmt, queryset, chunk_size=options['chunk_size'])
+        if output == '-':
+            for chunk in chunks:
+                self.stdout.write(chunk.decode(), ending='')
+            return
+
+        # Write next to the target and rename, so a failed dump never leaves a partial file
+        partial = output + '.partial'
+        try:
+            with open(partial, 'wb') as file:
+                for chunk in chunks:
+                    file.write(chunk)
+            os.replace(partial, output)
+        except BaseException:
+            if os.path.exists(partial):
+                os.remove(partial)
+            raise
+        self.stderr.write(self.style.SUCCESS(f'Wrote {fmt} export to {output}.'))
@@ -0,0 +1,68 @@
+import json
+
+from django.core.management.base import BaseCommand, CommandError
+
+from recipes.fake_gemini import FakeGeminiConfig, FakeGeminiServer, parse_latency
+
+
+def rate(value):
+    value = float(value)
+    if not 0 <= value <= 1:
+        raise ValueError
+    return value
+
+
+class Command(BaseCommand):
+    help = ('Runs a local stand-in for the Gemini generateContent API with configurable '
+            'latency, error rates and canned recipes, for load tests. Start the app with '
+            'GEMINI_API_URL set to the URL it prints (and any GEMINI_API_KEY).')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--host', default='127.0.0.1')
+        parser.add_argument('--port', type=int, default=8090)
+        parser.add_argument('--latency', default=FakeGeminiConfig.latency,
+                            help='fixed:S, uniform:LOW,HIGH, exponential:MEAN or lognormal:MEDIAN,SIGMA, '
+                                 f'in seconds (default: {FakeGeminiConfig.latency}).')
+        parser.add_argument('--error-rate', type=rate, default=0.0,
+                            help='Share of requests answered with HTTP 503.')
+        parser.add_argument('--throttle-rate', type=rate, default=0.0,
+                            help='Share of requests answered with HTTP 429.')
+        parser.add_argument('--malformed-rate', type=rate, default=0.0,
+                            help='Share of requests answered with text that is not JSON.')
+        parser.add_argument('--duplicate-rate', type=rate, default=0.0,
+                            help='Share of recipes returned exactly as canned, to exercise deduplication.')
+        parser.add_argument('--payloads', type=str,
+                            help='JSON file with a list of canned recipes (title, instructions, '
+                                 'cooking_time_minutes, cuisine, ingredients: [{name, quantity}]).')
+        parser.add_argument('--seed', type=int, help='Seed for reproducible runs.')
+
+    def handle(self, *args, **options):
+        try:
+            parse_latency(options['latency'])
+        except ValueError as e:
+            raise CommandError(str(e))
+        if options['error_rate'] + options['throttle_rate'] + options['malformed_rate'] > 1:
+            raise CommandError('The error, throttle and malformed rates add up to more than 1.')
+
+        config = FakeGeminiConfig(
+            latency=options['latency'], error_rate=options['error_rate'],
+            throttle_rate=options['throttle_rate'], malformed_rate=options['malformed_rate'],
+            duplicate_rate=options['duplicate_rate'], seed=options['seed'])
+        if options['payloads']:
+            try:
+                with open(options['payloads']) as file:
+                    config.payloads = json.load(file)
+            except (OSError, ValueError) as e:
+                raise CommandError(f'Could not read {options["payloads"]}: {e}')
+            if not config.payloads or not all(recipe.get('ingredients') for recipe in config.payloads):
+                raise CommandError('--payloads must be a non-empty list of recipes with ingredients.')
+
+        server = FakeGeminiServer((options['host'], options['port']), config)
+        self.stdout.write(self.style.SUCCESS(f'Fake Gemini listening; use GEMINI_API_URL={server.url}'))
+        try:
+            server.serve_forever()
+        except KeyboardInterrupt:
+            pass
+        finally:
+            server.server_close()
+            self.stdout.write(f'Requests served: {json.dumps(server.fake.stats())}')
@@ -1,12 +1,38 @@
 import csv
 import json  # In case you use a JSON dataset later
+from django.conf import settings
 from django.core.management.base import BaseCommand, CommandError
 from django.contrib.auth.models import User
-from recipes.models import Recipe, Ingredient, RecipeIngredient, DietaryPreference
+from recipes.models import Recipe, Ingredient, RecipeIngredient, RecipeNutrition
+from recipes.catalog import defer_catalog_version
+from recipes.dedup import find_duplicate, index_recipe, recipe_signature
+from recipes.facets import defer_facet_updates
+from recipes.nutrition import parse_nutrition
 import os
 from django.db import transaction  # For atomic operations
 
 
+def parse_duration_minutes(duration_str):
+    """
+    Converts durations such as "45 mins", "1 hrs 30 mins" or "1 day 2 hrs"
+    to minutes. Returns None if no part of the string can be understood.
+    """
+    if not duration_str:
+        return None
+    total = None
+    tokens = duration_str.split()
+    for amount, unit in zip(tokens, tokens[1:]):
+        if not amount.isdigit():
+            continue
+        for prefix, minutes in (('day', 24 * 60), ('h', 60), ('min', 1)):
+            if unit.lower().startswith(prefix):
+                total = (total or 0) + int(amount) * minutes
+                break
+    if total is None and duration_str.strip().isdigit():
+        total = int(duration_str.strip())
+    return total
+
+
 class Command(BaseCommand):
     help = 'Loads recipes from a CSV file into the database.'
 
@@ -15,12 +41,19 @@ class Command(BaseCommand):
         parser.add_argument(
             'csv_file', type=str, help='The path to the CSV file containing recipe data.')
         # Add an argument to specify the username to associate recipes with
-        parser.add_argument('--user', type=str, default='admin',
-                            help='Username to associate with the loaded recipes (default: admin).')
+        parser.add_argument('--user', type=str, default=settings.CATALOG_OWNER,
+                            help='Username to associate with the loaded recipes (default: CATALOG_OWNER, '
+                                 'whose recipes are the catalog).')
+        # What to do with rows that near-duplicate a recipe already in the catalog
+        parser.add_argument('--duplicates', choices=['skip', 'link', 'keep'], default='skip',
+                            help='skip them (default), save them linked to the original '
+                                 '(duplicate_of), or keep them as regular recipes.')
 
     def handle(self, *args, **options):
         csv_file_path = options['csv_file']
         username = options['user']
+        duplicates_mode = options['duplicates']
+        skipped = 0
 
         # Find the user to associate recipes with
         try:
@@ -31,12 +64,18 @@ class Command(BaseCommand):
 
         self.stdout.write(self.style.SUCCESS(
             f'Starting to load recipes from {csv_file_path} for user: {user.username}'))
+        if user.username != settings.CATALOG_OWNER:
+            self.stderr.write(self.style.WARNING(
+                f'"{user.username}" is not the catalog owner ({settings.CATALOG_OWNER}): these recipes '
+                f'stay private to them and are not planned or recommended for anyone else.'))
 
         if not os.path.exists(csv_file_path):
             raise CommandError(f'File "{csv_file_path}" does not exist.')
 
         # Use a transaction to ensure atomicity: if any part fails, rollback everything
-        with transaction.atomic():
+        # Facet counts are refreshed once per recipe when the load completes,
+        # and the catalog version is bumped once, after the commit
+        with transaction.atomic(), defer_facet_updates(), defer_catalog_version():
             try:
                 with open(csv_file_path, 'r', encoding='utf-8') as file:
                     reader = csv.DictReader(file)
@@ -56,39 +95,17 @@ class Command(BaseCommand):
                         # Try to get total_time, then cook_time, then prep_time for cooking_time_minutes
                         cooking_time_str = row.get('total_time') or row.get(
                             'cook_time') or row.get('prep_time')
-                        cooking_time_minutes = None
-                        if cooking_time_str:
-                            try:
-                                # Attempt to extract numerical part, assuming format like "30 min" or "1 hour"
-                                if 'min' in cooking_time_str:
-                                    cooking_time_minutes = int(
-                                        cooking_time_str.split('min')[0].strip())
-                                elif 'hour' in cooking_time_str:
-                                    cooking_time_minutes = int(
-                                        cooking_time_str.split('hour')[0].strip()) * 60
-                                else:
-                                    cooking_time_minutes = int(
-                                        cooking_time_str.strip())
-                            except ValueError:
-                                cooking_time_minutes = None  # Handle non-integer or unparseable values
+                        cooking_time_minutes = parse_duration_minutes(
+                            cooking_time_str)
 
-                        cuisine = row.get('cuisine_path', '').split(
+                        cuisine = row.get('cuisine_path', '').strip('/').split(
                             '/')[-1].replace('-', ' ').title()  # Extract last part, format
-                        # Using 'nutrition' for dietary preferences, adjust if needed
-                        dietary_preferences_str = row.get('nutrition', '')
+                        nutrition_values = parse_nutrition(
+                            row.get('nutrition', ''))
                         ingredients_str = row.get('ingredients', '')
 
-                        # Create the Recipe instance
-                        recipe = Recipe.objects.create(
-                            user=user,
-                            title=title,
-                            instructions=instructions,
-                            cooking_time_minutes=cooking_time_minutes,
-                            cuisine=cuisine,
-                            generated_by_ai=False,  # These are loaded, not AI-generated
-                        )
-
-                        # Process Ingredients
+                        # Parse ingredients into (normalized name, quantity) pairs
+                        parsed_ingredients = []
                         if ingredients_str:
                             ingredient_items = [
                                 item.strip() for item in ingredients_str.split(',') if item.strip()]
@@ -107,29 +124,49 @@ class Command(BaseCommand):
                                 if ing_name:
                                     normalized_ing_name = ing_name.lower()  # Normalize for uniqueness check
                                     if normalized_ing_name not in processed_ingredient_names:
-                                        ingredient, created = Ingredient.objects.get_or_create(
-                                            name=normalized_ing_name)
-                                        RecipeIngredient.objects.create(
-                                            recipe=recipe,
-                                            ingredient=ingredient,
-                                            quantity=quantity
-                                        )
+                                        parsed_ingredients.append(
+                                            (normalized_ing_name, quantity))
                                         processed_ingredient_names.add(
                                             normalized_ing_name)  # Add to set
 
-                        # Process Dietary Preferences
-                        if dietary_preferences_str:
-                            dietary_pref_names = [
-                                name.strip() for name in dietary_preferences_str.split(',') if name.strip()]
-                            for dp_name in dietary_pref_names:
-                                if dp_name:
-                                    dietary_pref, created = DietaryPreference.objects.get_or_create(
-                                        name=dp_name.capitalize())
-                                    recipe.dietary_preferences.add(
-                                        dietary_pref)
+                        # Check the near-duplicate index before inserting
+                        signature = recipe_signature(
+                            title, [name for name, _ in parsed_ingredients])
+                        duplicate_id = find_duplicate(signature)
+                        if duplicate_id and duplicates_mode == 'skip':
+                            skipped += 1
+                            continue
+
+                        # Create the Recipe instance
+                        recipe = Recipe.objects.create(
+                            user=user,
+                            title=title,
+                            instructions=instructions,
+                            cooking_time_minutes=cooking_time_minutes,
+                            cuisine=cuisine,
+                            generated_by_ai=False,  # These are loaded, not AI-generated
+                            duplicate_of_id=duplicate_id if duplicates_mode == 'link' else None,
+                        )
+                        if duplicate_id is None:
+                            index_recipe(recipe, signature)
+
+                        # Process Ingredients
+                        for normalized_ing_name, quantity in parsed_ingredients:
+                            ingredient, created = Ingredient.objects.get_or_create(
+                                name=normalized_ing_name)
+                            RecipeIngredient.objects.create(
+                                recipe=recipe,
+                                ingredient=ingredient,
+                                quantity=quantity
+                            )
+
+                        # Nutrition goes into its own numeric table
+                        if nutrition_values:
+                            RecipeNutrition.objects.create(
+                                recipe=recipe, **nutrition_values)
 
                 self.stdout.write(self.style.SUCCESS(
-                    'Successfully loaded recipes!'))
+                    f'Successfully loaded recipes! Skipped {skipped} near-duplicates.'))
 
             except FileNotFoundError:
                 raise CommandError(
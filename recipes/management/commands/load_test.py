@@ -0,0 +1,66 @@
+import json
+
+from django.core.management.base import BaseCommand, CommandError
+
+from recipes.loadgen import DEFAULT_MIX, SCENARIOS, format_report, parse_mix, prepare_users, run_load, summarize
+
+
+class Command(BaseCommand):
+    help = ('Drives a running server with a mix of API requests at a target rate and reports '
+            'throughput and p50/p95/p99 latency per endpoint. Run it with the same database '
+            'settings as the server: load test users, their tokens and their recipes, copied '
+            'from the catalog, are created directly rather than through the API. '
+            'For generation, start the server with GEMINI_API_URL pointing at fake_gemini and '
+            'GENERATION_USER_RATE / GENERATION_GLOBAL_RATE raised, or most requests get 429s.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--base-url', default='http://127.0.0.1:8000/api/',
+                            help='API root of the server under test.')
+        parser.add_argument('--rps', type=float, default=20.0, help='Target requests per second.')
+        parser.add_argument('--duration', type=float, default=60.0, help='Measured seconds.')
+        parser.add_argument('--warmup', type=float, default=5.0,
+                            help='Seconds of load before measuring starts.')
+        parser.add_argument('--mix', default=DEFAULT_MIX,
+                            help=f'Scenario weights, from {", ".join(SCENARIOS)} (default: {DEFAULT_MIX}).')
+        parser.add_argument('--arrivals', choices=['uniform', 'poisson'], default='uniform',
+                            help='Evenly spaced requests, or Poisson arrivals for burstier traffic.')
+        parser.add_argument('--users', type=int, default=20, help='Distinct load test users.')
+        parser.add_argument('--recipes-per-user', type=int, default=5,
+                            help='Catalog recipes copied to each load test user that has fewer. Copies '
+                                 'are linked to their originals as duplicates and are not indexed '
+                                 'for deduplication.')
+        parser.add_argument('--concurrency', type=int, default=64,
+                            help='Most requests in flight at once.')
+        parser.add_argument('--timeout', type=float, default=70.0, help='Seconds before a request fails.')
+        parser.add_argument('--seed', type=int, help='Seed for a reproducible request sequence.')
+        parser.add_argument('--json', type=str, help='Also write the results to this JSON file.')
+
+    def handle(self, *args, **options):
+        try:
+            mix = parse_mix(options['mix'])
+        except ValueError as e:
+            raise CommandError(str(e))
+        if options['rps'] <= 0 or options['duration'] <= 0 or options['users'] < 1:
+            raise CommandError('--rps, --duration and --users must be positive.')
+
+        users = prepare_users(options['users'], options['recipes_per_user'], seed=options['seed'])
+        self.stderr.write(
+            f'Sending {options["rps"]:g} req/s to {options["base_url"]} for '
+            f'{options["warmup"]:g}s warmup + {options["duration"]:g}s...')
+        records = run_load(
+            options['base_url'], users, mix, options['rps'], options['duration'],
+            warmup=options['warmup'], concurrency=options['concurrency'],
+            poisson=options['arrivals'] == 'poisson', timeout=options['timeout'], seed=options['seed'])
+        summary = summarize(records, options['warmup'], options['duration'])
+
+        self.stdout.write(format_report(summary))
+        lag = summary['all']['max_lag_ms']
+        if lag > 100:
+            # Requests waited for a free worker here, not on the server
+            self.stderr.write(self.style.WARNING(
+                f'Requests started up to {lag:.0f}ms late; raise --concurrency if the server is not saturated.'))
+        if options['json']:
+            with open(options['json'], 'w') as file:
+                json.dump({'options': {key: options[key] for key in (
+                    'base_url', 'rps', 'duration', 'warmup', 'mix', 'arrivals', 'users', 'concurrency')},
+                    'results': summary}, file, indent=2)
@@ -0,0 +1,12 @@
+from django.core.management.base import BaseCommand
+
+from recipes.facets import rebuild_facets
+
+
+class Command(BaseCommand):
+    help = 'Recomputes the precomputed recipe facet counts from scratch.'
+
+    def handle(self, *args, **options):
+        num_values = rebuild_facets()
+        self.stdout.write(self.style.SUCCESS(
+            f'Rebuilt facet counts for {num_values} facet values.'))
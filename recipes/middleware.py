@@ -0,0 +1,96 @@
+import hashlib
+
+from django.conf import settings
+from django.core.cache import cache
+from django.utils.cache import patch_vary_headers
+
+from .compression import choose_encoding, compress, compress_stream
+from .routers import allow_replica_reads
+
+SAFE_METHODS = ('GET', 'HEAD', 'OPTIONS')
+
+
+def _client_key(request):
+    """Identifies the caller for read-your-writes pinning, or None if anonymous."""
+    user = getattr(request, 'user', None)
+    if user is not None and user.is_authenticated:
+        return f'user:{user.pk}'
+    # Token auth runs inside DRF views, after middleware, so key on the header
+    auth = request.META.get('HTTP_AUTHORIZATION')
+    if auth:
+        return 'auth:' + hashlib.sha256(auth.encode()).hexdigest()
+    return None
+
+
+class ReplicaRoutingMiddleware:
+    """
+    Allows safe requests to read from replicas, except for callers that wrote
+    within the last DATABASE_REPLICA_STICKY_SECONDS, who stay on the primary
+    until replication has had time to catch up.
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        if not getattr(settings, 'DATABASE_REPLICAS', []):
+            return self.get_response(request)
+
+        key = _client_key(request)
+        pin_key = f'db-primary-pin:{key}'
+        if request.method in SAFE_METHODS:
+            use_replica = key is None or not cache.get(pin_key)
+            with allow_replica_reads(use_replica):
+                return self.get_response(request)
+
+        with allow_replica_reads(False):
+            response = self.get_response(request)
+        if key is not None and response.status_code < 400:
+            cache.set(pin_key, True,
+                      getattr(settings, 'DATABASE_REPLICA_STICKY_SECONDS', 5))
+        return response
+
+
+class CompressionMiddleware:
+    """
+    Compresses text responses (JSON, CSV, HTML, ...) of at least
+    COMPRESSION_MIN_SIZE bytes with brotli or gzip, whichever the client
+    prefers. Streaming responses are compressed chunk by chunk.
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        response = self.get_response(request)
+
+        content_type = response.get('Content-Type', '').split(';')[0].strip()
+        if (response.has_header('Content-Encoding')
+                or content_type not in settings.COMPRESSION_CONTENT_TYPES
+                or (not response.streaming and len(response.content) < settings.COMPRESSION_MIN_SIZE)):
+            return response
+
+        patch_vary_headers(response, ('Accept-Encoding',))
+        encoding = choose_encoding(request.META.get('HTTP_ACCEPT_ENCODING', ''))
+        if encoding is None:
+            return response
+
+        if response.streaming:
+            if response.is_async:
+                return response
+            response.streaming_content = compress_stream(response.streaming_content, encoding)
+            # The compressed size isn't known until the stream ends
+            del response.headers['Content-Length']
+        else:
+            compressed = compress(response.content, encoding)
+            if len(compressed) >= len(response.content):
+                return response
+            response.content = compressed
+            response.headers['Content-Length'] = str(len(compressed))
+
+        # A strong ETag would claim byte equality with the uncompressed body
+        etag = response.get('ETag')
+        if etag and etag.startswith('"'):
+            response.headers['ETag'] = 'W/' + etag
+        response.headers['Content-Encoding'] = encoding
+        return response
@@ -0,0 +1,173 @@
+# Generated by Django 5.2.4 on 2026-10-19 13:22
+
+import re
+from collections import Counter
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+# The parsing and facet rules below are frozen copies of recipes.nutrition and
+# recipes.facets as of this migration, so that later changes to the app code
+# do not change what it does on a fresh database.
+
+# load_recipes used to store each nutrition entry as a DietaryPreference,
+# e.g. "Total fat 18g 23%" (or a stray "426%" from a thousands separator)
+NUTRITION_PREFERENCE_RE = re.compile(
+    r'^([A-Za-z][A-Za-z ]*\s+\d[\d,.]*\s*(mg|g|kcal)\b|\d+%$)', re.IGNORECASE)
+
+NUTRITION_FIELDS = {
+    'calories': 'calories',
+    'total fat': 'total_fat_g',
+    'saturated fat': 'saturated_fat_g',
+    'cholesterol': 'cholesterol_mg',
+    'sodium': 'sodium_mg',
+    'total carbohydrate': 'carbohydrate_g',
+    'dietary fiber': 'fiber_g',
+    'total sugars': 'sugars_g',
+    'protein': 'protein_g',
+}
+NUTRIENT_RE = re.compile(
+    r'^\s*(?P<label>[A-Za-z][A-Za-z ]*?)\s+(?P<amount>\d[\d,]*(?:\.\d+)?)\s*(?:kcal|mg|g)?\b',
+    re.IGNORECASE)
+
+COOKING_TIME_BUCKETS = [(15, 'Under 15 min'), (30, '15-30 min'), (60, '30-60 min'), (120, '1-2 hours')]
+CALORIE_RANGES = [
+    (200, 'Under 200 kcal'), (400, '200-400 kcal'), (600, '400-600 kcal'), (800, '600-800 kcal')]
+
+
+def parse_nutrition(nutrition_str):
+    values = {}
+    for part in re.split(r',\s*(?=[A-Za-z])', nutrition_str or ''):
+        match = NUTRIENT_RE.match(part)
+        if not match:
+            continue
+        field = NUTRITION_FIELDS.get(match.group('label').strip().lower())
+        if field:
+            values[field] = float(match.group('amount').replace(',', ''))
+    if 'calories' not in values and {'total_fat_g', 'carbohydrate_g', 'protein_g'} <= values.keys():
+        values['calories'] = (
+            9 * values['total_fat_g'] + 4 * values['carbohydrate_g'] + 4 * values['protein_g'])
+    if 'calories' in values:
+        values['calories'] = round(values['calories'])
+    return values
+
+
+def bucket(value, buckets, overflow_label):
+    if value is None:
+        return None
+    for upper, label in buckets:
+        if value < upper:
+            return label
+    return overflow_label
+
+
+def facet_values(cuisine, cooking_time_minutes, calories, dietary_preferences):
+    values = {
+        ('cuisine', cuisine),
+        ('cooking_time', bucket(cooking_time_minutes, COOKING_TIME_BUCKETS, 'Over 2 hours')),
+        ('calories', bucket(calories, CALORIE_RANGES, '800+ kcal')),
+    }
+    values.update(('dietary_preference', name) for name in dietary_preferences)
+    return {(facet, value) for facet, value in values if value}
+
+
+def move_nutrition_out_of_preferences(apps, schema_editor):
+    DietaryPreference = apps.get_model('recipes', 'DietaryPreference')
+    Recipe = apps.get_model('recipes', 'Recipe')
+    RecipeNutrition = apps.get_model('recipes', 'RecipeNutrition')
+
+    nutrition_pref_ids = [
+        pref.pk for pref in DietaryPreference.objects.all()
+        if NUTRITION_PREFERENCE_RE.match(pref.name)]
+    names_by_recipe = {}
+    for recipe_id, name in Recipe.dietary_preferences.through.objects.filter(
+            dietarypreference_id__in=nutrition_pref_ids).values_list(
+                'recipe_id', 'dietarypreference__name'):
+        names_by_recipe.setdefault(recipe_id, []).append(name)
+
+    nutrition_rows = []
+    for recipe_id, names in names_by_recipe.items():
+        values = parse_nutrition(', '.join(names))
+        if values:
+            nutrition_rows.append(RecipeNutrition(recipe_id=recipe_id, **values))
+    RecipeNutrition.objects.bulk_create(nutrition_rows, batch_size=1000)
+    DietaryPreference.objects.filter(pk__in=nutrition_pref_ids).delete()
+
+
+def build_facets(apps, schema_editor):
+    Recipe = apps.get_model('recipes', 'Recipe')
+    RecipeFacet = apps.get_model('recipes', 'RecipeFacet')
+    FacetCount = apps.get_model('recipes', 'FacetCount')
+
+    preferences = {}
+    for recipe_id, name in Recipe.dietary_preferences.through.objects.values_list(
+            'recipe_id', 'dietarypreference__name'):
+        preferences.setdefault(recipe_id, []).append(name)
+
+    counts = Counter()
+    batch = []
+    for recipe in Recipe.objects.values(
+            'id', 'cuisine', 'cooking_time_minutes', 'nutrition__calories').iterator(chunk_size=2000):
+        for facet, value in facet_values(
+                recipe['cuisine'], recipe['cooking_time_minutes'], recipe['nutrition__calories'],
+                preferences.get(recipe['id'], ())):
+            batch.append(RecipeFacet(recipe_id=recipe['id'], facet=facet, value=value))
+            counts[facet, value] += 1
+        if len(batch) >= 2000:
+            RecipeFacet.objects.bulk_create(batch)
+            batch = []
+    RecipeFacet.objects.bulk_create(batch)
+    FacetCount.objects.bulk_create(
+        FacetCount(facet=facet, value=value, count=count) for (facet, value), count in counts.items())
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('recipes', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='FacetCount',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('facet', models.CharField(max_length=50)),
+                ('value', models.CharField(max_length=100)),
+                ('count', models.IntegerField(default=0)),
+            ],
+            options={
+                'unique_together': {('facet', 'value')},
+            },
+        ),
+        migrations.CreateModel(
+            name='RecipeNutrition',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('calories', models.IntegerField(blank=True, db_index=True, null=True)),
+                ('total_fat_g', models.FloatField(blank=True, null=True)),
+                ('saturated_fat_g', models.FloatField(blank=True, null=True)),
+                ('cholesterol_mg', models.FloatField(blank=True, null=True)),
+                ('sodium_mg', models.FloatField(blank=True, null=True)),
+                ('carbohydrate_g', models.FloatField(blank=True, null=True)),
+                ('fiber_g', models.FloatField(blank=True, null=True)),
+                ('sugars_g', models.FloatField(blank=True, null=True)),
+                ('protein_g', models.FloatField(blank=True, null=True)),
+                ('recipe', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, related_name='nutrition', to='recipes.recipe')),
+            ],
+        ),
+        migrations.CreateModel(
+            name='RecipeFacet',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('facet', models.CharField(max_length=50)),
+                ('value', models.CharField(max_length=100)),
+                ('recipe', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='facets', to='recipes.recipe')),
+            ],
+            options={
+                'unique_together': {('recipe', 'facet', 'value')},
+            },
+        ),
+        migrations.RunPython(move_nutrition_out_of_preferences, migrations.RunPython.noop),
+        migrations.RunPython(build_facets, migrations.RunPython.noop),
+    ]
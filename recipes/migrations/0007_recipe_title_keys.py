@@ -0,0 +1,50 @@
+# Generated by Django 5.2.4 on 2026-10-19 14:59
+
+import re
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+# A frozen copy of recipes.search.title_keys as of this migration
+WORD_RE = re.compile(r'\w+')
+
+
+def title_keys(title):
+    lowered = (title or '').lower()
+    return list(dict.fromkeys(lowered[match.start():] for match in WORD_RE.finditer(lowered)))
+
+
+def index_titles(apps, schema_editor):
+    Recipe = apps.get_model('recipes', 'Recipe')
+    RecipeTitleKey = apps.get_model('recipes', 'RecipeTitleKey')
+    batch = []
+    for recipe_id, title in Recipe.objects.values_list('id', 'title').iterator(chunk_size=2000):
+        batch.extend(RecipeTitleKey(recipe_id=recipe_id, key=key) for key in title_keys(title))
+        if len(batch) >= 2000:
+            RecipeTitleKey.objects.bulk_create(batch)
+            batch = []
+    RecipeTitleKey.objects.bulk_create(batch)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('recipes', '0006_catalog_version'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='recipe',
+            name='title',
+            field=models.CharField(max_length=255),
+        ),
+        migrations.CreateModel(
+            name='RecipeTitleKey',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('key', models.CharField(db_index=True, max_length=255)),
+                ('recipe', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='title_keys', to='recipes.recipe')),
+            ],
+        ),
+        migrations.RunPython(index_titles, migrations.RunPython.noop),
+    ]
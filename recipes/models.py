@@ -30,6 +30,9 @@ class Recipe(models.Model):
     dietary_preferences = models.ManyToManyField(DietaryPreference, blank=True)
     generated_by_ai = models.BooleanField(
         default=False)  # To track if AI generated
+    # Set when this recipe was saved as a near-duplicate of another one
+    duplicate_of = models.ForeignKey(
+        'self', on_delete=models.SET_NULL, blank=True, null=True, related_name='duplicates')
 
     def __str__(self):
         return self.title
@@ -48,6 +51,105 @@ class RecipeIngredient(models.Model):
         return f"{self.quantity} {self.ingredient.name} in {self.recipe.title}"
 
 
+class RecipeNutrition(models.Model):
+    # Per-serving values parsed from the source data; null when not listed
+    recipe = models.OneToOneField(
+        Recipe, on_delete=models.CASCADE, related_name='nutrition')
+    calories = models.IntegerField(blank=True, null=True, db_index=True)
+    total_fat_g = models.FloatField(blank=True, null=True)
+    saturated_fat_g = models.FloatField(blank=True, null=True)
+    cholesterol_mg = models.FloatField(blank=True, null=True)
+    sodium_mg = models.FloatField(blank=True, null=True)
+    carbohydrate_g = models.FloatField(blank=True, null=True)
+    fiber_g = models.FloatField(blank=True, null=True)
+    sugars_g = models.FloatField(blank=True, null=True)
+    protein_g = models.FloatField(blank=True, null=True)
+
+    def __str__(self):
+        return f"Nutrition for recipe {self.recipe_id}"
+
+
+class RecipeFacet(models.Model):
+    # Which facet values a recipe currently counts towards, so FacetCount
+    # can be adjusted by the difference when the recipe changes
+    recipe = models.ForeignKey(
+        Recipe, on_delete=models.CASCADE, related_name='facets')
+    facet = models.CharField(max_length=50)
+    value = models.CharField(max_length=100)
+
+    class Meta:
+        unique_together = ('recipe', 'facet', 'value')
+
+    def __str__(self):
+        return f"{self.facet}={self.value} for recipe {self.recipe_id}"
+
+
+class FacetCount(models.Model):
+    # e.g. facet="cuisine", value="Italian", count=42
+    facet = models.CharField(max_length=50)
+    value = models.CharField(max_length=100)
+    count = models.IntegerField(default=0)
+
+    class Meta:
+        unique_together = ('facet', 'value')
+
+    def __str__(self):
+        return f"{self.facet}={self.value} ({self.count})"
+
+
+class RecipeSignature(models.Model):
+    # MinHash of the recipe's title and ingredients, see recipes.dedup
+    recipe = models.OneToOneField(
+        Recipe, on_delete=models.CASCADE, related_name='signature')
+    minhash = models.BinaryField()
+
+    def __str__(self):
+        return f"Signature for recipe {self.recipe_id}"
+
+
+class RecipeSignatureBand(models.Model):
+    # LSH band hashes; recipes sharing one are near-duplicate candidates
+    recipe = models.ForeignKey(
+        Recipe, on_delete=models.CASCADE, related_name='signature_bands')
+    band_hash = models.BigIntegerField(db_index=True)
+
+    def __str__(self):
+        return f"Band {self.band_hash} of recipe {self.recipe_id}"
+
+
+class RecipeTitleKey(models.Model):
+    # The lower-cased title from the start of each of its words, for the
+    # admin's prefix search; see recipes.search
+    recipe = models.ForeignKey(
+        Recipe, on_delete=models.CASCADE, related_name='title_keys')
+    key = models.CharField(max_length=255, db_index=True)
+
+    def __str__(self):
+        return f"{self.key} ({self.recipe_id})"
+
+
+class CatalogVersion(models.Model):
+    # Single row counting committed changes to what the catalog snapshot
+    # holds, bumped by recipes.signals; see recipes.snapshot
+    version = models.BigIntegerField(default=0)
+
+    def __str__(self):
+        return f"Catalog version {self.version}"
+
+
+class RecommendationFeed(models.Model):
+    # Precomputed recommendations, see recipes.recommendations
+    user = models.OneToOneField(
+        User, on_delete=models.CASCADE, related_name='recommendation_feed')
+    # Best first: int64 recipe ids and their float32 scores, packed as numpy arrays
+    recipe_ids = models.BinaryField()
+    scores = models.BinaryField()
+    updated_at = models.DateTimeField()
+
+    def __str__(self):
+        return f"Recommendations for {self.user.username}"
+
+
 class MealPlan(models.Model):
     user = models.ForeignKey(
         User, on_delete=models.CASCADE, related_name='meal_plans')
@@ -0,0 +1,44 @@
+import re
+
+# Nutrition label (as it appears in the CSV, lower-cased) -> RecipeNutrition field
+NUTRITION_FIELDS = {
+    'calories': 'calories',
+    'total fat': 'total_fat_g',
+    'saturated fat': 'saturated_fat_g',
+    'cholesterol': 'cholesterol_mg',
+    'sodium': 'sodium_mg',
+    'total carbohydrate': 'carbohydrate_g',
+    'dietary fiber': 'fiber_g',
+    'total sugars': 'sugars_g',
+    'protein': 'protein_g',
+}
+
+# e.g. "Total Fat 18g 23%" or "Potassium 1,245mg 26%"
+NUTRIENT_RE = re.compile(
+    r'^\s*(?P<label>[A-Za-z][A-Za-z ]*?)\s+(?P<amount>\d[\d,]*(?:\.\d+)?)\s*(?:kcal|mg|g)?\b',
+    re.IGNORECASE)
+
+
+def parse_nutrition(nutrition_str):
+    """
+    Parses a comma separated nutrition string such as
+    "Total Fat 18g 23%, Sodium 128mg 6%, Protein 4g" into a dict of
+    RecipeNutrition field values. Unknown nutrients are ignored.
+    """
+    values = {}
+    # Split on commas that start a new nutrient, not on thousands separators
+    for part in re.split(r',\s*(?=[A-Za-z])', nutrition_str or ''):
+        match = NUTRIENT_RE.match(part)
+        if not match:
+            continue
+        field = NUTRITION_FIELDS.get(match.group('label').strip().lower())
+        if field:
+            values[field] = float(match.group('amount').replace(',', ''))
+
+    if 'calories' not in values and {'total_fat_g', 'carbohydrate_g', 'protein_g'} <= values.keys():
+        # Estimate energy from macros (Atwater factors: 9 kcal/g fat, 4 kcal/g carbs and protein)
+        values['calories'] = (
+            9 * values['total_fat_g'] + 4 * values['carbohydrate_g'] + 4 * values['protein_g'])
+    if 'calories' in values:
+        values['calories'] = round(values['calories'])
+    return values
@@ -0,0 +1,214 @@
+"""
+Meal plan optimizer.
+
+Recipes are held as a sparse recipe x ingredient matrix in CSR form (one
+row of ingredient columns per recipe), so the planner can score every
+candidate at once with numpy. Plans are built greedily, slot by slot,
+preferring recipes whose ingredients are already on the shopping list, then
+improved by local search that swaps single recipes while doing so shrinks
+the shopping list.
+"""
+import threading
+from dataclasses import dataclass
+
+import numpy as np
+
+from .snapshot import get_catalog_snapshot
+
+# Cost of buying an ingredient relative to the benefit of reusing one
+NEW_INGREDIENT_COST = 0.5
+# Weight of the calorie target relative to one ingredient on the list
+CALORIE_PENALTY_WEIGHT = 2.0
+# Recipes with fewer ingredients are trivially "efficient" (a glass of milk)
+MIN_INGREDIENTS = 3
+LOCAL_SEARCH_PASSES = 2
+
+
+@dataclass
+class RecipeMatrix:
+    recipe_ids: np.ndarray  # int64, one per row
+    minutes: np.ndarray  # float64, NaN when unknown
+    calories: np.ndarray  # float64, NaN when unknown
+    indptr: np.ndarray  # int64, row i spans indices[indptr[i]:indptr[i + 1]]
+    indices: np.ndarray  # int32, dense ingredient column numbers
+    ingredient_ids: np.ndarray  # int64, database id of each column
+    # Derived from the above unless given, e.g. precomputed in a snapshot
+    row_lengths: np.ndarray = None
+    entry_rows: np.ndarray = None
+    ingredient_counts: np.ndarray = None
+
+    def __post_init__(self):
+        if self.row_lengths is None:
+            self.row_lengths = np.diff(self.indptr)
+        if self.entry_rows is None:
+            # Row number of every stored entry, for per-row sums via bincount
+            self.entry_rows = np.repeat(
+                np.arange(len(self.recipe_ids), dtype=np.int64), self.row_lengths)
+        if self.ingredient_counts is None:
+            # How many recipes use each ingredient
+            self.ingredient_counts = np.bincount(
+                self.indices, minlength=len(self.ingredient_ids))
+
+    def __len__(self):
+        return len(self.recipe_ids)
+
+    def row(self, i):
+        return self.indices[self.indptr[i]:self.indptr[i + 1]]
+
+    def rows_mask(self, recipe_ids):
+        """Boolean mask of the rows whose recipe id is in `recipe_ids`."""
+        return np.isin(self.recipe_ids, np.fromiter(recipe_ids, dtype=np.int64))
+
+    def overlap(self, covered):
+        """Number of each recipe's ingredients that are flagged in `covered`."""
+        return np.bincount(self.entry_rows, weights=covered[self.indices],
+                           minlength=len(self)).astype(np.int64)
+
+    @classmethod
+    def from_rows(cls, recipe_ids, minutes, calories, ingredient_lists):
+        """Builds a matrix from per-recipe lists of ingredient database ids."""
+        flat = np.fromiter((i for ings in ingredient_lists for i in ings), dtype=np.int64)
+        ingredient_ids, indices = np.unique(flat, return_inverse=True)
+        indptr = np.zeros(len(ingredient_lists) + 1, dtype=np.int64)
+        np.cumsum([len(ings) for ings in ingredient_lists], out=indptr[1:])
+        return cls(
+            recipe_ids=np.asarray(recipe_ids, dtype=np.int64),
+            minutes=np.array([np.nan if m is None else m for m in minutes], dtype=np.float64),
+            calories=np.array([np.nan if c is None else c for c in calories], dtype=np.float64),
+            indptr=indptr,
+            indices=indices.astype(np.int32),
+            ingredient_ids=ingredient_ids,
+        )
+
+    @classmethod
+    def from_snapshot(cls, snapshot):
+        """Wraps a CatalogSnapshot's arrays without copying them."""
+        return cls(**{field: getattr(snapshot, field) for field in cls.__dataclass_fields__})
+
+
+_catalog_lock = threading.Lock()
+_catalog = {'snapshot': None, 'matrix': None}
+
+
+def get_catalog_matrix():
+    """
+    The catalog as a RecipeMatrix over the current catalog snapshot, which
+    holds catalog recipes only (see recipes.catalog).
+    """
+    snapshot = get_catalog_snapshot()
+    with _catalog_lock:
+        if _catalog['snapshot'] is not snapshot:
+            _catalog['matrix'] = RecipeMatrix.from_snapshot(snapshot)
+            _catalog['snapshot'] = snapshot
+        return _catalog['matrix']
+
+
+def _calorie_penalty(calories, target):
+    if target is None:
+        return 0.0
+    # Recipes without calorie data are allowed but never preferred
+    off_by = np.where(np.isnan(calories), 1.0, np.abs(calories - target) / target)
+    return CALORIE_PENALTY_WEIGHT * np.minimum(off_by, 1.0)
+
+
+def plan_meals(matrix, num_days, meals_per_day=1, max_minutes_per_day=None,
+               calories_per_day=None, allowed=None):
+    """
+    Picks num_days * meals_per_day distinct recipes from `matrix` and
+    returns them as a list of days, each a list of matrix row numbers.
+
+    Each day's recipes fit in max_minutes_per_day, and with calories_per_day
+    the recipes are steered towards an equal share of the target. `allowed`
+    is an optional boolean mask restricting the candidate rows. Raises
+    ValueError when there are not enough candidates to fill the plan.
+    """
+    num_slots = num_days * meals_per_day
+    eligible = matrix.row_lengths >= MIN_INGREDIENTS
+    if allowed is not None:
+        eligible &= allowed
+    minutes = matrix.minutes
+    if max_minutes_per_day is not None:
+        eligible &= ~np.isnan(minutes) & (minutes <= max_minutes_per_day)
+    if np.count_nonzero(eligible) < num_slots:
+        raise ValueError('Not enough recipes match these constraints to fill the plan.')
+
+    meal_calories = None if calories_per_day is None else calories_per_day / meals_per_day
+    penalty = _calorie_penalty(matrix.calories, meal_calories)
+    lengths = np.maximum(matrix.row_lengths, 1).astype(np.float64)
+    # Seed preference: recipes built from widely used ingredients leave the
+    # most room for reuse later on
+    popularity = np.log1p(matrix.ingredient_counts)[matrix.indices]
+    potential = np.bincount(matrix.entry_rows, weights=popularity, minlength=len(matrix))
+    potential = potential / lengths / max(np.log1p(len(matrix)), 1)
+
+    day_minutes = np.nan_to_num(minutes)
+    min_minutes = day_minutes[eligible].min() if max_minutes_per_day is not None else 0
+    covered = np.zeros(len(matrix.ingredient_ids), dtype=np.float64)
+    chosen = np.zeros(len(matrix), dtype=bool)
+    days = []
+
+    for _ in range(num_days):
+        day, used_minutes = [], 0.0
+        for meal_num in range(meals_per_day):
+            candidates = eligible & ~chosen
+            if max_minutes_per_day is not None:
+                # Leave time for the meals still to come today
+                budget = max_minutes_per_day - used_minutes - (meals_per_day - meal_num - 1) * min_minutes
+                candidates &= day_minutes <= budget
+            if not candidates.any():
+                raise ValueError('Not enough recipes match these constraints to fill the plan.')
+            overlap = matrix.overlap(covered)
+            new = lengths - overlap
+            score = (overlap - NEW_INGREDIENT_COST * new) / lengths + potential - penalty
+            pick = int(np.argmax(np.where(candidates, score, -np.inf)))
+            chosen[pick] = True
+            covered[matrix.row(pick)] = 1.0
+            day.append(pick)
+            used_minutes += day_minutes[pick]
+        days.append(day)
+
+    _improve_plan(matrix, days, eligible, penalty, day_minutes, max_minutes_per_day)
+    return days
+
+
+def _improve_plan(matrix, days, eligible, penalty, day_minutes, max_minutes_per_day):
+    """
+    Local search: replaces one recipe at a time with the candidate that adds
+    the fewest ingredients to the rest of the plan, while that strictly lowers
+    shopping list size plus calorie penalty.
+    """
+    uses = np.zeros(len(matrix.ingredient_ids), dtype=np.int64)
+    chosen = np.zeros(len(matrix), dtype=bool)
+    for day in days:
+        for row in day:
+            np.add.at(uses, matrix.row(row), 1)
+            chosen[row] = True
+
+    for _ in range(LOCAL_SEARCH_PASSES):
+        improved = False
+        for day in days:
+            for slot, current in enumerate(day):
+                current_row = matrix.row(current)
+                np.subtract.at(uses, current_row, 1)
+                covered = (uses > 0).astype(np.float64)
+                # Ingredients each candidate would add to the rest of the plan
+                cost = matrix.row_lengths - matrix.overlap(covered) + penalty
+                candidates = eligible & ~chosen
+                if max_minutes_per_day is not None:
+                    others = sum(day_minutes[row] for row in day if row != current)
+                    candidates &= day_minutes <= max_minutes_per_day - others
+                best = int(np.argmin(np.where(candidates, cost, np.inf)))
+                if candidates[best] and cost[best] < cost[current] - 1e-9:
+                    chosen[current], chosen[best] = False, True
+                    day[slot] = current = best
+                    improved = True
+                np.add.at(uses, matrix.row(current), 1)
+        if not improved:
+            break
+
+
+def shopping_list_size(matrix, rows):
+    """Distinct ingredients needed for the given matrix rows."""
+    if not rows:
+        return 0
+    return len(np.unique(np.concatenate([matrix.row(row) for row in rows])))
@@ -0,0 +1,273 @@
+"""
+Per-user recipe recommendations.
+
+A user's taste profile is what occurs in their saved recipes and in the
+recipes of their meal plans: how often each ingredient, cuisine and dietary
+preference shows up. Every catalog recipe is scored against it as
+
+    ingredient overlap, each ingredient weighted by its rarity (idf) and the
+        sum divided by sqrt(number of ingredients), scaled so the user's best
+        match scores 1
+    + CUISINE_WEIGHT * share of the user's recipes in the recipe's cuisine
+    + PREFERENCE_WEIGHT * mean share of the recipe's dietary preferences
+
+The overlap is computed for a batch of users in one pass over the catalog
+snapshot's recipe x ingredient matrix (CSR): gather the users' ingredient
+weights at every stored entry, then sum each row with np.add.reduceat.
+
+Only catalog recipes (recipes.catalog), the ones in the snapshot, are
+recommended. Other users' recipes are private and never show up in anyone
+else's feed, though they still shape their owner's profile.
+
+The best FEED_SIZE recipes that the user has not saved or planned yet are
+stored in their RecommendationFeed row, so reading the feed is a single row
+lookup. The build_recommendations command scores every user; saving or
+generating a recipe, or creating a meal plan, queues a rescore of just that
+user once the write commits (schedule_feed_refresh).
+"""
+import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+from django.conf import settings
+from django.db import close_old_connections, transaction
+from django.utils import timezone
+
+from .models import MealPlan, Recipe, RecipeIngredient, RecommendationFeed
+from .snapshot import cuisine_key, latest_catalog_snapshot
+
+logger = logging.getLogger(__name__)
+
+FEED_SIZE = 100
+CUISINE_WEIGHT = 0.5
+PREFERENCE_WEIGHT = 0.25
+# Users scored per pass; the gathered weights take users x links x 4 bytes
+USER_BATCH_SIZE = 16
+
+# Where a user's recipes come from, as paths from Recipe to the user
+_SOURCES = ('user_id', 'mealplan__user_id')
+
+
+def _lookup(sorted_ids, ids):
+    """Positions of `ids` in `sorted_ids`, and a mask of the ids found there."""
+    positions = np.minimum(np.searchsorted(sorted_ids, ids), max(len(sorted_ids) - 1, 0))
+    found = sorted_ids[positions] == ids if len(sorted_ids) else np.zeros(len(ids), dtype=bool)
+    return positions, found
+
+
+def _row_sums(values, indptr):
+    """
+    Per-row sums of CSR data for several users at once: `values` is users x
+    entries and ends in a zero column, so every row start is a valid index.
+    """
+    sums = np.add.reduceat(values, indptr[:-1], axis=1)
+    # reduceat returns the entry itself, not 0, for empty rows
+    sums[:, indptr[:-1] == indptr[1:]] = 0
+    return sums
+
+
+class CatalogFeatures:
+    """Scoring weights derived from a snapshot's arrays, without any queries."""
+
+    def __init__(self, snapshot):
+        self.snapshot = snapshot
+        # Smoothed inverse document frequency: salt and eggs say little about taste
+        self.idf = (np.log((1 + len(snapshot)) / (1 + snapshot.ingredient_counts)) + 1).astype(np.float32)
+        self.row_scale = (1 / np.sqrt(np.maximum(snapshot.row_lengths, 1))).astype(np.float32)
+        # Ingredient columns of every link plus a trailing zero-weight column
+        self.ingredient_entries = np.append(snapshot.indices, len(snapshot.ingredient_ids))
+        self.cuisines = {name: code for code, name in enumerate(snapshot.cuisine_names())}
+        # len(self.cuisines) stands for "no cuisine"
+        self.cuisine_codes = snapshot.cuisine_codes
+        self.preference_ids = snapshot.preference_ids
+        self.preference_indptr = snapshot.preference_indptr
+        self.preference_entries = np.append(snapshot.preference_indices, len(self.preference_ids))
+        self.preference_counts = np.diff(self.preference_indptr)
+
+
+def _profiles(features, user_ids):
+    """
+    Ingredient counts, cuisine shares and preference shares of each user's
+    recipes (users x columns, plus a zero column), and the catalog rows to
+    leave out of each user's feed.
+    """
+    snapshot = features.snapshot
+    position = {user_id: i for i, user_id in enumerate(user_ids)}
+    num_users = len(user_ids)
+    ingredients = np.zeros((num_users, len(snapshot.ingredient_ids) + 1), dtype=np.float32)
+    cuisines = np.zeros((num_users, len(features.cuisines) + 1), dtype=np.float32)
+    preferences = np.zeros((num_users, len(features.preference_ids) + 1), dtype=np.float32)
+    recipe_counts = np.zeros(num_users, dtype=np.float32)
+    seen = [set() for _ in user_ids]
+
+    # Recipes both saved and planned count twice, as a stronger signal
+    for source in _SOURCES:
+        for user_id, recipe_id, cuisine in Recipe.objects.filter(
+                **{f'{source}__in': user_ids}).values_list(source, 'id', 'cuisine'):
+            user = position[user_id]
+            recipe_counts[user] += 1
+            seen[user].add(recipe_id)
+            code = features.cuisines.get(cuisine_key(cuisine))
+            if code is not None:
+                cuisines[user, code] += 1
+
+        for matrix, sorted_ids, model, field in (
+                (ingredients, snapshot.ingredient_ids, RecipeIngredient, 'ingredient_id'),
+                (preferences, features.preference_ids,
+                 Recipe.dietary_preferences.through, 'dietarypreference_id')):
+            pairs = np.array(list(model.objects.filter(**{f'recipe__{source}__in': user_ids}).values_list(
+                f'recipe__{source}', field)), dtype=np.int64).reshape(-1, 2)
+            columns, found = _lookup(sorted_ids, pairs[:, 1])
+            users = np.array([position[user_id] for user_id in pairs[found, 0].tolist()], dtype=np.int64)
+            np.add.at(matrix, (users, columns[found]), 1)
+
+    scale = 1 / np.maximum(recipe_counts, 1)[:, None]
+    excluded = []
+    for recipe_ids in seen:
+        rows, found = _lookup(snapshot.recipe_ids, np.fromiter(recipe_ids, dtype=np.int64))
+        excluded.append(rows[found])
+    return ingredients, cuisines * scale, preferences * scale, excluded
+
+
+def score_users(features, user_ids):
+    """Scores of every catalog row for each user, users x recipes."""
+    snapshot = features.snapshot
+    if not len(snapshot):
+        return np.zeros((len(user_ids), 0), dtype=np.float32)
+    ingredients, cuisines, preferences, excluded = _profiles(features, user_ids)
+
+    ingredients[:, :-1] *= features.idf
+    scores = _row_sums(ingredients[:, features.ingredient_entries], snapshot.indptr) * features.row_scale
+    best = scores.max(axis=1, keepdims=True)
+    scores /= np.where(best > 0, best, 1)
+
+    scores += CUISINE_WEIGHT * cuisines[:, features.cuisine_codes]
+    scores += PREFERENCE_WEIGHT * _row_sums(
+        preferences[:, features.preference_entries], features.preference_indptr
+    ) / np.maximum(features.preference_counts, 1)
+
+    for user, rows in enumerate(excluded):
+        scores[user, rows] = 0
+    return scores
+
+
+def top_recipes(features, scores, size=FEED_SIZE):
+    """(recipe ids, scores) of the best `size` recipes with a positive score, best first."""
+    recipe_ids = features.snapshot.recipe_ids
+    size = min(size, len(recipe_ids))
+    if size == 0:
+        return np.empty(0, dtype=np.int64), np.empty(0, dtype=np.float32)
+    rows = np.argpartition(-scores, size - 1)[:size]
+    rows = rows[scores[rows] > 0]
+    # Best score first, then the newest recipe
+    rows = rows[np.lexsort((-recipe_ids[rows], -scores[rows]))]
+    return recipe_ids[rows], scores[rows].astype(np.float32)
+
+
+def _save_feeds(features, user_ids):
+    """Scores `user_ids` and saves their feeds; returns the saved RecommendationFeeds."""
+    scores = score_users(features, user_ids)
+    now = timezone.now()
+    feeds = []
+    for user_id, user_scores in zip(user_ids, scores):
+        recipe_ids, top_scores = top_recipes(features, user_scores)
+        feeds.append(RecommendationFeed(
+            user_id=user_id, recipe_ids=recipe_ids.tobytes(), scores=top_scores.tobytes(), updated_at=now))
+    RecommendationFeed.objects.bulk_create(
+        feeds, update_conflicts=True, unique_fields=['user'],
+        update_fields=['recipe_ids', 'scores', 'updated_at'])
+    return feeds
+
+
+def build_feeds(features, user_ids, batch_size=USER_BATCH_SIZE):
+    """Scores `user_ids` and saves their feeds; returns how many were saved."""
+    saved = 0
+    for start in range(0, len(user_ids), batch_size):
+        saved += len(_save_feeds(features, list(user_ids[start:start + batch_size])))
+    return saved
+
+
+def users_with_recipes():
+    """Ids of the users that have saved or planned any recipe."""
+    owners = Recipe.objects.values_list('user_id', flat=True).distinct()
+    planners = MealPlan.objects.filter(recipes__isnull=False).values_list('user_id', flat=True).distinct()
+    return sorted(set(owners) | set(planners))
+
+
+_features_lock = threading.Lock()
+_features = {'snapshot': None, 'features': None}
+
+
+def get_catalog_features(snapshot=None):
+    """CatalogFeatures for `snapshot` (default: the latest one), cached per snapshot."""
+    snapshot = latest_catalog_snapshot() if snapshot is None else snapshot
+    with _features_lock:
+        if _features['snapshot'] is not snapshot:
+            _features['features'] = CatalogFeatures(snapshot)
+            _features['snapshot'] = snapshot
+        return _features['features']
+
+
+def refresh_user_feed(user_id):
+    """
+    Rescores one user, against the latest snapshot without waiting for a
+    rebuild; returns the new feed's recipe id and score arrays.
+    """
+    feed = _save_feeds(get_catalog_features(), [user_id])[0]
+    return np.frombuffer(feed.recipe_ids, dtype=np.int64), np.frombuffer(feed.scores, dtype=np.float32)
+
+
+# Rescores queued by schedule_feed_refresh, one at a time off the request threads
+_refresh_executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix='feed-refresh')
+_queued_lock = threading.Lock()
+_queued = set()
+
+
+def _refresh_logging_errors(user_id):
+    try:
+        refresh_user_feed(user_id)
+    except Exception:
+        # The write that asked for it has succeeded; the old feed stays until the next one
+        logger.exception('Could not refresh the recommendation feed of user %s', user_id)
+
+
+def _refresh_in_background(user_id):
+    with _queued_lock:
+        _queued.discard(user_id)
+    try:
+        _refresh_logging_errors(user_id)
+    finally:
+        close_old_connections()
+
+
+def _queue_refresh(user_id):
+    if not settings.RECOMMENDATIONS_BACKGROUND_REFRESH:
+        _refresh_logging_errors(user_id)
+        return
+    with _queued_lock:
+        if user_id in _queued:
+            return
+        _queued.add(user_id)
+    _refresh_executor.submit(_refresh_in_background, user_id)
+
+
+def schedule_feed_refresh(user_id):
+    """
+    Rescores `user_id` once the current transaction commits (right away
+    outside one), in a background thread unless
+    RECOMMENDATIONS_BACKGROUND_REFRESH is off. Failures are logged, never
+    raised: they must not fail the request that saved the user's data.
+    """
+    transaction.on_commit(lambda: _queue_refresh(user_id))
+
+
+def read_feed(user_id, offset=0, limit=20):
+    """[(recipe id, score)] from the user's stored feed, scoring them first if they have none."""
+    feed = RecommendationFeed.objects.filter(user_id=user_id).values_list('recipe_ids', 'scores').first()
+    if feed is None:
+        # What was just saved, rather than a read that a lagging replica may not answer yet
+        recipe_ids, scores = refresh_user_feed(user_id)
+    else:
+        recipe_ids, scores = np.frombuffer(feed[0], dtype=np.int64), np.frombuffer(feed[1], dtype=np.float32)
+    return list(zip(recipe_ids[offset:offset + limit].tolist(), scores[offset:offset + limit].tolist()))
@@ -1,5 +1,5 @@
 from rest_framework import serializers
-from .models import Ingredient, DietaryPreference, Recipe, RecipeIngredient, MealPlan, ShoppingListItem, User
+from .models import Ingredient, DietaryPreference, Recipe, RecipeIngredient, RecipeNutrition, FacetCount, MealPlan, ShoppingListItem, User
 
 # Serializer for the User model (often used for linking to recipes/plans)
 
@@ -38,6 +38,14 @@ class RecipeIngredientSerializer(serializers.ModelSerializer):
         model = RecipeIngredient
         fields = ['ingredient_id', 'ingredient_name', 'quantity']
 
+# Serializer for RecipeNutrition (per-serving numeric values)
+
+
+class RecipeNutritionSerializer(serializers.ModelSerializer):
+    class Meta:
+        model = RecipeNutrition
+        exclude = ['id', 'recipe']
+
 # Serializer for Recipe
 
 
@@ -50,12 +58,15 @@ class RecipeSerializer(serializers.ModelSerializer):
     # Display dietary preference names
     dietary_preferences = serializers.StringRelatedField(
         many=True, read_only=True)
+    # Null when the recipe has no nutrition data
+    nutrition = RecipeNutritionSerializer(read_only=True)
 
     class Meta:
         model = Recipe
         fields = [
             'id', 'user', 'title', 'instructions', 'cooking_time_minutes',
-            'cuisine', 'dietary_preferences', 'generated_by_ai', 'ingredients'
+            'cuisine', 'dietary_preferences', 'generated_by_ai', 'ingredients',
+            'nutrition'
         ]
         # User and AI status set by backend
         read_only_fields = ['user', 'generated_by_ai']
@@ -68,6 +79,75 @@ class RecipeSerializer(serializers.ModelSerializer):
         # For this project, AI will generate and the view will populate ingredients.
         return Recipe.objects.create(**validated_data)
 
+# Read-only fast path for RecipeSerializer.
+# Builds the same representation straight from values() rows, skipping
+# per-field serializer overhead on large lists. Keep in sync with
+# RecipeSerializer.Meta.fields and RecipeNutritionSerializer.
+
+# RecipeNutrition value fields, in model order; also the export columns
+NUTRITION_FIELDS = [
+    field.name for field in RecipeNutrition._meta.concrete_fields
+    if field.name not in ('id', 'recipe')
+]
+_RECIPE_VALUES = [
+    'id', 'user_id', 'user__username', 'title', 'instructions',
+    'cooking_time_minutes', 'cuisine', 'generated_by_ai', 'nutrition__id',
+] + ['nutrition__' + field for field in NUTRITION_FIELDS]
+# SQLite limits the number of parameters per query
+RECIPE_ID_CHUNK_SIZE = 500
+
+
+def chunks(items, size):
+    """Consecutive slices of at most `size` items, for id__in queries."""
+    for start in range(0, len(items), size):
+        yield items[start:start + size]
+
+
+def recipe_representations(recipes):
+    """
+    Returns RecipeSerializer(recipes, many=True).data as plain dicts, for a
+    Recipe queryset or a list of Recipe instances, in the same order.
+    """
+    if isinstance(recipes, list):
+        # e.g. a page of instances; re-read them as values rows
+        ids = [recipe.pk for recipe in recipes]
+        rows = {
+            row['id']: row for chunk in chunks(ids, RECIPE_ID_CHUNK_SIZE)
+            for row in Recipe.objects.filter(pk__in=chunk).values(*_RECIPE_VALUES)
+        }
+        rows = [rows[pk] for pk in ids if pk in rows]
+    else:
+        rows = list(recipes.values(*_RECIPE_VALUES))
+
+    ids = [row['id'] for row in rows]
+    ingredients = {pk: [] for pk in ids}
+    preferences = {pk: [] for pk in ids}
+    for chunk in chunks(ids, RECIPE_ID_CHUNK_SIZE):
+        for recipe_id, ingredient_id, name, quantity in RecipeIngredient.objects.filter(
+                recipe_id__in=chunk).order_by('id').values_list(
+                    'recipe_id', 'ingredient_id', 'ingredient__name', 'quantity'):
+            ingredients[recipe_id].append(
+                {'ingredient_id': ingredient_id, 'ingredient_name': name, 'quantity': quantity})
+        for recipe_id, name in Recipe.dietary_preferences.through.objects.filter(
+                recipe_id__in=chunk).order_by('dietarypreference_id').values_list(
+                    'recipe_id', 'dietarypreference__name'):
+            preferences[recipe_id].append(name)
+
+    return [{
+        'id': row['id'],
+        'user': {'id': row['user_id'], 'username': row['user__username']},
+        'title': row['title'],
+        'instructions': row['instructions'],
+        'cooking_time_minutes': row['cooking_time_minutes'],
+        'cuisine': row['cuisine'],
+        'dietary_preferences': preferences[row['id']],
+        'generated_by_ai': row['generated_by_ai'],
+        'ingredients': ingredients[row['id']],
+        'nutrition': None if row['nutrition__id'] is None else {
+            field: row['nutrition__' + field] for field in NUTRITION_FIELDS},
+    } for row in rows]
+
+
 # Serializer for MealPlan
 
 
@@ -81,6 +161,30 @@ class MealPlanSerializer(serializers.ModelSerializer):
         fields = '__all__'
         read_only_fields = ['user']
 
+# Input for the meal plan optimizer
+
+
+class MealPlanOptimizeSerializer(serializers.Serializer):
+    name = serializers.CharField(max_length=255, default="My Meal Plan")
+    start_date = serializers.DateField()
+    end_date = serializers.DateField()
+    # Comma-separated string, like the recipe generator form
+    dietary_preferences = serializers.CharField(required=False, allow_blank=True, default='')
+    meals_per_day = serializers.IntegerField(min_value=1, max_value=5, default=1)
+    max_minutes_per_day = serializers.IntegerField(min_value=1, required=False, allow_null=True, default=None)
+    calories_per_day = serializers.IntegerField(min_value=1, required=False, allow_null=True, default=None)
+
+    def validate(self, data):
+        num_days = (data['end_date'] - data['start_date']).days + 1
+        if num_days < 1:
+            raise serializers.ValidationError("end_date must not be before start_date.")
+        if num_days > 31:
+            raise serializers.ValidationError("Meal plans can cover at most 31 days.")
+        data['num_days'] = num_days
+        data['dietary_preferences'] = [
+            dp.strip().capitalize() for dp in data['dietary_preferences'].split(',') if dp.strip()]
+        return data
+
 # Serializer for ShoppingListItem
 
 
@@ -91,3 +195,11 @@ class ShoppingListItemSerializer(serializers.ModelSerializer):
     class Meta:
         model = ShoppingListItem
         fields = '__all__'
+
+# Serializer for FacetCount
+
+
+class FacetCountSerializer(serializers.ModelSerializer):
+    class Meta:
+        model = FacetCount
+        fields = ['value', 'count']
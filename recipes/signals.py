@@ -0,0 +1,157 @@
+from django.db.models import F
+from django.db.models.signals import m2m_changed, post_delete, post_save, pre_delete, pre_save
+from django.dispatch import receiver
+
+from .catalog import bump_catalog_version, catalog_recipes, is_catalog_recipe
+from .facets import refresh_recipe_facets, remove_recipe_facets
+from .models import (DietaryPreference, FacetCount, Ingredient, Recipe, RecipeFacet,
+                     RecipeIngredient, RecipeNutrition)
+from .search import index_title
+
+# Keep FacetCount in step with the recipes it summarises.
+
+
+@receiver(post_save, sender=Recipe)
+def recipe_saved(sender, instance, raw=False, **kwargs):
+    if not raw:
+        refresh_recipe_facets(instance.pk)
+
+
+@receiver(pre_delete, sender=Recipe)
+def recipe_deleting(sender, instance, **kwargs):
+    remove_recipe_facets(instance.pk)
+
+
+@receiver(post_save, sender=RecipeNutrition)
+def nutrition_saved(sender, instance, raw=False, **kwargs):
+    if not raw:
+        refresh_recipe_facets(instance.recipe_id)
+
+
+@receiver(post_delete, sender=RecipeNutrition)
+def nutrition_deleted(sender, instance, origin=None, **kwargs):
+    # When the recipe itself is being deleted recipe_deleting has already
+    # taken it out of the counts
+    if isinstance(origin, Recipe) or getattr(origin, 'model', None) is Recipe:
+        return
+    refresh_recipe_facets(instance.recipe_id)
+
+
+@receiver(m2m_changed, sender=Recipe.dietary_preferences.through)
+def dietary_preferences_changed(sender, instance, action, reverse, pk_set, **kwargs):
+    if not reverse:
+        if action in ('post_add', 'post_remove', 'post_clear'):
+            refresh_recipe_facets(instance.pk)
+        return
+    # preference.recipe_set.add/remove/clear(): pk_set holds recipe ids, except
+    # for clear, where the affected recipes have to be looked up beforehand
+    if action == 'pre_clear':
+        instance._cleared_recipe_ids = list(
+            instance.recipe_set.values_list('pk', flat=True))
+    elif action in ('post_add', 'post_remove', 'post_clear'):
+        recipe_ids = pk_set if action != 'post_clear' else instance._cleared_recipe_ids
+        for recipe_id in recipe_ids:
+            refresh_recipe_facets(recipe_id)
+
+
+@receiver(post_save, sender=DietaryPreference)
+def dietary_preference_saved(sender, instance, created, raw=False, **kwargs):
+    # A rename moves its recipes to a different facet value
+    if not created and not raw:
+        for recipe_id in instance.recipe_set.values_list('pk', flat=True):
+            refresh_recipe_facets(recipe_id)
+
+
+@receiver(pre_delete, sender=DietaryPreference)
+def dietary_preference_deleting(sender, instance, **kwargs):
+    # Its M2M rows are removed without m2m_changed, so drop the facet directly
+    RecipeFacet.objects.filter(facet='dietary_preference', value=instance.name).delete()
+    FacetCount.objects.filter(facet='dietary_preference', value=instance.name).delete()
+
+
+@receiver(post_save, sender=Recipe)
+def recipe_title_saved(sender, instance, created, raw=False, update_fields=None, **kwargs):
+    # Keep the admin's title index (recipes.search) in step
+    if not raw and (update_fields is None or 'title' in update_fields):
+        index_title(instance.pk, instance.title, created)
+
+
+# Count changes to what the catalog snapshot holds (recipes.snapshot): the
+# catalog recipes with their ingredients, nutrition and preferences, and the
+# ingredient names. Workers compare the count with their snapshot's to tell
+# it is stale. Users' private recipes are not counted, nor are new
+# ingredients, which autocomplete picks up without a rebuild.
+#
+# The counter row is updated after the commit, so no writer holds its lock
+# for longer than that UPDATE. Bulk writers wrap their batches in
+# recipes.catalog.defer_catalog_version() to count each batch once; writes
+# that skip these receivers (bulk_create, update()) have to call
+# bump_catalog_version() themselves.
+
+
+def _bump_for_recipe(recipe, recipe_id):
+    # recipe.user when it is loaded already, as it is for new rows
+    owner = recipe.user if recipe is not None and Recipe.user.is_cached(recipe) else None
+    if is_catalog_recipe(recipe_id, owner):
+        bump_catalog_version()
+
+
+def _cascaded_from(origin, model):
+    return isinstance(origin, model) or getattr(origin, 'model', None) is model
+
+
+@receiver(pre_save, sender=Recipe)
+def catalog_recipe_changing(sender, instance, **kwargs):
+    # A recipe moved out of the catalog has to leave the snapshot too;
+    # post_save counts the other changes
+    if instance.pk is not None and not instance._state.adding and catalog_recipes().filter(
+            pk=instance.pk).exclude(user_id=instance.user_id).exists():
+        bump_catalog_version()
+
+
+@receiver(post_save, sender=Recipe)
+def catalog_recipe_saved(sender, instance, **kwargs):
+    _bump_for_recipe(instance, instance.pk)
+
+
+@receiver(pre_delete, sender=Recipe)
+def catalog_recipe_deleting(sender, instance, **kwargs):
+    # Before the row is gone, so its owner can still be looked up
+    _bump_for_recipe(instance, instance.pk)
+
+
+@receiver(post_save, sender=RecipeIngredient)
+@receiver(post_save, sender=RecipeNutrition)
+def catalog_recipe_part_saved(sender, instance, **kwargs):
+    _bump_for_recipe(instance.recipe if sender.recipe.is_cached(instance) else None, instance.recipe_id)
+
+
+@receiver(pre_delete, sender=RecipeIngredient)
+@receiver(pre_delete, sender=RecipeNutrition)
+def catalog_recipe_part_deleting(sender, instance, origin=None, **kwargs):
+    # Deleting the recipe or ingredient counts once for all of its rows
+    if not (_cascaded_from(origin, Recipe) or _cascaded_from(origin, Ingredient)):
+        catalog_recipe_part_saved(sender, instance)
+
+
+@receiver(m2m_changed, sender=Recipe.dietary_preferences.through)
+def catalog_preferences_changed(sender, instance, action, reverse, **kwargs):
+    if action in ('post_add', 'post_remove', 'post_clear'):
+        if reverse:
+            # preference.recipe_set.add/remove/clear()
+            bump_catalog_version()
+        else:
+            _bump_for_recipe(instance, instance.pk)
+
+
+@receiver(post_save, sender=Ingredient)
+def catalog_ingredient_saved(sender, instance, created, **kwargs):
+    # Renames; new ingredients are left to autocomplete
+    if not created:
+        bump_catalog_version()
+
+
+@receiver(pre_delete, sender=Ingredient)
+@receiver(pre_delete, sender=DietaryPreference)
+def catalog_column_deleting(sender, instance, **kwargs):
+    bump_catalog_version()
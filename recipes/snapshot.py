@@ -0,0 +1,343 @@
+"""
+Versioned binary snapshot of the recipe catalog.
+
+The catalog recipes (recipes.catalog) and every ingredient are compiled
+into one file: a small JSON header followed by aligned numpy arrays, namely
+the recipe x ingredient and recipe x dietary preference matrices in CSR
+form, each recipe's cuisine code, plus UTF-8 string tables for recipe
+titles, ingredient names and cuisines. Workers map the file read-only, so
+all processes on a host share a single copy through the page cache and
+loading it costs a header parse instead of a pass over the tables.
+
+The header records catalog_version() at build time. When the tables have
+changed since, requests keep getting the current snapshot while a single
+background thread rebuilds it from the database and rewrites the file;
+the other workers map the new file on their next check.
+"""
+import json
+import mmap
+import os
+import threading
+
+import numpy as np
+from django.conf import settings
+from django.core.cache import cache
+from django.db import connections
+
+from .catalog import catalog_recipes
+from .models import CatalogVersion, Ingredient, Recipe, RecipeIngredient
+
+MAGIC = b'RCPCAT01'
+FORMAT_VERSION = 3
+# Arrays start on cache line boundaries
+ALIGNMENT = 64
+_PREFIX_SIZE = len(MAGIC) + 8
+# Held in the cache while a worker rebuilds, so only one of them does
+REBUILD_LOCK_KEY = 'catalog-snapshot:rebuild'
+REBUILD_LOCK_TIMEOUT = 600  # seconds, in case the builder dies
+
+
+def catalog_version():
+    """
+    The catalog's change counter, bumped by recipes.signals after each
+    transaction that changes what a snapshot holds.
+    """
+    return CatalogVersion.objects.filter(pk=1).values_list('version', flat=True).first() or 0
+
+
+def _align(offset):
+    return -(-offset // ALIGNMENT) * ALIGNMENT
+
+
+def _string_table(strings):
+    """(offsets, data): string i is data[offsets[i]:offsets[i + 1]], UTF-8 encoded."""
+    encoded = [(text or '').encode() for text in strings]
+    offsets = np.zeros(len(encoded) + 1, dtype=np.int64)
+    np.cumsum([len(item) for item in encoded], out=offsets[1:])
+    return offsets, np.frombuffer(b''.join(encoded), dtype=np.uint8)
+
+
+def cuisine_key(cuisine):
+    """The form cuisines are compared in: "Italian " and "italian" are one."""
+    return (cuisine or '').strip().lower()
+
+
+def _pairs(queryset, *fields):
+    return np.array(list(queryset.values_list(*fields).iterator(chunk_size=10000)), dtype=np.int64).reshape(-1, 2)
+
+
+def _csr(pairs, row_ids, column_ids):
+    """
+    indptr, column numbers and row number of every entry, from (row id,
+    column id) pairs sorted by row id, over sorted `row_ids` and
+    `column_ids`. Pairs naming ids missing from those are dropped: rows
+    written between the build's queries are left for the next rebuild.
+    """
+    pairs = pairs[np.isin(pairs[:, 0], row_ids) & np.isin(pairs[:, 1], column_ids)]
+    rows = np.searchsorted(row_ids, pairs[:, 0]).astype(np.int64)
+    indptr = np.zeros(len(row_ids) + 1, dtype=np.int64)
+    np.cumsum(np.bincount(rows, minlength=len(row_ids)), out=indptr[1:])
+    return indptr, np.searchsorted(column_ids, pairs[:, 1]).astype(np.int32), rows
+
+
+def build_arrays():
+    """Reads the catalog into the arrays stored in a snapshot."""
+    catalog = catalog_recipes()
+    recipes = list(catalog.order_by('id').values_list(
+        'id', 'title', 'cooking_time_minutes', 'nutrition__calories', 'cuisine').iterator(chunk_size=10000))
+    # Every ingredient, for autocomplete, not only those the catalog uses
+    ingredients = list(Ingredient.objects.order_by('id').values_list('id', 'name').iterator(chunk_size=10000))
+    links = _pairs(RecipeIngredient.objects.filter(recipe__in=catalog).order_by('recipe_id', 'id'),
+                   'recipe_id', 'ingredient_id')
+    preference_pairs = _pairs(Recipe.dietary_preferences.through.objects.filter(
+        recipe__in=catalog).order_by('recipe_id', 'id'), 'recipe_id', 'dietarypreference_id')
+
+    recipe_ids = np.array([row[0] for row in recipes], dtype=np.int64)
+    ingredient_ids = np.array([row[0] for row in ingredients], dtype=np.int64)
+    indptr, indices, rows = _csr(links, recipe_ids, ingredient_ids)
+    preference_ids = np.unique(preference_pairs[:, 1])
+    preference_indptr, preference_indices, _ = _csr(preference_pairs, recipe_ids, preference_ids)
+    cuisines = sorted({cuisine_key(row[4]) for row in recipes} - {''})
+    # len(cuisines) stands for "no cuisine"
+    cuisine_codes = {name: code for code, name in enumerate(cuisines)}
+
+    title_offsets, title_data = _string_table(row[1] for row in recipes)
+    name_offsets, name_data = _string_table(row[1] for row in ingredients)
+    cuisine_offsets, cuisine_data = _string_table(cuisines)
+    return {
+        'recipe_ids': recipe_ids,
+        'minutes': np.array([np.nan if row[2] is None else row[2] for row in recipes], dtype=np.float64),
+        'calories': np.array([np.nan if row[3] is None else row[3] for row in recipes], dtype=np.float64),
+        'indptr': indptr,
+        'indices': indices,
+        'ingredient_ids': ingredient_ids,
+        'row_lengths': np.diff(indptr),
+        'entry_rows': rows,
+        'ingredient_counts': np.bincount(indices, minlength=len(ingredient_ids)).astype(np.int64),
+        'cuisine_codes': np.array([cuisine_codes.get(cuisine_key(row[4]), len(cuisines)) for row in recipes],
+                                  dtype=np.int64),
+        'preference_ids': preference_ids,
+        'preference_indptr': preference_indptr,
+        'preference_indices': preference_indices,
+        'title_offsets': title_offsets,
+        'title_data': title_data,
+        'ingredient_name_offsets': name_offsets,
+        'ingredient_name_data': name_data,
+        'cuisine_name_offsets': cuisine_offsets,
+        'cuisine_name_data': cuisine_data,
+    }
+
+
+class CatalogSnapshot:
+    """
+    The catalog arrays plus the catalog_version() they were built at. Arrays
+    are attributes (recipe_ids, indptr, indices, ...) and are read-only when
+    the snapshot is mapped from a file.
+    """
+
+    def __init__(self, version, arrays, mapping=None):
+        self.version = version
+        self.arrays = arrays
+        # Keeps the file mapped for as long as the arrays are in use
+        self._mapping = mapping
+        for name, array in arrays.items():
+            setattr(self, name, array)
+
+    def __len__(self):
+        return len(self.recipe_ids)
+
+    @staticmethod
+    def _string(offsets, data, i):
+        return data[offsets[i]:offsets[i + 1]].tobytes().decode()
+
+    def title(self, row):
+        return self._string(self.title_offsets, self.title_data, row)
+
+    def ingredient_name(self, column):
+        return self._string(self.ingredient_name_offsets, self.ingredient_name_data, column)
+
+    @staticmethod
+    def _strings(offsets, data):
+        data, offsets = data.tobytes(), offsets.tolist()
+        return [data[start:end].decode() for start, end in zip(offsets, offsets[1:])]
+
+    def ingredient_names(self):
+        return self._strings(self.ingredient_name_offsets, self.ingredient_name_data)
+
+    def cuisine_names(self):
+        """Cuisine keys (see cuisine_key), indexed by code."""
+        return self._strings(self.cuisine_name_offsets, self.cuisine_name_data)
+
+
+def write_snapshot(path, version, arrays):
+    """Writes a snapshot file atomically, so readers never see a partial one."""
+    specs, offset = {}, 0
+    for name, array in arrays.items():
+        offset = _align(offset)
+        specs[name] = {'dtype': array.dtype.str, 'shape': list(array.shape), 'offset': offset}
+        offset += array.nbytes
+    header = json.dumps({'format': FORMAT_VERSION, 'version': version, 'arrays': specs}).encode()
+    data_start = _align(_PREFIX_SIZE + len(header))
+
+    temp_path = f'{path}.{os.getpid()}.tmp'
+    try:
+        with open(temp_path, 'wb') as file:
+            file.write(MAGIC + len(header).to_bytes(8, 'little') + header)
+            for name, array in arrays.items():
+                file.seek(data_start + specs[name]['offset'])
+                file.write(np.ascontiguousarray(array).tobytes())
+            file.truncate(data_start + offset)
+        # Workers that mapped the old file keep reading it until they reload
+        os.replace(temp_path, path)
+    except BaseException:
+        if os.path.exists(temp_path):
+            os.remove(temp_path)
+        raise
+
+
+def load_snapshot(path):
+    """Maps a snapshot file, or returns None if it is missing or unreadable."""
+    try:
+        with open(path, 'rb') as file:
+            mapping = mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ)
+    except (OSError, ValueError):
+        return None
+    try:
+        if mapping[:len(MAGIC)] != MAGIC:
+            return None
+        header_size = int.from_bytes(mapping[len(MAGIC):_PREFIX_SIZE], 'little')
+        header = json.loads(mapping[_PREFIX_SIZE:_PREFIX_SIZE + header_size])
+        if header.get('format') != FORMAT_VERSION:
+            return None
+        data_start = _align(_PREFIX_SIZE + header_size)
+        arrays = {}
+        for name, spec in header['arrays'].items():
+            dtype, shape = np.dtype(spec['dtype']), tuple(spec['shape'])
+            count = int(np.prod(shape))
+            if count == 0:
+                arrays[name] = np.empty(shape, dtype=dtype)
+                continue
+            arrays[name] = np.frombuffer(
+                mapping, dtype=dtype, count=count, offset=data_start + spec['offset']).reshape(shape)
+    except (ValueError, KeyError, TypeError):
+        return None
+    return CatalogSnapshot(header['version'], arrays, mapping)
+
+
+def build_snapshot(path=None):
+    """Builds a snapshot from the database, writes it to `path` and returns it mapped."""
+    path = settings.CATALOG_SNAPSHOT_PATH if path is None else path
+    # Read the version first: changes made during the build make it stale, not wrong
+    version = catalog_version()
+    arrays = build_arrays()
+    try:
+        write_snapshot(path, version, arrays)
+    except OSError:
+        # Read-only deployment: keep the snapshot in this process only
+        return CatalogSnapshot(version, arrays)
+    return load_snapshot(path) or CatalogSnapshot(version, arrays)
+
+
+_snapshot_lock = threading.Lock()
+# 'file' is the (inode, mtime) of the snapshot file last mapped, so workers
+# notice when another one replaces it
+_snapshot = {'current': None, 'file': None, 'rebuild': None}
+
+
+def _file_id(path):
+    try:
+        stat = os.stat(path)
+    except OSError:
+        return None
+    return stat.st_ino, stat.st_mtime_ns
+
+
+def _reload_file():
+    """
+    Maps the snapshot file if this process has none, or the file was replaced
+    since it last did; call with the lock held.
+    """
+    path = settings.CATALOG_SNAPSHOT_PATH
+    file_id = _file_id(path)
+    if file_id is None or (file_id == _snapshot['file'] and _snapshot['current'] is not None):
+        return None
+    _snapshot['file'] = file_id
+    snapshot, current = load_snapshot(path), _snapshot['current']
+    if snapshot is None or (current is not None and snapshot.version < current.version):
+        return None
+    _snapshot['current'] = snapshot
+    return snapshot
+
+
+def rebuild_catalog_snapshot():
+    """
+    Builds a snapshot, writes the file and makes it this process's. Returns
+    None without building if another worker already holds the rebuild lock.
+    """
+    if not cache.add(REBUILD_LOCK_KEY, os.getpid(), REBUILD_LOCK_TIMEOUT):
+        return None
+    try:
+        snapshot = build_snapshot()
+    finally:
+        cache.delete(REBUILD_LOCK_KEY)
+    with _snapshot_lock:
+        _snapshot['current'] = snapshot
+        _snapshot['file'] = _file_id(settings.CATALOG_SNAPSHOT_PATH)
+    return snapshot
+
+
+def _rebuild_in_background():
+    try:
+        rebuild_catalog_snapshot()
+    finally:
+        # This thread's database connection
+        connections.close_all()
+        with _snapshot_lock:
+            _snapshot['rebuild'] = None
+
+
+def _start_rebuild():
+    """Starts a background rebuild unless one is already running here; call with the lock held."""
+    if _snapshot['rebuild'] is None:
+        thread = _snapshot['rebuild'] = threading.Thread(
+            target=_rebuild_in_background, name='catalog-snapshot-rebuild', daemon=True)
+        thread.start()
+
+
+def get_catalog_snapshot(wait=False):
+    """
+    This process's snapshot, or the file on disk if another worker has
+    replaced it since. When that is older than the catalog, a rebuild starts
+    in the background and the current one is returned meanwhile, unless
+    `wait` is set (or CATALOG_SNAPSHOT_BACKGROUND_REBUILD is off), in which
+    case the rebuild runs first. Only builds inline if there is no snapshot
+    at all yet.
+    """
+    version = catalog_version()
+    with _snapshot_lock:
+        snapshot = _snapshot['current']
+        if snapshot is None or snapshot.version != version:
+            snapshot = _reload_file() or snapshot
+        if snapshot is not None and snapshot.version != version:
+            if not wait and settings.CATALOG_SNAPSHOT_BACKGROUND_REBUILD:
+                _start_rebuild()
+                return snapshot
+            snapshot = None
+        if snapshot is not None:
+            return snapshot
+        snapshot = _snapshot['current'] = build_snapshot()
+        _snapshot['file'] = _file_id(settings.CATALOG_SNAPSHOT_PATH)
+        return snapshot
+
+
+def latest_catalog_snapshot():
+    """
+    This process's snapshot, else the file on disk, even when the catalog
+    has changed since; only builds one if there is neither. For work that
+    can use a slightly stale catalog and should not cost a version query.
+    """
+    with _snapshot_lock:
+        if _snapshot['current'] is None:
+            _reload_file()
+        snapshot = _snapshot['current']
+    return snapshot if snapshot is not None else get_catalog_snapshot()
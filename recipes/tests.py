@@ -1,3 +1,1436 @@
-from django.test import TestCase
+import csv
+import gzip
+import io
+import json
+import os
+import random
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from datetime import date
+from unittest import mock, skipUnless
 
-# Create your tests here.
+import numpy as np
+from django.conf import settings
+from django.contrib import admin
+from django.contrib.auth.models import User
+from django.core.cache import cache
+from django.core.management import call_command
+from django.db import connection, connections, transaction
+from django.http import Http404, HttpResponse, JsonResponse
+from django.test.utils import CaptureQueriesContext
+from django.test import LiveServerTestCase, RequestFactory, SimpleTestCase, TestCase, TransactionTestCase, override_settings
+from rest_framework.authtoken.models import Token
+from rest_framework.renderers import JSONRenderer
+from rest_framework.test import APIClient
+
+from core.views import frontend_asset
+
+from .admin import RecipeAdmin
+from .middleware import CompressionMiddleware, ReplicaRoutingMiddleware
+from .catalog import bump_catalog_version, defer_catalog_version
+from .compression import brotli, choose_encoding
+from .concurrency import CacheSemaphore, SemaphoreFull
+from .export import available_formats
+from .fake_gemini import FakeGeminiConfig, FakeGeminiServer, parse_latency
+from .dedup import find_duplicate, index_recipe, recipe_signature, similarity
+from .facets import rebuild_facets
+from .loadgen import format_report, parse_mix, prepare_users, run_load, summarize
+from .models import DietaryPreference, FacetCount, Ingredient, MealPlan, Recipe, ShoppingListItem, RecipeIngredient, RecipeNutrition, RecipeSignature, RecommendationFeed
+from .nutrition import parse_nutrition
+from .planner import RecipeMatrix, plan_meals, shopping_list_size
+from .renderers import FastJSONRenderer
+from .serializers import RecipeSerializer, recipe_representations
+from .throttles import GenerationGlobalThrottle, GenerationUserThrottle
+from . import autocomplete, gemini, planner, recommendations, snapshot, views
+from .routers import PrimaryReplicaRouter, allow_replica_reads
+
+
+CSV_HEADERS = ['recipe_name', 'total_time', 'ingredients',
+               'directions', 'cuisine_path', 'nutrition']
+
+
+def write_recipes_csv(rows):
+    """Writes rows (dicts keyed by CSV_HEADERS) to a temp CSV and returns its path."""
+    handle, path = tempfile.mkstemp(suffix='.csv')
+    with os.fdopen(handle, 'w', encoding='utf-8', newline='') as file:
+        writer = csv.DictWriter(file, fieldnames=CSV_HEADERS)
+        writer.writeheader()
+        writer.writerows(rows)
+    return path
+
+
+def sample_row(num):
+    return {
+        'recipe_name': f'Recipe {num}',
+        'total_time': '30 mins',
+        'ingredients': '2 cups flour, 1 egg',
+        'directions': 'Mix and bake.',
+        'cuisine_path': '/Desserts/Pies/',
+        'nutrition': '',
+    }
+
+
+class PausingStream(io.StringIO):
+    """Stdout for load_recipes that pauses mid-transaction on a given row."""
+
+    def __init__(self, pause_on, paused, resume):
+        super().__init__()
+        self.pause_on = pause_on
+        self.paused = paused
+        self.resume = resume
+
+    def write(self, text):
+        if self.pause_on in text and not self.paused.is_set():
+            self.paused.set()
+            self.resume.wait(timeout=10)
+        return super().write(text)
+
+
+class LoaderConcurrencyTests(TransactionTestCase):
+
+    def setUp(self):
+        self.user = User.objects.create_user('loader', password='x')
+        Recipe.objects.create(user=self.user, title='Existing',
+                              instructions='Already here.')
+
+    def test_readers_not_blocked_while_loader_holds_write_transaction(self):
+        if connection.vendor == 'sqlite':
+            with connection.cursor() as cursor:
+                cursor.execute('PRAGMA journal_mode')
+                self.assertEqual(cursor.fetchone()[0], 'wal')
+
+        csv_path = write_recipes_csv([sample_row(n) for n in range(1, 6)])
+        self.addCleanup(os.remove, csv_path)
+        paused, resume = threading.Event(), threading.Event()
+        errors = []
+
+        def run_loader():
+            try:
+                call_command('load_recipes', csv_path, user='loader',
+                             stdout=PausingStream('row 3', paused, resume), stderr=io.StringIO())
+            except Exception as exc:  # Surface failures in the main thread
+                errors.append(exc)
+            finally:
+                connections.close_all()
+
+        loader = threading.Thread(target=run_loader)
+        loader.start()
+        try:
+            self.assertTrue(paused.wait(timeout=10))
+            started = time.monotonic()
+            # Uncommitted loader rows are invisible, but the read must not wait
+            self.assertEqual(Recipe.objects.count(), 1)
+            self.assertLess(time.monotonic() - started, 1)
+        finally:
+            resume.set()
+            loader.join(timeout=30)
+
+        self.assertEqual(errors, [])
+        self.assertEqual(Recipe.objects.count(), 6)
+
+
+@override_settings(DATABASE_REPLICAS=['replica_1'])
+class ReplicaRoutingTests(SimpleTestCase):
+    # Not TestCase: its wrapping transaction would pin every read to the primary
+    databases = {'default'}
+
+    def setUp(self):
+        cache.clear()
+        self.router = PrimaryReplicaRouter()
+        self.factory = RequestFactory()
+
+    def route(self, method, auth='Token abc', status=200):
+        """Runs a request through the middleware and returns the read alias it saw."""
+        seen = []
+
+        def view(request):
+            seen.append(self.router.db_for_read(Recipe))
+            return HttpResponse(status=status)
+
+        request = getattr(self.factory, method)(
+            '/api/recipes/', HTTP_AUTHORIZATION=auth)
+        ReplicaRoutingMiddleware(view)(request)
+        return seen[0]
+
+    def test_reads_default_to_primary_outside_requests(self):
+        self.assertEqual(self.router.db_for_read(Recipe), 'default')
+        self.assertEqual(self.router.db_for_write(Recipe), 'default')
+
+    def test_get_reads_from_replica(self):
+        self.assertEqual(self.route('get'), 'replica_1')
+
+    def test_writes_and_atomic_blocks_stay_on_primary(self):
+        self.assertEqual(self.route('post'), 'default')
+        with allow_replica_reads(), transaction.atomic():
+            self.assertEqual(self.router.db_for_read(Recipe), 'default')
+
+    def test_writer_reads_own_writes_from_primary(self):
+        self.route('post')
+        self.assertEqual(self.route('get'), 'default')
+        self.assertEqual(self.route('get', auth='Token other'), 'replica_1')
+
+    def test_failed_write_does_not_pin(self):
+        self.route('post', status=400)
+        self.assertEqual(self.route('get'), 'replica_1')
+
+
+@override_settings(DATABASE_REPLICAS=['replica_test'])
+class ReplicaConnectionTests(TransactionTestCase):
+    """Real requests, checking which connection their queries run on."""
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        # A second connection to the test database stands in for the replica.
+        # Added here rather than in settings, and to `databases` only now,
+        # because the runner checks every alias before classes are set up.
+        connections.settings['replica_test'] = {**connections['default'].settings_dict}
+        cls.databases = {*cls.databases, 'replica_test'}
+
+    @classmethod
+    def tearDownClass(cls):
+        super().tearDownClass()
+        connections['replica_test'].close()
+        del connections['replica_test']
+        del connections.settings['replica_test']
+
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create_user('reader', password='x')
+        Recipe.objects.create(user=self.user, title='Soup', instructions='-')
+        self.client = APIClient()
+        self.client.credentials(HTTP_AUTHORIZATION=f'Token {Token.objects.create(user=self.user).key}')
+
+    def queries(self, method, path, data=None):
+        """{alias: number of queries} while handling one request."""
+        with CaptureQueriesContext(connections['default']) as primary, \
+                CaptureQueriesContext(connections['replica_test']) as replica:
+            response = getattr(self.client, method)(path, data, format='json')
+        self.assertLess(response.status_code, 400, response.content)
+        return {'default': len(primary), 'replica_test': len(replica)}
+
+    def test_reads_use_the_replica_connection(self):
+        counts = self.queries('get', '/api/recipes/')
+        self.assertEqual(counts['default'], 0)
+        self.assertGreater(counts['replica_test'], 0)
+
+    def test_writer_is_pinned_to_the_primary(self):
+        counts = self.queries('post', '/api/recipes/', {'title': 'Stew', 'instructions': '-'})
+        self.assertEqual(counts['replica_test'], 0)
+        # The writer's next reads see their own write on the primary...
+        counts = self.queries('get', '/api/recipes/')
+        self.assertEqual(counts['replica_test'], 0)
+        self.assertGreater(counts['default'], 0)
+        # ...until the pin expires
+        cache.clear()
+        self.assertEqual(self.queries('get', '/api/recipes/')['default'], 0)
+
+
+class NutritionParsingTests(SimpleTestCase):
+
+    def test_parses_macros_and_estimates_calories(self):
+        values = parse_nutrition(
+            'Total Fat 18g 23%, Sodium 1,128mg 6%, Total Carbohydrate 60g 22%, '
+            'Protein 4g, Vitamin C 8mg 42%')
+        self.assertEqual(values, {
+            'total_fat_g': 18, 'sodium_mg': 1128, 'carbohydrate_g': 60,
+            'protein_g': 4, 'calories': 418,
+        })
+
+    def test_empty_and_unknown_input(self):
+        self.assertEqual(parse_nutrition(''), {})
+        self.assertEqual(parse_nutrition('Vitamin C 8mg 42%'), {})
+
+
+class FacetCountTests(TestCase):
+
+    def setUp(self):
+        self.user = User.objects.create_user('facets', password='x')
+
+    def counts(self):
+        return {(f.facet, f.value): f.count for f in FacetCount.objects.filter(count__gt=0)}
+
+    def test_counts_follow_recipe_changes(self):
+        recipe = Recipe.objects.create(
+            user=self.user, title='Pie', instructions='Bake.',
+            cuisine='French', cooking_time_minutes=45)
+        RecipeNutrition.objects.create(recipe=recipe, calories=350)
+        vegan = DietaryPreference.objects.create(name='Vegan')
+        recipe.dietary_preferences.add(vegan)
+        self.assertEqual(self.counts(), {
+            ('cuisine', 'French'): 1,
+            ('cooking_time', '30-60 min'): 1,
+            ('calories', '200-400 kcal'): 1,
+            ('dietary_preference', 'Vegan'): 1,
+        })
+
+        recipe.cuisine = 'Italian'
+        recipe.save()
+        vegan.recipe_set.clear()
+        recipe.nutrition.delete()
+        self.assertEqual(self.counts(), {
+            ('cuisine', 'Italian'): 1,
+            ('cooking_time', '30-60 min'): 1,
+        })
+
+        recipe.delete()
+        self.assertEqual(self.counts(), {})
+
+    def test_incremental_counts_match_rebuild(self):
+        for num in range(5):
+            recipe = Recipe.objects.create(
+                user=self.user, title=f'Recipe {num}', instructions='Cook.',
+                cuisine='Mexican' if num % 2 else 'Thai', cooking_time_minutes=10 * num)
+            RecipeNutrition.objects.create(recipe=recipe, calories=150 * num)
+        incremental = self.counts()
+        rebuild_facets()
+        self.assertEqual(self.counts(), incremental)
+
+    def test_facets_endpoint(self):
+        Recipe.objects.create(user=self.user, title='Taco', instructions='Fold.',
+                              cuisine='Mexican', cooking_time_minutes=10)
+        client = APIClient()
+        client.force_authenticate(self.user)
+        response = client.get('/api/recipes/facets/')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data['cuisine'], [{'value': 'Mexican', 'count': 1}])
+        self.assertEqual(response.data['cooking_time'], [{'value': 'Under 15 min', 'count': 1}])
+
+
+class MealPlannerTests(SimpleTestCase):
+
+    def test_prefers_recipes_that_share_ingredients(self):
+        matrix = RecipeMatrix.from_rows(
+            recipe_ids=[1, 2, 3, 4],
+            minutes=[20, 20, 20, 20],
+            calories=[None] * 4,
+            ingredient_lists=[[1, 2, 3], [1, 2, 4], [5, 6, 7], [1, 2, 3, 4]])
+        days = plan_meals(matrix, num_days=3)
+        rows = sorted(row for day in days for row in day)
+        self.assertEqual(rows, [0, 1, 3])
+        self.assertEqual(shopping_list_size(matrix, rows), 4)
+
+    def test_respects_daily_time_budget(self):
+        matrix = RecipeMatrix.from_rows(
+            recipe_ids=[1, 2, 3],
+            minutes=[90, 30, None],
+            calories=[None] * 3,
+            ingredient_lists=[[1, 2, 3]] * 3)
+        self.assertEqual(plan_meals(matrix, 1, max_minutes_per_day=60), [[1]])
+        with self.assertRaises(ValueError):
+            plan_meals(matrix, 2, max_minutes_per_day=60)
+
+    def test_week_from_100k_candidates_under_a_second(self):
+        import numpy as np
+        rng = np.random.default_rng(0)
+        num_recipes = 100_000
+        weights = 1 / np.arange(1, 5001)
+        sizes = rng.integers(3, 16, num_recipes)
+        # Zipf-like ingredient popularity, deduplicated within each recipe
+        flat = rng.choice(5000, sizes.sum(), p=weights / weights.sum()).tolist()
+        ends = np.cumsum(sizes).tolist()
+        ingredient_lists = [list(set(flat[end - size:end])) for end, size in zip(ends, sizes.tolist())]
+        matrix = RecipeMatrix.from_rows(
+            range(num_recipes), rng.integers(5, 120, num_recipes).tolist(),
+            rng.integers(100, 900, num_recipes).tolist(), ingredient_lists)
+
+        started = time.perf_counter()
+        days = plan_meals(matrix, 7, meals_per_day=3, max_minutes_per_day=120,
+                          calories_per_day=2000)
+        self.assertLess(time.perf_counter() - started, 1)
+        self.assertEqual(len({row for day in days for row in day}), 21)
+        for day in days:
+            self.assertLessEqual(matrix.minutes[day].sum(), 120)
+
+
+def use_temp_snapshot(test):
+    """
+    Points CATALOG_SNAPSHOT_PATH at a temp dir and drops cached snapshots. The
+    catalog is the recipes of a user named "chef".
+    """
+    directory = tempfile.TemporaryDirectory()
+    test.addCleanup(directory.cleanup)
+    path = os.path.join(directory.name, 'catalog.snapshot')
+    # Rebuilt and rescored inline: a background thread would not see the test's transaction
+    overridden = override_settings(CATALOG_SNAPSHOT_PATH=path, CATALOG_SNAPSHOT_BACKGROUND_REBUILD=False,
+                                   RECOMMENDATIONS_BACKGROUND_REFRESH=False, CATALOG_OWNER='chef')
+    overridden.enable()
+    test.addCleanup(overridden.disable)
+    for cached in (snapshot._snapshot, planner._catalog, autocomplete._index, recommendations._features):
+        patcher = mock.patch.dict(cached, dict.fromkeys(cached))
+        patcher.start()
+        test.addCleanup(patcher.stop)
+    return path
+
+
+class MealPlanOptimizePerformanceTests(TestCase):
+    """The whole optimize request over a 100k recipe catalog."""
+    PLAN = {'start_date': '2026-01-05', 'end_date': '2026-01-11', 'meals_per_day': 3,
+            'max_minutes_per_day': 120, 'calories_per_day': 2000}
+
+    @classmethod
+    def setUpTestData(cls):
+        rng = np.random.default_rng(0)
+        num_recipes, num_ingredients = 100_000, 5000
+        cls.user = User.objects.create_user('bulk-planner', password='x')
+        chef = User.objects.create_user('chef', password='x')
+        Ingredient.objects.bulk_create(Ingredient(name=f'ingredient {i}') for i in range(num_ingredients))
+        Recipe.objects.bulk_create(
+            (Recipe(user=chef, title=f'Recipe {i}', instructions='-', cooking_time_minutes=minutes)
+             for i, minutes in enumerate(rng.integers(5, 120, num_recipes).tolist())), batch_size=5000)
+        recipe_ids = list(Recipe.objects.order_by('id').values_list('id', flat=True))
+        ingredient_ids = np.array(Ingredient.objects.order_by('id').values_list('id', flat=True))
+        weights = 1 / np.arange(1, num_ingredients + 1)
+        links = []
+        for recipe_id, size in zip(recipe_ids, rng.integers(3, 16, num_recipes).tolist()):
+            # Zipf-like ingredient popularity, deduplicated within each recipe
+            for ingredient_id in set(rng.choice(ingredient_ids, size, p=weights / weights.sum()).tolist()):
+                links.append((recipe_id, ingredient_id, '1'))
+        with connection.cursor() as cursor:
+            cursor.executemany(
+                f'INSERT INTO {RecipeIngredient._meta.db_table} (recipe_id, ingredient_id, quantity) '
+                'VALUES (%s, %s, %s)', links)
+        RecipeNutrition.objects.bulk_create(
+            (RecipeNutrition(recipe_id=recipe_id, calories=calories)
+             for recipe_id, calories in zip(recipe_ids, rng.integers(100, 900, num_recipes).tolist())),
+            batch_size=5000)
+        bump_catalog_version()
+
+    def setUp(self):
+        use_temp_snapshot(self)
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def optimize(self):
+        started = time.perf_counter()
+        response = self.client.post('/api/meal-plans/optimize/', self.PLAN, format='json')
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(len(set(sum((day['recipe_ids'] for day in response.data['days']), []))), 21)
+        return time.perf_counter() - started
+
+    def test_warm_snapshot_request_under_a_second(self):
+        self.optimize()  # Builds the snapshot and matrix
+        self.assertLess(self.optimize(), 1)
+
+    def test_request_after_catalog_change_does_not_wait_for_rebuild(self):
+        self.optimize()
+        with self.captureOnCommitCallbacks(execute=True):
+            Recipe.objects.create(user=User.objects.get(username='chef'), title='Just added', instructions='-')
+        rebuilt = threading.Event()
+
+        def slow_build():
+            rebuilt.wait(timeout=10)
+            return snapshot._snapshot['current']
+
+        with override_settings(CATALOG_SNAPSHOT_BACKGROUND_REBUILD=True), \
+                mock.patch.object(snapshot, 'build_snapshot', side_effect=slow_build):
+            self.assertLess(self.optimize(), 1)
+            rebuilt.set()
+            snapshot._snapshot['rebuild'].join(timeout=10)
+
+
+class MealPlanOptimizeAPITests(TestCase):
+
+    def setUp(self):
+        use_temp_snapshot(self)
+        self.user = User.objects.create_user('planner', password='x')
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+        chef = User.objects.create_user('chef', password='x')
+        flour, egg, milk = (Ingredient.objects.create(name=name) for name in ('flour', 'egg', 'milk'))
+        for num in range(4):
+            recipe = Recipe.objects.create(user=chef, title=f'Bake {num}',
+                                           instructions='Bake.', cooking_time_minutes=30)
+            for ingredient in (flour, egg, milk):
+                RecipeIngredient.objects.create(recipe=recipe, ingredient=ingredient, quantity='1 cup')
+
+    def test_creates_plan_and_shopping_list(self):
+        response = self.client.post('/api/meal-plans/optimize/', {
+            'start_date': '2026-01-05', 'end_date': '2026-01-07', 'max_minutes_per_day': 45,
+        }, format='json')
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(len(response.data['days']), 3)
+        self.assertEqual(response.data['shopping_list_size'], 3)
+        plan = MealPlan.objects.get(pk=response.data['id'])
+        self.assertEqual(plan.recipes.count(), 3)
+        self.assertEqual(plan.shopping_list_items.get(ingredient__name='egg').quantity,
+                         '1 cup + 1 cup + 1 cup')
+
+    def test_never_plans_other_users_recipes(self):
+        vegan = DietaryPreference.objects.create(name='Vegan')
+        private = Recipe.objects.create(user=User.objects.create_user('neighbour', password='x'),
+                                        title='Secret bake', instructions='-', cooking_time_minutes=30)
+        private.dietary_preferences.add(vegan)
+        for ingredient in Ingredient.objects.all():
+            RecipeIngredient.objects.create(recipe=private, ingredient=ingredient, quantity='1 cup')
+        plan = {'start_date': '2026-01-05', 'end_date': '2026-01-08'}
+        response = self.client.post('/api/meal-plans/optimize/', plan, format='json')
+        self.assertEqual(response.status_code, 201)
+        self.assertNotIn(private.id, MealPlan.objects.get(pk=response.data['id']).recipes.values_list('id', flat=True))
+        self.assertNotContains(response, 'Secret bake', status_code=201)
+        # Five days need the private recipe, as does a vegan plan
+        plan['end_date'] = '2026-01-09'
+        self.assertEqual(self.client.post('/api/meal-plans/optimize/', plan, format='json').status_code, 400)
+        response = self.client.post('/api/meal-plans/optimize/', {
+            'start_date': '2026-01-05', 'end_date': '2026-01-05', 'dietary_preferences': 'vegan'}, format='json')
+        self.assertEqual(response.status_code, 400)
+        self.assertIn('Not enough recipes', response.data['error'])
+
+    def test_rejects_unfillable_plan(self):
+        response = self.client.post('/api/meal-plans/optimize/', {
+            'start_date': '2026-01-05', 'end_date': '2026-01-11',
+        }, format='json')
+        self.assertEqual(response.status_code, 400)
+
+
+class RecipeFastPathTests(TestCase):
+
+    def setUp(self):
+        self.user = User.objects.create_user('fast', password='x')
+        salt, flour = Ingredient.objects.create(name='salt'), Ingredient.objects.create(name='flour')
+        vegan, quick = (DietaryPreference.objects.create(name=name) for name in ('Vegan', 'Quick'))
+        self.full = Recipe.objects.create(
+            user=self.user, title='Bread \u2028 é', instructions='Knead.\nBake "well".',
+            cooking_time_minutes=90, cuisine='French', generated_by_ai=True)
+        # Link rows out of id order to check ordering matches the serializer
+        RecipeIngredient.objects.create(recipe=self.full, ingredient=flour, quantity='2 cups')
+        RecipeIngredient.objects.create(recipe=self.full, ingredient=salt, quantity='1 pinch')
+        self.full.dietary_preferences.add(quick)
+        self.full.dietary_preferences.add(vegan)
+        RecipeNutrition.objects.create(recipe=self.full, calories=250, protein_g=8.5)
+        self.bare = Recipe.objects.create(user=self.user, title='Water', instructions='Pour.')
+
+    def assertSameBytes(self, fast_data, slow_data):
+        self.assertEqual(FastJSONRenderer().render(fast_data), JSONRenderer().render(slow_data))
+
+    def test_matches_recipe_serializer(self):
+        queryset = Recipe.objects.order_by('-id')
+        self.assertSameBytes(recipe_representations(queryset),
+                             RecipeSerializer(queryset, many=True).data)
+        self.assertSameBytes(recipe_representations([self.bare, self.full]),
+                             RecipeSerializer([self.bare, self.full], many=True).data)
+
+    def test_list_and_detail_endpoints(self):
+        client = APIClient()
+        client.force_authenticate(self.user)
+        response = client.get('/api/recipes/')
+        self.assertEqual(response.content, JSONRenderer().render(
+            RecipeSerializer(Recipe.objects.order_by('-id'), many=True).data))
+        response = client.get(f'/api/recipes/{self.full.pk}/')
+        self.assertEqual(response.content, JSONRenderer().render(RecipeSerializer(self.full).data))
+
+    def test_renderer_matches_json_renderer(self):
+        data = {'when': date(2026, 1, 5), 'title': 'Line\u2028break'}
+        self.assertEqual(FastJSONRenderer().render(data), JSONRenderer().render(data))
+        self.assertEqual(
+            FastJSONRenderer().render(data, 'application/json; indent=2'),
+            JSONRenderer().render(data, 'application/json; indent=2'))
+
+
+class CompressionTests(SimpleTestCase):
+
+    def setUp(self):
+        self.factory = RequestFactory()
+        self.payload = [{'instructions': 'Stir the sauce slowly. ' * 20, 'id': n} for n in range(20)]
+
+    def respond(self, accept_encoding, payload):
+        request = self.factory.get('/api/recipes/', HTTP_ACCEPT_ENCODING=accept_encoding)
+        return CompressionMiddleware(lambda request: JsonResponse(payload, safe=False))(request)
+
+    def test_choose_encoding(self):
+        self.assertEqual(choose_encoding('gzip, deflate', ('br', 'gzip')), 'gzip')
+        self.assertEqual(choose_encoding('gzip;q=0.5, br', ('br', 'gzip')), 'br')
+        self.assertEqual(choose_encoding('br;q=0, *', ('br', 'gzip')), 'gzip')
+        self.assertIsNone(choose_encoding('identity', ('br', 'gzip')))
+
+    def test_gzips_large_json(self):
+        response = self.respond('gzip', self.payload)
+        self.assertEqual(response['Content-Encoding'], 'gzip')
+        self.assertIn('Accept-Encoding', response['Vary'])
+        original = JsonResponse(self.payload, safe=False).content
+        self.assertEqual(gzip.decompress(response.content), original)
+        self.assertLess(len(response.content) * 5, len(original))
+
+    def test_brotli_when_preferred(self):
+        if brotli is None:
+            self.skipTest('brotli is not installed')
+        response = self.respond('gzip, br', self.payload)
+        self.assertEqual(response['Content-Encoding'], 'br')
+        self.assertEqual(brotli.decompress(response.content),
+                         JsonResponse(self.payload, safe=False).content)
+
+    def test_small_or_unaccepted_responses_untouched(self):
+        self.assertFalse(self.respond('gzip', {'id': 1}).has_header('Content-Encoding'))
+        self.assertFalse(self.respond('', self.payload).has_header('Content-Encoding'))
+
+
+class FrontendServingTests(SimpleTestCase):
+
+    def setUp(self):
+        self.dist = tempfile.TemporaryDirectory()
+        self.addCleanup(self.dist.cleanup)
+        os.makedirs(os.path.join(self.dist.name, 'assets'))
+        with open(os.path.join(self.dist.name, 'index.html'), 'w') as file:
+            file.write('<div id="root"></div>')
+        self.script = 'console.log("recipes");\n' * 200
+        with open(os.path.join(self.dist.name, 'assets', 'index-Bx3k9QeA.js'), 'w') as file:
+            file.write(self.script)
+        call_command('compress_frontend', dir=self.dist.name, stdout=io.StringIO())
+        settings_override = override_settings(FRONTEND_DIST_DIR=self.dist.name)
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+
+    def test_hashed_asset_served_precompressed_and_immutable(self):
+        response = self.client.get('/static/assets/index-Bx3k9QeA.js', HTTP_ACCEPT_ENCODING='gzip')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response['Content-Encoding'], 'gzip')
+        self.assertEqual(response['Content-Type'], 'text/javascript')
+        self.assertNotIn('Content-Disposition', response)
+        self.assertIn('immutable', response['Cache-Control'])
+        self.assertEqual(gzip.decompress(b''.join(response.streaming_content)).decode(), self.script)
+
+    def test_index_served_for_app_routes(self):
+        for url in ('/', '/recipes/5'):
+            response = self.client.get(url)
+            self.assertEqual(response.status_code, 200)
+            self.assertEqual(response['Cache-Control'], 'no-cache')
+            self.assertEqual(b''.join(response.streaming_content), b'<div id="root"></div>')
+
+    def test_admin_and_api_paths_not_served_index(self):
+        response = self.client.get('/admin')
+        self.assertEqual(response.status_code, 301)
+        self.assertEqual(response['Location'], '/admin/')
+        self.assertEqual(self.client.get('/api').status_code, 404)
+        # Only the exact prefixes are reserved
+        self.assertEqual(self.client.get('/administrators').status_code, 200)
+
+    def test_missing_and_escaping_paths_404(self):
+        self.assertEqual(self.client.get('/static/assets/missing.js').status_code, 404)
+        with self.assertRaises(Http404):
+            frontend_asset(RequestFactory().get('/'), '../manage.py')
+
+
+def gemini_reply(recipes):
+    """A fake requests.Response for a Gemini generateContent call."""
+    reply = mock.Mock()
+    reply.json.return_value = {
+        'candidates': [{'content': {'parts': [{'text': json.dumps(recipes)}]}}]}
+    return reply
+
+
+class GenerationLimitTests(TestCase):
+
+    def setUp(self):
+        cache.clear()
+        use_temp_snapshot(self)
+        self.user = User.objects.create_user('generator', password='x')
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+        env = mock.patch.dict(os.environ, {'GEMINI_API_KEY': 'test-key'})
+        env.start()
+        self.addCleanup(env.stop)
+
+    def generate(self, **data):
+        return self.client.post('/api/generate-recipe/', data, format='json')
+
+    def test_num_recipes_is_validated(self):
+        for bad in (0, 6, 'lots'):
+            self.assertEqual(self.generate(num_recipes=bad).status_code, 400)
+
+    @mock.patch('requests.Session.post')
+    def test_generates_and_saves_recipe(self, post):
+        post.return_value = gemini_reply([{
+            'title': 'Soup', 'instructions': 'Simmer.', 'cooking_time_minutes': 20,
+            'cuisine': 'French', 'ingredients': [{'name': 'Leek', 'quantity': '2'}]}])
+        response = self.generate(num_recipes=1, ingredients='leek')
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(response.data[0]['ingredients'][0]['ingredient_name'], 'leek')
+        self.assertEqual(post.call_args.kwargs['timeout'], settings.GEMINI_TIMEOUT)
+
+    @mock.patch('requests.Session.post')
+    def test_user_bucket_charges_per_recipe(self, post):
+        post.return_value = gemini_reply([])
+        with mock.patch.object(GenerationUserThrottle, 'timer', return_value=1000.0):
+            # Burst of 5 recipes, then empty until the bucket refills
+            self.assertEqual(self.generate(num_recipes=3).status_code, 201)
+            self.assertEqual(self.generate(num_recipes=2).status_code, 201)
+            response = self.generate(num_recipes=1)
+        self.assertEqual(response.status_code, 429)
+        self.assertIn('Retry-After', response)
+
+    @mock.patch('requests.Session.post')
+    def test_sheds_load_when_gemini_slots_are_full(self, post):
+        post.return_value = gemini_reply([])
+        full = CacheSemaphore('gemini', size=1, max_queue=0, queue_timeout=3, lease=60)
+        with mock.patch.object(views, 'gemini_semaphore', full), full.slot():
+            response = self.generate(num_recipes=1)
+        self.assertEqual(response.status_code, 429)
+        self.assertEqual(response['Retry-After'], '3')
+        post.assert_not_called()
+
+    @mock.patch('requests.Session.post')
+    def test_denied_requests_do_not_spend_the_user_budget(self, post):
+        post.return_value = gemini_reply([])
+        full = CacheSemaphore('gemini', size=1, max_queue=0, queue_timeout=1, lease=60)
+        with mock.patch.object(GenerationUserThrottle, 'timer', return_value=1000.0), \
+                mock.patch.object(GenerationGlobalThrottle, 'timer', return_value=1000.0):
+            with mock.patch.object(views, 'gemini_semaphore', full), full.slot():
+                self.assertEqual(self.generate(num_recipes=5).status_code, 429)
+            # Global bucket empty for the next hour
+            cache.set('throttle_generation_global_all', 1000.0 + 3600, 3600)
+            self.assertEqual(self.generate(num_recipes=5).status_code, 429)
+            cache.delete('throttle_generation_global_all')
+            # Neither denial used up the user's burst of 5
+            self.assertEqual(self.generate(num_recipes=5).status_code, 201)
+
+
+class CacheSemaphoreTests(SimpleTestCase):
+
+    def setUp(self):
+        cache.clear()
+
+    def test_waiter_gets_slot_when_released(self):
+        semaphore = CacheSemaphore('test', size=1, max_queue=1, queue_timeout=5, lease=60)
+        acquired = threading.Event()
+
+        def waiter():
+            with semaphore.slot():
+                acquired.set()
+
+        with semaphore.slot():
+            thread = threading.Thread(target=waiter)
+            thread.start()
+            self.assertFalse(acquired.wait(timeout=0.1))
+        thread.join(timeout=5)
+        self.assertTrue(acquired.is_set())
+
+    def test_times_out_when_slots_stay_busy(self):
+        semaphore = CacheSemaphore('test', size=1, max_queue=1, queue_timeout=0.1, lease=60)
+        with semaphore.slot():
+            with self.assertRaises(SemaphoreFull):
+                with semaphore.slot():
+                    pass
+        # The slot is free again afterwards
+        with semaphore.slot():
+            pass
+
+
+class NearDuplicateTests(TestCase):
+
+    def setUp(self):
+        cache.clear()
+        use_temp_snapshot(self)
+        self.user = User.objects.create_user('dedup', password='x')
+
+    def row(self, title, ingredients):
+        return dict(sample_row(0), recipe_name=title, ingredients=ingredients)
+
+    def load(self, rows, **options):
+        csv_path = write_recipes_csv(rows)
+        self.addCleanup(os.remove, csv_path)
+        call_command('load_recipes', csv_path, user='dedup', stdout=io.StringIO(), stderr=io.StringIO(), **options)
+
+    def test_signature_similarity(self):
+        names = ['flour', 'butter', 'sugar', 'eggs', 'vanilla', 'salt', 'milk']
+        base = recipe_signature('Classic Butter Cake', names)
+        self.assertEqual(similarity(base, recipe_signature('classic butter-cake!', names)), 1.0)
+        self.assertGreater(similarity(base, recipe_signature('Classic Butter Cake', names[:-1])), 0.6)
+        self.assertLess(similarity(base, recipe_signature('Beef Stew', ['beef', 'carrot', 'onion'])), 0.2)
+
+    def test_loader_skips_duplicates_by_default(self):
+        ingredients = '2 cups flour, 1 cup sugar, 3 eggs, 1 cup butter, 1 tsp vanilla'
+        self.load([self.row('Pound Cake', ingredients), self.row('Pound cake', ingredients),
+                   self.row('Lemon Tart', '3 lemons, 1 cup sugar, 1 pastry crust')])
+        self.assertEqual(sorted(Recipe.objects.values_list('title', flat=True)),
+                         ['Lemon Tart', 'Pound Cake'])
+
+    def test_loader_links_duplicates(self):
+        ingredients = '2 cups flour, 1 cup sugar, 3 eggs, 1 cup butter, 1 tsp vanilla'
+        self.load([self.row('Pound Cake', ingredients), self.row('Pound cake', ingredients)],
+                  duplicates='link')
+        original = Recipe.objects.get(title='Pound Cake')
+        self.assertEqual(Recipe.objects.get(title='Pound cake').duplicate_of, original)
+
+    def test_dedupe_command_links_existing_duplicates(self):
+        ingredients = '2 cups flour, 1 cup sugar, 3 eggs, 1 cup butter, 1 tsp vanilla'
+        self.load([self.row('Pound Cake', ingredients), self.row('Pound cake', ingredients)],
+                  duplicates='keep')
+        original, copy = Recipe.objects.order_by('id')
+        self.assertIsNone(copy.duplicate_of)
+        call_command('dedupe_recipes', stdout=io.StringIO())
+        copy.refresh_from_db()
+        self.assertEqual(copy.duplicate_of, original)
+        # Only the original stays in the index
+        names = list(original.ingredients.values_list('name', flat=True))
+        self.assertEqual(find_duplicate(recipe_signature('POUND CAKE', names)), original.id)
+        self.assertEqual(RecipeSignature.objects.count(), 1)
+
+    def test_dedupe_command_deletes_only_the_owners_own_copies(self):
+        ingredients = '2 cups flour, 1 cup sugar, 3 eggs, 1 cup butter, 1 tsp vanilla'
+        self.load([self.row('Pound Cake', ingredients), self.row('Pound cake', ingredients)],
+                  duplicates='keep')
+        original, own_copy = Recipe.objects.order_by('id')
+        private_copy = Recipe.objects.create(
+            user=User.objects.create_user('home_cook', password='x'), title='Pound cake!', instructions='-')
+        for link in original.recipeingredient_set.all():
+            RecipeIngredient.objects.create(recipe=private_copy, ingredient=link.ingredient, quantity='1')
+        stdout = io.StringIO()
+        call_command('dedupe_recipes', delete=True, stdout=stdout)
+        self.assertIn('Linked 1 and deleted 1', stdout.getvalue())
+        self.assertFalse(Recipe.objects.filter(pk=own_copy.pk).exists())
+        private_copy.refresh_from_db()
+        self.assertEqual(private_copy.duplicate_of, original)
+
+    @mock.patch('requests.Session.post')
+    def test_generation_returns_users_existing_recipe(self, post):
+        client = APIClient()
+        client.force_authenticate(self.user)
+        recipe = Recipe.objects.create(user=self.user, title='Leek Soup', instructions='Simmer.')
+        for name in ('leek', 'potato', 'stock'):
+            RecipeIngredient.objects.create(
+                recipe=recipe, ingredient=Ingredient.objects.create(name=name), quantity='1')
+        index_recipe(recipe, recipe_signature('Leek Soup', ['leek', 'potato', 'stock']))
+        post.return_value = gemini_reply([{
+            'title': 'Leek soup', 'instructions': 'Simmer slowly.', 'ingredients': [
+                {'name': name, 'quantity': '2'} for name in ('Leek', 'Potato', 'Stock')]}])
+        with mock.patch.dict(os.environ, {'GEMINI_API_KEY': 'test-key'}):
+            response = client.post('/api/generate-recipe/', {'num_recipes': 1}, format='json')
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(response.data[0]['id'], recipe.id)
+        self.assertEqual(Recipe.objects.count(), 1)
+
+
+class RecipeExportTests(TestCase):
+
+    def setUp(self):
+        self.user = User.objects.create_user('exporter', password='x')
+        self.other = User.objects.create_user('other', password='x')
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+        self.recipes = []
+        for num in range(3):
+            recipe = Recipe.objects.create(
+                user=self.user, title=f'Stew {num}', instructions='Simmer, then serve.',
+                cooking_time_minutes=40, cuisine='Irish')
+            for name in ('beef', 'carrot'):
+                ingredient, _ = Ingredient.objects.get_or_create(name=name)
+                RecipeIngredient.objects.create(recipe=recipe, ingredient=ingredient, quantity='1 lb')
+            self.recipes.append(recipe)
+        RecipeNutrition.objects.create(recipe=self.recipes[0], calories=500, protein_g=30.0)
+        Recipe.objects.create(user=self.other, title='Not mine', instructions='-')
+
+    def export(self, **params):
+        response = self.client.get('/api/recipes/export/', params)
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response.streaming)
+        return b''.join(response.streaming_content)
+
+    def test_ndjson_export_streams_own_recipes(self):
+        records = [json.loads(line) for line in self.export(format='ndjson').splitlines()]
+        self.assertEqual([r['title'] for r in records], ['Stew 0', 'Stew 1', 'Stew 2'])
+        self.assertEqual(records[0]['ingredients'], [
+            {'name': 'beef', 'quantity': '1 lb'}, {'name': 'carrot', 'quantity': '1 lb'}])
+        self.assertEqual((records[0]['calories'], records[0]['protein_g']), (500, 30.0))
+        self.assertIsNone(records[1]['calories'])
+
+    def test_csv_export_via_accept_header(self):
+        response = self.client.get('/api/recipes/export/', HTTP_ACCEPT='text/csv')
+        self.assertEqual(response['Content-Type'], 'text/csv; charset=utf-8')
+        rows = list(csv.DictReader(io.StringIO(b''.join(response.streaming_content).decode())))
+        self.assertEqual(len(rows), 3)
+        self.assertEqual(rows[0]['instructions'], 'Simmer, then serve.')
+        self.assertEqual(json.loads(rows[2]['ingredients'])[1]['name'], 'carrot')
+
+    @skipUnless('parquet' in available_formats(), 'pyarrow is not installed')
+    def test_parquet_export(self):
+        import pyarrow
+        import pyarrow.parquet
+
+        table = pyarrow.parquet.read_table(pyarrow.BufferReader(self.export(format='parquet')))
+        self.assertEqual(table.column('title').to_pylist(), ['Stew 0', 'Stew 1', 'Stew 2'])
+        self.assertEqual(table.column('ingredients').to_pylist()[0][0], {'name': 'beef', 'quantity': '1 lb'})
+
+    def test_staff_export_whole_catalog_in_small_chunks(self):
+        self.user.is_staff = True
+        self.user.save()
+        out = io.StringIO()
+        call_command('dump_recipes', chunk_size=2, stdout=out)
+        self.assertEqual(len(out.getvalue().splitlines()), 4)
+        self.assertEqual(len(self.export().splitlines()), 4)
+
+    def test_dump_recipes_writes_file(self):
+        handle, path = tempfile.mkstemp(suffix='.csv')
+        os.close(handle)
+        self.addCleanup(os.remove, path)
+        call_command('dump_recipes', output=path, user='exporter', stderr=io.StringIO())
+        with open(path, encoding='utf-8') as file:
+            self.assertEqual(len(list(csv.DictReader(file))), 3)
+
+
+class CatalogSnapshotTests(TestCase):
+
+    def setUp(self):
+        self.path = use_temp_snapshot(self)
+        self.user = User.objects.create_user('chef', password='x')
+        self.ingredients = [Ingredient.objects.create(name=name) for name in ('crème fraîche', 'leek', 'salt')]
+        for num, names in enumerate([(0, 1), (1, 2), (2,)]):
+            recipe = Recipe.objects.create(user=self.user, title=f'Gratin {num}', instructions='-',
+                                           cooking_time_minutes=10 * num or None)
+            for i in names:
+                RecipeIngredient.objects.create(recipe=recipe, ingredient=self.ingredients[i], quantity='1')
+
+    def test_round_trip_through_mapped_file(self):
+        built = snapshot.build_snapshot(self.path)
+        loaded = snapshot.load_snapshot(self.path)
+        self.assertEqual(loaded.version, snapshot.catalog_version())
+        for name, array in built.arrays.items():
+            np.testing.assert_array_equal(loaded.arrays[name], array, err_msg=name)
+        self.assertFalse(loaded.indices.flags.writeable)
+        self.assertEqual(loaded.title(2), 'Gratin 2')
+        self.assertEqual(loaded.ingredient_names(), ['crème fraîche', 'leek', 'salt'])
+        self.assertEqual([loaded.ingredient_name(i) for i in loaded.indices[loaded.indptr[0]:loaded.indptr[1]]],
+                         ['crème fraîche', 'leek'])
+
+        matrix = RecipeMatrix.from_snapshot(loaded)
+        reference = RecipeMatrix.from_rows(
+            matrix.recipe_ids, matrix.minutes, matrix.calories,
+            [loaded.ingredient_ids[matrix.row(i)] for i in range(len(matrix))])
+        self.assertEqual(matrix.entry_rows.tolist(), reference.entry_rows.tolist())
+        self.assertEqual(matrix.ingredient_counts.tolist(), [1, 2, 2])
+
+    def test_holds_catalog_recipes_with_cuisines_and_preferences(self):
+        vegan = DietaryPreference.objects.create(name='Vegan')
+        Recipe.objects.filter(title='Gratin 1').update(cuisine=' French')
+        Recipe.objects.get(title='Gratin 2').dietary_preferences.add(vegan)
+        Recipe.objects.create(user=User.objects.create_user('home-cook'), title='Private gratin', instructions='-')
+        built = snapshot.build_snapshot(self.path)
+        self.assertEqual([built.title(row) for row in range(len(built))], ['Gratin 0', 'Gratin 1', 'Gratin 2'])
+        self.assertEqual(built.cuisine_names(), ['french'])
+        self.assertEqual(built.cuisine_codes.tolist(), [1, 0, 1])
+        self.assertEqual(built.preference_ids.tolist(), [vegan.id])
+        self.assertEqual(built.preference_indptr.tolist(), [0, 0, 0, 1])
+
+    def test_rebuilds_when_catalog_changes(self):
+        first = snapshot.get_catalog_snapshot()
+        self.assertIs(snapshot.get_catalog_snapshot(), first)
+        # Another worker starting up maps the same file
+        with mock.patch.dict(snapshot._snapshot, current=None), \
+                mock.patch.object(snapshot, 'build_arrays') as build_arrays:
+            self.assertEqual(snapshot.get_catalog_snapshot().version, first.version)
+            build_arrays.assert_not_called()
+
+        with self.captureOnCommitCallbacks(execute=True):
+            Recipe.objects.create(user=self.user, title='Gratin 3', instructions='-')
+        second = snapshot.get_catalog_snapshot()
+        self.assertEqual(len(second), 4)
+        self.assertEqual(snapshot.load_snapshot(self.path).version, second.version)
+        self.assertEqual(len(planner.get_catalog_matrix()), 4)
+
+    def test_version_counts_committed_catalog_changes(self):
+        with self.assertNumQueries(1):
+            version = snapshot.catalog_version()
+        recipe = Recipe.objects.get(title='Gratin 1')
+        home_cook = User.objects.create_user('home-cook')
+        salt = Ingredient.objects.get(name='salt')
+        changes = [
+            lambda: Recipe.objects.filter(pk=recipe.pk).first().save(),
+            lambda: RecipeIngredient.objects.filter(recipe=recipe).first().delete(),
+            lambda: RecipeIngredient.objects.create(recipe=recipe, ingredient=self.ingredients[0], quantity='2'),
+            lambda: RecipeNutrition.objects.create(recipe=recipe, calories=300),
+            lambda: recipe.dietary_preferences.add(DietaryPreference.objects.create(name='Vegan')),
+            lambda: setattr(salt, 'name', 'sea salt') or salt.save(),
+            # Out of the catalog
+            lambda: setattr(recipe, 'user', home_cook) or recipe.save(),
+        ]
+        for change in changes:
+            with self.captureOnCommitCallbacks(execute=True):
+                change()
+            self.assertEqual(snapshot.catalog_version(), version + 1)
+            version += 1
+
+        # Once per deferred batch, after the commit
+        with self.captureOnCommitCallbacks() as callbacks, defer_catalog_version():
+            gratin = Recipe.objects.create(user=self.user, title='Gratin 4', instructions='-')
+            for ingredient in self.ingredients:
+                RecipeIngredient.objects.create(recipe=gratin, ingredient=ingredient, quantity='1')
+        self.assertEqual(snapshot.catalog_version(), version)
+        self.assertEqual(len(callbacks), 1)
+        # Private recipes and new ingredients are not counted
+        with self.captureOnCommitCallbacks() as callbacks:
+            private = Recipe.objects.create(user=home_cook, title='Private gratin', instructions='-')
+            RecipeIngredient.objects.create(recipe=private, ingredient=Ingredient.objects.create(name='thyme'),
+                                            quantity='1')
+            private.delete()
+            recipe.delete()
+        self.assertEqual(callbacks, [])
+
+    def test_stale_snapshot_served_while_rebuilding_in_background(self):
+        first = snapshot.get_catalog_snapshot()
+        with self.captureOnCommitCallbacks(execute=True):
+            Recipe.objects.create(user=self.user, title='Gratin 3', instructions='-')
+        version = snapshot.catalog_version()
+        release = threading.Event()
+        builds = []
+
+        def slow_build():
+            builds.append(threading.current_thread())
+            release.wait(timeout=5)
+            return snapshot.CatalogSnapshot(version, first.arrays)
+
+        with override_settings(CATALOG_SNAPSHOT_BACKGROUND_REBUILD=True), \
+                mock.patch.object(snapshot, 'build_snapshot', side_effect=slow_build):
+            # Neither request waits for the build, and only one build runs
+            self.assertIs(snapshot.get_catalog_snapshot(), first)
+            self.assertIs(snapshot.get_catalog_snapshot(), first)
+            rebuild = snapshot._snapshot['rebuild']
+            release.set()
+            rebuild.join(timeout=5)
+            self.assertEqual(snapshot.get_catalog_snapshot().version, version)
+        self.assertEqual(len(builds), 1)
+        self.assertIsNot(builds[0], threading.current_thread())
+
+    def test_rebuild_skipped_while_another_worker_holds_the_lock(self):
+        cache.clear()
+        self.addCleanup(cache.clear)
+        cache.add(snapshot.REBUILD_LOCK_KEY, 1)
+        with mock.patch.object(snapshot, 'build_snapshot') as build_snapshot:
+            self.assertIsNone(snapshot.rebuild_catalog_snapshot())
+        build_snapshot.assert_not_called()
+
+    def test_unreadable_file_falls_back_to_rebuild(self):
+        with open(self.path, 'wb') as file:
+            file.write(b'not a snapshot')
+        self.assertIsNone(snapshot.load_snapshot(self.path))
+        self.assertEqual(len(snapshot.get_catalog_snapshot()), 3)
+
+
+class IngredientAutocompleteTests(TestCase):
+
+    def setUp(self):
+        use_temp_snapshot(self)
+        self.user = User.objects.create_user('chef', password='x')
+        self.client = APIClient()
+        self.client.force_authenticate(user=self.user)
+        uses = {'butter': 3, 'tablespoons butter': 2, 'buttermilk': 1, 'garlic': 2, 'brown sugar': 1}
+        self.ingredients = {name: Ingredient.objects.create(name=name) for name in uses}
+        for num in range(3):
+            recipe = Recipe.objects.create(user=self.user, title=f'Cake {num}', instructions='-')
+            for name, count in uses.items():
+                if num < count:
+                    RecipeIngredient.objects.create(recipe=recipe, ingredient=self.ingredients[name], quantity='1')
+
+    def names(self, query, **params):
+        response = self.client.get('/api/ingredients/autocomplete/', {'q': query, **params})
+        self.assertEqual(response.status_code, 200)
+        return [(item['name'], item['recipe_count']) for item in response.data]
+
+    def test_prefix_matches_any_word_ranked_by_use(self):
+        self.assertEqual(self.names('Butt'), [('butter', 3), ('tablespoons butter', 2), ('buttermilk', 1)])
+        self.assertEqual(self.names('sug'), [('brown sugar', 1)])
+        self.assertEqual(self.names('butter', limit=1), [('butter', 3)])
+        self.assertEqual(self.names(''), [])
+
+    def test_tolerates_one_typo(self):
+        self.assertEqual(self.names('gralic'), [('garlic', 2)])
+        self.assertEqual(self.names('buttr')[:2], [('butter', 3), ('tablespoons butter', 2)])
+        # Too short to guess at
+        self.assertEqual(self.names('gra'), [])
+
+    def test_bad_limit(self):
+        response = self.client.get('/api/ingredients/autocomplete/', {'q': 'b', 'limit': 'x'})
+        self.assertEqual(response.status_code, 400)
+        self.assertIn('error', response.data)
+
+    def test_rebuilt_when_the_catalog_changes(self):
+        self.assertEqual(self.names('sug'), [('brown sugar', 1)])
+        first = autocomplete._index['current']
+        sugar = Ingredient.objects.create(name='sugar')
+        RecipeIngredient.objects.create(recipe=Recipe.objects.get(title='Cake 0'), ingredient=sugar, quantity='1')
+        RecipeIngredient.objects.create(recipe=Recipe.objects.get(title='Cake 2'),
+                                        ingredient=self.ingredients['brown sugar'], quantity='1')
+        RecipeIngredient.objects.filter(ingredient=self.ingredients['butter']).first().delete()
+        self.ingredients['buttermilk'].delete()
+        garlic = self.ingredients['garlic']
+        garlic.name = 'black garlic'
+        with self.captureOnCommitCallbacks(execute=True):
+            garlic.save()
+        # Not before the next check
+        self.assertEqual(self.names('sug'), [('brown sugar', 1)])
+        with mock.patch.object(autocomplete, 'REFRESH_SECONDS', 0):
+            self.assertEqual(self.names('sug'), [('brown sugar', 2), ('sugar', 1)])
+            self.assertEqual(self.names('butt'), [('butter', 2), ('tablespoons butter', 2)])
+            self.assertEqual(self.names('gar'), [('black garlic', 2)])
+            self.assertEqual(self.names('black'), [('black garlic', 2)])
+        self.assertIsNot(autocomplete._index['current'], first)
+
+    def test_new_ingredients_found_without_a_snapshot_rebuild(self):
+        self.assertEqual(self.names('sug'), [('brown sugar', 1)])
+        Ingredient.objects.create(name='sugar')
+        with mock.patch.object(autocomplete, 'REFRESH_SECONDS', 0), \
+                mock.patch.object(snapshot, 'build_snapshot') as build_snapshot:
+            self.assertEqual(self.names('sug'), [('brown sugar', 1), ('sugar', 0)])
+            self.assertEqual(autocomplete._index['recent'].names, ['sugar'])
+            # Merged into the main index once there are enough
+            with mock.patch.object(autocomplete, 'MERGE_ROWS', 1):
+                self.assertEqual(self.names('sug'), [('brown sugar', 1), ('sugar', 0)])
+        build_snapshot.assert_not_called()
+        self.assertIsNone(autocomplete._index['recent'])
+        self.assertIn('sugar', autocomplete._index['current'].names)
+
+    @override_settings(CATALOG_SNAPSHOT_BACKGROUND_REBUILD=True)
+    def test_search_does_not_wait_for_the_refresh(self):
+        self.assertEqual(self.names('sug'), [('brown sugar', 1)])
+        release = threading.Event()
+        with mock.patch.object(autocomplete, 'REFRESH_SECONDS', 0), \
+                mock.patch.object(autocomplete, '_refresh', side_effect=lambda: release.wait(5)) as refresh:
+            self.assertEqual(self.names('sug'), [('brown sugar', 1)])
+            # Still running, so not started again
+            self.assertEqual(self.names('sug'), [('brown sugar', 1)])
+            refresh_thread = autocomplete._index['refresh']
+            release.set()
+            refresh_thread.join(5)
+        self.assertEqual(refresh.call_count, 1)
+        self.assertIsNone(autocomplete._index['refresh'])
+
+    def test_first_search_uses_the_snapshot_at_hand(self):
+        stale = snapshot.get_catalog_snapshot()
+        Ingredient.objects.create(name='sugar')
+        with mock.patch.object(snapshot, 'build_snapshot') as build_snapshot:
+            self.assertEqual(self.names('sug'), [('brown sugar', 1)])
+        build_snapshot.assert_not_called()
+        self.assertIs(autocomplete._index['current'].snapshot, stale)
+
+    def test_long_prefixes_checked_past_the_stored_key_bytes(self):
+        names = ['extra virgin olive oil', 'extra virgin olive oil spray', 'extra virgin olives', 'crème fraîche épaisse']
+        index = autocomplete.IngredientIndex(range(len(names)), names, [4, 3, 2, 1])
+        self.assertEqual(index.keys.dtype, np.dtype(f'S{autocomplete.KEY_BYTES}'))
+        self.assertEqual([name for _, name, _ in index.search('extra virgin olive oil')], names[:2])
+        self.assertEqual([name for _, name, _ in index.search('extra virgin olives', limit=1)], names[2:3])
+        self.assertEqual([name for _, name, _ in index.search('crème fraîche épais')], names[3:])
+        # A typo past the stored bytes
+        self.assertEqual([name for _, name, _ in index.search('extra virgin olive oyl')], names[:2])
+
+
+class RecommendationTests(TestCase):
+
+    def setUp(self):
+        use_temp_snapshot(self)
+        # The catalog belongs to chef; other users' recipes are private
+        chef = User.objects.create_user('chef', password='x')
+        neighbour = User.objects.create_user('neighbour', password='x')
+        self.user = User.objects.create_user('eater', password='x')
+        self.client = APIClient()
+        self.client.force_authenticate(user=self.user)
+        vegetarian = DietaryPreference.objects.create(name='Vegetarian')
+        catalog = [
+            (chef, 'Pesto pasta', 'Italian', ['basil', 'pasta', 'parmesan'], [vegetarian]),
+            (chef, 'Carbonara', 'Italian', ['pasta', 'eggs', 'bacon', 'parmesan'], []),
+            (chef, 'Pad thai', 'Thai', ['rice noodles', 'peanuts', 'eggs'], []),
+            (chef, 'Basil chicken', 'Thai', ['basil', 'chicken'], []),
+            (chef, 'Tomato soup', None, ['tomatoes'], [vegetarian]),
+            (neighbour, 'Family pesto', 'Italian', ['basil', 'pasta', 'parmesan'], [vegetarian]),
+            (self.user, 'Lasagne', 'Italian', ['pasta', 'parmesan', 'tomatoes'], [vegetarian]),
+        ]
+        for user, title, cuisine, ingredients, preferences in catalog:
+            recipe = Recipe.objects.create(user=user, title=title, cuisine=cuisine, instructions='-')
+            for name in ingredients:
+                ingredient, _ = Ingredient.objects.get_or_create(name=name)
+                RecipeIngredient.objects.create(recipe=recipe, ingredient=ingredient, quantity='1')
+            recipe.dietary_preferences.set(preferences)
+
+    def feed(self, **params):
+        response = self.client.get('/api/recommendations/', params)
+        self.assertEqual(response.status_code, 200)
+        return [recipe['title'] for recipe in response.data]
+
+    def test_batch_build_ranks_catalog_for_user(self):
+        call_command('build_recommendations', stdout=io.StringIO())
+        self.assertEqual(RecommendationFeed.objects.count(), 3)
+        # Shared ingredients, cuisine and preference; the user's own recipe
+        # and recipes with nothing in common are left out
+        self.assertEqual(self.feed(), ['Pesto pasta', 'Carbonara', 'Tomato soup'])
+        self.assertEqual(self.feed(offset=1, limit=1), ['Carbonara'])
+
+        response = self.client.get('/api/recommendations/')
+        self.assertEqual(response.data[0]['ingredients'][0]['ingredient_name'], 'basil')
+        self.assertGreater(response.data[0]['score'], response.data[1]['score'])
+
+    def test_reading_the_feed_does_not_score(self):
+        call_command('build_recommendations', user='eater', stdout=io.StringIO())
+        with mock.patch.object(recommendations, 'score_users') as score_users, \
+                CaptureQueriesContext(connection) as queries:
+            self.assertEqual(len(self.feed()), 3)
+        score_users.assert_not_called()
+        # The feed row, then the recipes, their ingredients and preferences
+        self.assertEqual(len(queries), 4)
+
+    def test_saving_a_recipe_rescores_the_user(self):
+        self.assertEqual(self.feed(), ['Pesto pasta', 'Carbonara', 'Tomato soup'])
+        with self.captureOnCommitCallbacks(execute=True):
+            response = self.client.post('/api/recipes/', {
+                'title': 'Green curry', 'instructions': '-', 'cuisine': 'Thai'}, format='json')
+        self.assertEqual(response.status_code, 201)
+        # Equal scores: newest recipe first
+        self.assertEqual(self.feed()[3:], ['Basil chicken', 'Pad thai'])
+
+    def test_rescore_runs_after_commit_in_the_background(self):
+        with override_settings(RECOMMENDATIONS_BACKGROUND_REFRESH=True), \
+                mock.patch.object(recommendations, '_refresh_executor') as executor:
+            with self.captureOnCommitCallbacks() as callbacks:
+                self.client.post('/api/recipes/', {'title': 'Green curry', 'instructions': '-'}, format='json')
+                self.client.post('/api/recipes/', {'title': 'Red curry', 'instructions': '-'}, format='json')
+            executor.submit.assert_not_called()
+            for callback in callbacks:
+                callback()
+        # Queued once for both saves
+        executor.submit.assert_called_once_with(recommendations._refresh_in_background, self.user.id)
+        recommendations._queued.clear()
+
+    def test_scoring_failure_does_not_fail_the_save(self):
+        with mock.patch.object(recommendations, 'score_users', side_effect=MemoryError), \
+                self.assertLogs('recipes.recommendations', 'ERROR'), \
+                self.captureOnCommitCallbacks(execute=True):
+            response = self.client.post('/api/recipes/', {'title': 'Green curry', 'instructions': '-'}, format='json')
+        self.assertEqual(response.status_code, 201)
+
+    def test_first_read_returns_the_feed_it_scored(self):
+        # Not read back, which a lagging replica might not have yet
+        with CaptureQueriesContext(connection) as queries:
+            self.assertEqual(self.feed()[:2], ['Pesto pasta', 'Carbonara'])
+        feed_reads = [query for query in queries
+                      if query['sql'].startswith('SELECT') and RecommendationFeed._meta.db_table in query['sql']]
+        self.assertEqual(len(feed_reads), 1)
+
+    def test_private_recipes_of_other_users_are_not_recommended(self):
+        call_command('build_recommendations', stdout=io.StringIO())
+        self.assertNotIn('Family pesto', self.feed())
+        # Nor an old feed entry for a recipe that has left the catalog
+        Recipe.objects.filter(title='Pesto pasta').update(user=User.objects.get(username='neighbour'))
+        self.assertEqual(self.feed(), ['Carbonara', 'Tomato soup'])
+
+    def test_loading_into_another_account_warns(self):
+        csv_path = write_recipes_csv([sample_row(1)])
+        self.addCleanup(os.remove, csv_path)
+        err = io.StringIO()
+        call_command('load_recipes', csv_path, user='neighbour', stdout=io.StringIO(), stderr=err)
+        self.assertIn('not the catalog owner (chef)', err.getvalue())
+
+    def test_user_without_recipes_gets_empty_feed(self):
+        self.client.force_authenticate(user=User.objects.create_user('new', password='x'))
+        self.assertEqual(self.feed(), [])
+        response = self.client.get('/api/recommendations/', {'limit': 'many'})
+        self.assertEqual(response.status_code, 400)
+        self.assertIn('error', response.data)
+
+
+def start_fake_gemini(test, **config):
+    """Serves a FakeGemini on a free port for the rest of the test; returns its URL."""
+    server = FakeGeminiServer(('127.0.0.1', 0), FakeGeminiConfig(latency='fixed:0', seed=1, **config))
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    test.addCleanup(server.server_close)
+    test.addCleanup(server.shutdown)
+    # A fresh client session per test
+    patcher = mock.patch.object(gemini, '_session', None)
+    patcher.start()
+    test.addCleanup(patcher.stop)
+    return server.url
+
+
+class FakeGeminiTests(SimpleTestCase):
+    PAYLOAD = {'contents': [{'role': 'user', 'parts': [{'text': 'Generate 3 unique recipe(s) in JSON format.'}]}]}
+
+    def generate(self, url, api_key='key'):
+        with override_settings(GEMINI_API_URL=url):
+            return gemini.generated_json(gemini.generate_content(self.PAYLOAD, api_key))
+
+    def test_replies_in_generate_content_shape(self):
+        recipes = self.generate(start_fake_gemini(self))
+        self.assertEqual(len(recipes), 3)
+        self.assertEqual(len({recipe['title'] for recipe in recipes}), 3)
+        for recipe in recipes:
+            self.assertEqual(set(recipe), {'title', 'instructions', 'cooking_time_minutes', 'cuisine', 'ingredients'})
+            names = [item['name'] for item in recipe['ingredients']]
+            self.assertEqual(len(names), len(set(names)))
+
+        verbatim = self.generate(start_fake_gemini(self, duplicate_rate=1))
+        self.assertIn(verbatim[0], FakeGeminiConfig().payloads)
+
+    def test_failures_map_to_client_errors(self):
+        with self.assertRaises(gemini.GeminiRequestError):
+            self.generate(start_fake_gemini(self, error_rate=1))
+        with self.assertRaises(gemini.GeminiRequestError):
+            self.generate(start_fake_gemini(self, throttle_rate=1))
+        with self.assertRaises(gemini.GeminiResponseError):
+            self.generate(start_fake_gemini(self, malformed_rate=1))
+        with self.assertRaises(gemini.GeminiRequestError):
+            self.generate(start_fake_gemini(self), api_key='')
+
+    def test_latency_specs(self):
+        rng = random.Random(1)
+        self.assertEqual(parse_latency('fixed:0.25')(rng), 0.25)
+        self.assertTrue(all(1 <= parse_latency('uniform:1,2')(rng) <= 2 for _ in range(100)))
+        draws = [parse_latency('lognormal:2,0.5')(rng) for _ in range(2000)]
+        self.assertAlmostEqual(float(np.median(draws)), 2, delta=0.2)
+        for spec in ('normal:1', 'fixed', 'uniform:1', 'exponential:-1', 'fixed:soon'):
+            with self.assertRaises(ValueError):
+                parse_latency(spec)
+
+
+class LoadTestTests(LiveServerTestCase):
+
+    def setUp(self):
+        cache.clear()
+        use_temp_snapshot(self)
+        overridden = override_settings(GEMINI_API_URL=start_fake_gemini(self))
+        overridden.enable()
+        self.addCleanup(overridden.disable)
+        env = mock.patch.dict(os.environ, {'GEMINI_API_KEY': 'test-key'})
+        env.start()
+        self.addCleanup(env.stop)
+
+        chef = User.objects.create_user('chef', password='x')
+        salt = Ingredient.objects.create(name='salt')
+        for num in range(20):
+            recipe = Recipe.objects.create(user=chef, title=f'Dish {num}', instructions='-', cooking_time_minutes=20)
+            RecipeIngredient.objects.create(recipe=recipe, ingredient=salt, quantity='1 pinch')
+            for name in (f'vegetable {num % 5}', f'spice {num % 3}'):
+                ingredient, _ = Ingredient.objects.get_or_create(name=name)
+                RecipeIngredient.objects.create(recipe=recipe, ingredient=ingredient, quantity='1')
+
+    def test_mixed_load_reports_every_scenario(self):
+        home_cook = User.objects.create_user('home-cook', password='x')
+        for num in range(20):
+            Recipe.objects.create(user=home_cook, title=f'Private {num}', instructions='-')
+        users = prepare_users(2, recipes_per_user=3, seed=1)
+        self.assertEqual([len(user.recipe_ids) for user in users], [3, 3])
+        # Copies of catalog recipes only, linked to their originals, not
+        # indexed, and the users have feeds
+        copies = Recipe.objects.filter(pk__in=users[0].recipe_ids + users[1].recipe_ids)
+        self.assertEqual(set(copies.values_list('duplicate_of__user__username', flat=True)), {'chef'})
+        self.assertFalse(RecipeSignature.objects.filter(recipe__in=copies).exists())
+        self.assertEqual(RecommendationFeed.objects.filter(user__username__in=['loadtest0', 'loadtest1']).count(), 2)
+        # Reuses the users and their recipes
+        self.assertEqual(prepare_users(2, recipes_per_user=3)[0].recipe_ids, users[0].recipe_ids)
+
+        mix = parse_mix('list=1,detail=1,generate=1,meal-plan=1,shopping-list=1,recommendations=1')
+        records = run_load(self.live_server_url + '/api/', users, mix, rate=30, duration=1, concurrency=4, seed=2)
+        summary = summarize(records, warmup=0, duration=1)
+
+        self.assertEqual(summary['all']['requests'], 30)
+        self.assertEqual(summary['all']['errors'], 0, summary['all']['statuses'])
+        self.assertEqual(set(summary), set(mix) | {'all'})
+        self.assertLessEqual(summary['all']['latency_ms']['p50'], summary['all']['latency_ms']['p99'])
+        self.assertIn('p99 ms', format_report(summary).splitlines()[0])
+
+    def test_mix_validation(self):
+        self.assertEqual(parse_mix('list=3, detail=1'), {'list': 3.0, 'detail': 1.0})
+        for spec in ('lists=1', 'list=x', 'list=0', 'list=-1,detail=2'):
+            with self.assertRaises(ValueError):
+                parse_mix(spec)
+
+
+class StartupImportTests(SimpleTestCase):
+    """
+    Import-time budget for what every worker and management command loads
+    at boot: settings, the app registry (models, admin, signals) and the
+    URLconf that system checks and the first request import.
+    """
+    # Loaded by the views and commands that use them, never at startup
+    DEFERRED_MODULES = {'numpy', 'pyarrow', 'recipes.planner', 'recipes.dedup', 'recipes.snapshot',
+                       'recipes.autocomplete', 'recipes.recommendations'}
+    # Generous for slow CI machines; currently about 0.45s
+    BUDGET_SECONDS = 1.5
+
+    def test_startup_import_profile(self):
+        result = subprocess.run(
+            [sys.executable, '-X', 'importtime', '-c', 'import django; django.setup(); import core.urls'],
+            capture_output=True, text=True, cwd=settings.BASE_DIR,
+            env=dict(os.environ, DJANGO_SETTINGS_MODULE='core.settings'))
+        self.assertEqual(result.returncode, 0, result.stderr[-2000:])
+
+        # Lines look like "import time:  self [us] | cumulative | package",
+        # with nested imports indented under the module that imported them
+        modules, total_us = set(), 0
+        for line in result.stderr.splitlines():
+            if not line.startswith('import time:'):
+                continue
+            _, cumulative, package = line.split('|')
+            if not cumulative.strip().isdigit():
+                continue  # Header
+            modules.add(package.strip())
+            if not package.startswith('  '):
+                total_us += int(cumulative)
+
+        self.assertEqual(self.DEFERRED_MODULES & modules, set())
+        self.assertLess(total_us / 1e6, self.BUDGET_SECONDS)
+
+
+class AdminPerformanceTests(TestCase):
+
+    def setUp(self):
+        self.admin = User.objects.create_superuser('root', password='x')
+        self.client.force_login(self.admin)
+        self.plan = MealPlan.objects.create(user=self.admin, start_date=date(2026, 1, 5),
+                                            end_date=date(2026, 1, 11))
+        self.recipe = Recipe.objects.create(user=self.admin, title='Apple Pie', instructions='Bake.')
+
+    def add_rows(self, count):
+        for num in range(count):
+            ingredient = Ingredient.objects.create(name=f'spice {Ingredient.objects.count()}')
+            RecipeIngredient.objects.create(recipe=self.recipe, ingredient=ingredient, quantity='1')
+            ShoppingListItem.objects.create(meal_plan=self.plan, ingredient=ingredient, quantity='1')
+
+    def queries_for(self, url):
+        with CaptureQueriesContext(connection) as queries:
+            self.assertEqual(self.client.get(url).status_code, 200)
+        return len(queries)
+
+    def test_changelist_queries_do_not_grow_with_rows(self):
+        for url in ('/admin/recipes/recipeingredient/', '/admin/recipes/shoppinglistitem/'):
+            self.add_rows(2)
+            few = self.queries_for(url)
+            self.add_rows(10)
+            self.assertEqual(self.queries_for(url), few, url)
+
+    def test_recipe_form_does_not_list_every_ingredient(self):
+        self.add_rows(1)
+        Ingredient.objects.create(name='unused saffron')
+        response = self.client.get(f'/admin/recipes/recipe/{self.recipe.id}/change/')
+        self.assertContains(response, 'spice 0')  # The recipe's own ingredient
+        self.assertNotContains(response, 'unused saffron')
+
+    def test_search_matches_whole_term_as_prefix_of_any_title_word(self):
+        crust = Recipe.objects.create(user=self.admin, title='Pie Crust', instructions='-')
+        for term, titles in (('Apple P', ['Apple Pie']), ('pie', ['Pie Crust', 'Apple Pie']),
+                             ('APPLE', ['Apple Pie']), ('crust', ['Pie Crust']), ('pple', []), ('Apple C', [])):
+            response = self.client.get('/admin/recipes/recipe/', {'q': term})
+            self.assertEqual([r.title for r in response.context['cl'].result_list], titles, term)
+        crust.title = 'Shortcrust'
+        crust.save()
+        response = self.client.get('/admin/recipes/recipe/', {'q': 'pie'})
+        self.assertEqual([r.title for r in response.context['cl'].result_list], ['Apple Pie'])
+
+    def test_recipe_ingredient_search_matches_either_relation(self):
+        self.add_rows(2)
+        other = Recipe.objects.create(user=self.admin, title='Mulled Wine', instructions='-')
+        RecipeIngredient.objects.create(recipe=other, ingredient=Ingredient.objects.get(name='spice 0'), quantity='1')
+        for term, count in (('pie', 2), ('Spice 1', 1), ('spice 0', 2), ('wine', 1), ('Crust', 0)):
+            response = self.client.get('/admin/recipes/recipeingredient/', {'q': term})
+            self.assertEqual(len(response.context['cl'].result_list), count, term)
+
+    @skipUnless(connection.vendor == 'sqlite', 'SQLite query plan')
+    def test_search_seeks_the_title_index(self):
+        queryset, _ = RecipeAdmin(Recipe, admin.site).get_search_results(None, Recipe.objects.all(), 'apple')
+        plan = queryset.explain()
+        self.assertIn('recipetitlekey_key', plan)
+        self.assertNotIn('SCAN recipes_recipetitlekey', plan)
+
+    def test_unfiltered_changelist_uses_estimated_count(self):
+        with mock.patch('recipes.admin.estimated_row_count', return_value=5000000):
+            unfiltered = self.client.get('/admin/recipes/recipe/')
+            filtered = self.client.get('/admin/recipes/recipe/', {'q': 'Apple'})
+        self.assertEqual(unfiltered.context['cl'].result_count, 5000000)
+        self.assertEqual(filtered.context['cl'].result_count, 1)
@@ -0,0 +1,98 @@
+import math
+
+from django.conf import settings
+from rest_framework.throttling import SimpleRateThrottle
+
+from .concurrency import cache_lock
+
+
+class TokenBucketThrottle(SimpleRateThrottle):
+    """
+    Token bucket on the Django cache, implemented as GCRA: the bucket is a
+    single "theoretical arrival time" per key. The rate comes from
+    DEFAULT_THROTTLE_RATES[scope] as usual and the bucket size from
+    THROTTLE_BURSTS[scope]. Each request costs get_cost() tokens, which
+    refund() gives back if a later check turns the request away.
+    """
+
+    def __init__(self):
+        super().__init__()
+        self.burst = settings.THROTTLE_BURSTS.get(self.scope, 1)
+        self.retry_after = None
+        self.charged = 0.0  # Seconds added to the arrival time by this request
+
+    def get_cost(self, request):
+        return 1
+
+    def allow_request(self, request, view):
+        if self.rate is None:
+            return True
+        self.key = self.get_cache_key(request, view)
+        if self.key is None:
+            return True
+
+        interval = self.duration / self.num_requests  # seconds per token
+        cost = min(self.get_cost(request), self.burst)
+        with cache_lock(self.key):
+            now = self.timer()
+            arrival = max(self.cache.get(self.key, now), now) + cost * interval
+            allowed_at = arrival - self.burst * interval
+            if allowed_at > now:
+                self.retry_after = allowed_at - now
+                return False
+            self.cache.set(self.key, arrival, math.ceil(arrival - now) + 1)
+        self.charged = cost * interval
+        return True
+
+    def refund(self):
+        if not self.charged:
+            return
+        with cache_lock(self.key):
+            now = self.timer()
+            arrival = self.cache.get(self.key)
+            if arrival is not None and arrival - self.charged > now:
+                self.cache.set(self.key, arrival - self.charged, math.ceil(arrival - self.charged - now) + 1)
+            elif arrival is not None:
+                self.cache.delete(self.key)
+        self.charged = 0.0
+
+    def wait(self):
+        return self.retry_after
+
+
+def requested_recipe_count(request):
+    """
+    num_recipes from the request body. Invalid values count as 1, since
+    the view rejects them without calling Gemini.
+    """
+    try:
+        count = int(request.data.get('num_recipes', 1))
+    except (TypeError, ValueError):
+        return 1
+    return count if 1 <= count <= settings.GENERATION_MAX_RECIPES else 1
+
+
+class GenerationUserThrottle(TokenBucketThrottle):
+    """Per-user budget of generated recipes."""
+    scope = 'generation_user'
+
+    def get_cost(self, request):
+        return requested_recipe_count(request)
+
+    def get_cache_key(self, request, view):
+        if not request.user or not request.user.is_authenticated:
+            ident = self.get_ident(request)
+        else:
+            ident = request.user.pk
+        return self.cache_format % {'scope': self.scope, 'ident': ident}
+
+
+class GenerationGlobalThrottle(TokenBucketThrottle):
+    """Budget of generated recipes shared by all users."""
+    scope = 'generation_global'
+
+    def get_cost(self, request):
+        return requested_recipe_count(request)
+
+    def get_cache_key(self, request, view):
+        return self.cache_format % {'scope': self.scope, 'ident': 'all'}
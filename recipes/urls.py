@@ -7,6 +7,8 @@ urlpatterns = [
          name='ingredient-list-create'),
     path('ingredients/<int:pk>/',
          views.IngredientRetrieveUpdateDestroy.as_view(), name='ingredient-detail'),
+    path('ingredients/autocomplete/', views.IngredientAutocomplete.as_view(),
+         name='ingredient-autocomplete'),
 
     # API Endpoints for Dietary Preferences
     path('dietary-preferences/', views.DietaryPreferenceListCreate.as_view(),
@@ -19,12 +21,22 @@ urlpatterns = [
          name='recipe-list-create'),
     path('recipes/<int:pk>/',
          views.RecipeRetrieveUpdateDestroy.as_view(), name='recipe-detail'),
+    path('recipes/facets/', views.RecipeFacetList.as_view(),
+         name='recipe-facets'),
+    path('recipes/export/', views.RecipeExport.as_view(),
+         name='recipe-export'),
+
+    # API Endpoint for the recommendation feed
+    path('recommendations/', views.RecommendationList.as_view(),
+         name='recommendation-list'),
 
     # API Endpoints for Meal Plans
     path('meal-plans/', views.MealPlanListCreate.as_view(),
          name='meal-plan-list-create'),
     path('meal-plans/<int:pk>/',
          views.MealPlanRetrieveUpdateDestroy.as_view(), name='meal-plan-detail'),
+    path('meal-plans/optimize/', views.MealPlanOptimizeAPIView.as_view(),
+         name='meal-plan-optimize'),
 
     # API Endpoints for Shopping List Items
     path('shopping-list-items/', views.ShoppingListItemListCreate.as_view(),
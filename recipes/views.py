@@ -1,20 +1,30 @@
-from rest_framework import generics, status
+from rest_framework import exceptions, generics, status
 from rest_framework.response import Response
 from rest_framework.views import APIView
 from rest_framework.permissions import IsAuthenticated
+from django.conf import settings
+from django.http import StreamingHttpResponse
 from django.contrib.auth.models import User
+from django.db import transaction
 from django.shortcuts import get_object_or_404
 
-from .models import Ingredient, DietaryPreference, Recipe, RecipeIngredient, MealPlan, ShoppingListItem
+from .models import Ingredient, DietaryPreference, Recipe, RecipeIngredient, FacetCount, MealPlan, ShoppingListItem
+from .catalog import catalog_recipes
 from .serializers import (
     IngredientSerializer, DietaryPreferenceSerializer, RecipeSerializer,
-    MealPlanSerializer, ShoppingListItemSerializer
+    MealPlanSerializer, ShoppingListItemSerializer, FacetCountSerializer,
+    MealPlanOptimizeSerializer, recipe_representations
 )
-
-# Import for Gemini API integration (will be used later)
-import requests
-import json
+from .concurrency import CacheSemaphore, SemaphoreFull
+from .export import CONTENT_TYPES, available_formats, export_recipes
+from . import gemini
+from .renderers import CSVExportRenderer, NDJSONExportRenderer, ParquetExportRenderer
+from .throttles import GenerationGlobalThrottle, GenerationUserThrottle
+
+# numpy-backed modules (planner, dedup) are imported in the views that use
+# them, to keep them out of worker and management command startup
 import os  # For environment variables
+from datetime import timedelta
 
 # --- Ingredient API Views ---
 
@@ -30,6 +40,26 @@ class IngredientRetrieveUpdateDestroy(generics.RetrieveUpdateDestroyAPIView):
     serializer_class = IngredientSerializer
     # permission_classes = [IsAuthenticated] # Uncomment for authenticated access
 
+
+class IngredientAutocomplete(APIView):
+    """
+    Ingredient suggestions for a partial name, most used first, e.g.
+    GET ?q=butt&limit=5 -> [{"id": 12, "name": "butter", "recipe_count": 310}, ...].
+    Served from an in-memory prefix index that tolerates one typo.
+    """
+
+    def get(self, request, *args, **kwargs):
+        from .autocomplete import MAX_LIMIT, search_ingredients
+
+        try:
+            limit = min(max(int(request.query_params.get('limit', 10)), 1), MAX_LIMIT)
+        except ValueError:
+            return Response({"error": "limit must be an integer."}, status=status.HTTP_400_BAD_REQUEST)
+        matches = search_ingredients(request.query_params.get('q', ''), limit)
+        return Response([
+            {'id': ingredient_id, 'name': name, 'recipe_count': count}
+            for ingredient_id, name, count in matches])
+
 # --- DietaryPreference API Views ---
 
 
@@ -54,11 +84,22 @@ class RecipeListCreate(generics.ListCreateAPIView):
 
     def get_queryset(self):
         # Only show recipes belonging to the current authenticated user
-        return Recipe.objects.filter(user=self.request.user).order_by('-id')
+        return Recipe.objects.filter(user=self.request.user).select_related('nutrition').order_by('-id')
 
     def perform_create(self, serializer):
+        from .recommendations import schedule_feed_refresh
+
         # Automatically assign the current user to the recipe
         serializer.save(user=self.request.user)
+        schedule_feed_refresh(self.request.user.id)
+
+    def list(self, request, *args, **kwargs):
+        # Read-only fast path: same output as RecipeSerializer, built from values()
+        queryset = self.filter_queryset(self.get_queryset())
+        page = self.paginate_queryset(queryset)
+        if page is not None:
+            return self.get_paginated_response(recipe_representations(page))
+        return Response(recipe_representations(queryset))
 
 
 class RecipeRetrieveUpdateDestroy(generics.RetrieveUpdateDestroyAPIView):
@@ -67,7 +108,79 @@ class RecipeRetrieveUpdateDestroy(generics.RetrieveUpdateDestroyAPIView):
 
     def get_queryset(self):
         # Only allow users to retrieve/update/delete their own recipes
-        return Recipe.objects.filter(user=self.request.user)
+        return Recipe.objects.filter(user=self.request.user).select_related('nutrition')
+
+    def retrieve(self, request, *args, **kwargs):
+        recipe = self.get_object()
+        return Response(recipe_representations([recipe])[0])
+
+
+
+class RecommendationList(APIView):
+    """
+    Catalog recipes recommended for the current user, best first, each with
+    its "score". Paged with ?offset= and ?limit=. Reads the feed stored by
+    build_recommendations, which is rescored whenever the user saves or
+    generates a recipe or creates a meal plan.
+
+    Only catalog recipes (settings.CATALOG_OWNER's) are listed; other users'
+    recipes are private to them, as in the detail and export endpoints.
+    """
+    permission_classes = [IsAuthenticated]
+
+    def get(self, request, *args, **kwargs):
+        from .recommendations import FEED_SIZE, read_feed
+
+        try:
+            offset = max(int(request.query_params.get('offset', 0)), 0)
+            limit = min(max(int(request.query_params.get('limit', 20)), 1), FEED_SIZE)
+        except ValueError:
+            return Response({"error": "offset and limit must be integers."}, status=status.HTTP_400_BAD_REQUEST)
+        feed = read_feed(request.user.id, offset, limit)
+        scores = dict(feed)
+        rank = {recipe_id: i for i, (recipe_id, _) in enumerate(feed)}
+        # Recipes deleted, or no longer in the catalog, since the feed was built are skipped
+        recipes = recipe_representations(catalog_recipes().filter(pk__in=list(scores)))
+        recipes.sort(key=lambda recipe: rank[recipe['id']])
+        return Response([{**recipe, 'score': round(scores[recipe['id']], 4)} for recipe in recipes])
+
+
+class RecipeExport(APIView):
+    """
+    Streams recipes with their ingredients as NDJSON (default), CSV or
+    Parquet, chosen with ?format= or the Accept header. Staff export the
+    whole catalog, other users their own recipes.
+    """
+    permission_classes = [IsAuthenticated]
+    renderer_classes = [NDJSONExportRenderer, CSVExportRenderer, ParquetExportRenderer]
+
+    def get(self, request, *args, **kwargs):
+        fmt = request.accepted_renderer.format
+        if fmt not in available_formats():
+            return Response({"error": f"{fmt} export is not available on this server."},
+                            status=status.HTTP_400_BAD_REQUEST, content_type='application/json')
+        queryset = Recipe.objects.all()
+        if not request.user.is_staff:
+            queryset = queryset.filter(user=request.user)
+        response = StreamingHttpResponse(export_recipes(fmt, queryset), content_type=CONTENT_TYPES[fmt])
+        response['Content-Disposition'] = f'attachment; filename="recipes.{fmt}"'
+        return response
+
+
+class RecipeFacetList(APIView):
+    """
+    Facet counts for the filter sidebar, e.g.
+    {"cuisine": [{"value": "Italian", "count": 42}, ...], "calories": [...]}.
+    Reads the precomputed FacetCount table, so this is a single small query.
+    """
+    permission_classes = [IsAuthenticated]
+
+    def get(self, request, *args, **kwargs):
+        facets = {}
+        for facet_count in FacetCount.objects.filter(count__gt=0).order_by('facet', '-count', 'value'):
+            facets.setdefault(facet_count.facet, []).append(
+                FacetCountSerializer(facet_count).data)
+        return Response(facets)
 
 # --- MealPlan API Views ---
 
@@ -80,7 +193,10 @@ class MealPlanListCreate(generics.ListCreateAPIView):
         return MealPlan.objects.filter(user=self.request.user).order_by('-start_date')
 
     def perform_create(self, serializer):
+        from .recommendations import schedule_feed_refresh
+
         serializer.save(user=self.request.user)
+        schedule_feed_refresh(self.request.user.id)
 
 
 class MealPlanRetrieveUpdateDestroy(generics.RetrieveUpdateDestroyAPIView):
@@ -90,6 +206,72 @@ class MealPlanRetrieveUpdateDestroy(generics.RetrieveUpdateDestroyAPIView):
     def get_queryset(self):
         return MealPlan.objects.filter(user=self.request.user)
 
+
+class MealPlanOptimizeAPIView(APIView):
+    """
+    Builds and saves a meal plan from the recipe catalog, choosing recipes
+    that share ingredients so the shopping list stays short. Only catalog
+    recipes are candidates: the plan is returned with the recipes' details,
+    and other users' recipes are private to them.
+    """
+    permission_classes = [IsAuthenticated]
+
+    def post(self, request, *args, **kwargs):
+        from .planner import get_catalog_matrix, plan_meals, shopping_list_size
+        from .recommendations import schedule_feed_refresh
+
+        serializer = MealPlanOptimizeSerializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        options = serializer.validated_data
+
+        matrix = get_catalog_matrix()
+        allowed = None
+        if options['dietary_preferences']:
+            matching = catalog_recipes()
+            for name in options['dietary_preferences']:
+                matching = matching.filter(dietary_preferences__name=name)
+            allowed = matrix.rows_mask(matching.values_list('id', flat=True))
+
+        try:
+            days = plan_meals(
+                matrix, options['num_days'],
+                meals_per_day=options['meals_per_day'],
+                max_minutes_per_day=options['max_minutes_per_day'],
+                calories_per_day=options['calories_per_day'],
+                allowed=allowed)
+        except ValueError as e:
+            return Response({"error": str(e)}, status=status.HTTP_400_BAD_REQUEST)
+
+        recipe_ids = [int(matrix.recipe_ids[row]) for day in days for row in day]
+        with transaction.atomic():
+            meal_plan = MealPlan.objects.create(
+                user=request.user, name=options['name'],
+                start_date=options['start_date'], end_date=options['end_date'])
+            meal_plan.recipes.set(recipe_ids)
+
+            # One shopping list entry per ingredient, listing each recipe's quantity
+            quantities = {}
+            for ingredient_id, quantity in RecipeIngredient.objects.filter(
+                    recipe_id__in=recipe_ids).values_list('ingredient_id', 'quantity'):
+                quantities.setdefault(ingredient_id, []).append(quantity)
+            ShoppingListItem.objects.bulk_create(
+                ShoppingListItem(meal_plan=meal_plan, ingredient_id=ingredient_id,
+                                 quantity=' + '.join(amounts)[:100])
+                for ingredient_id, amounts in quantities.items())
+        schedule_feed_refresh(request.user.id)
+
+        schedule = [
+            {'date': options['start_date'] + timedelta(days=day_num),
+             'recipe_ids': [int(matrix.recipe_ids[row]) for row in day]}
+            for day_num, day in enumerate(days)
+        ]
+        return Response({
+            **MealPlanSerializer(meal_plan).data,
+            'days': schedule,
+            'shopping_list_size': shopping_list_size(
+                matrix, [row for day in days for row in day]),
+        }, status=status.HTTP_201_CREATED)
+
 # --- ShoppingListItem API Views ---
 
 
@@ -120,11 +302,42 @@ class ShoppingListItemRetrieveUpdateDestroy(generics.RetrieveUpdateDestroyAPIVie
 # --- Gemini API Integration View (for Recipe Generation) ---
 
 
+# Caps Gemini calls in flight across all workers
+gemini_semaphore = CacheSemaphore(
+    'gemini',
+    size=settings.GENERATION_MAX_CONCURRENT,
+    max_queue=settings.GENERATION_MAX_QUEUE,
+    queue_timeout=settings.GENERATION_QUEUE_TIMEOUT,
+    lease=settings.GEMINI_TIMEOUT + 5,
+)
+
+
 class GenerateRecipeAPIView(APIView):
     # Only authenticated users can generate recipes
     permission_classes = [IsAuthenticated]
+    # Global and per-user token buckets, charged per requested recipe
+    throttle_classes = [GenerationGlobalThrottle, GenerationUserThrottle]
+
+    def check_throttles(self, request):
+        # Unlike DRF's, stops at the first bucket that denies and refunds the
+        # ones already charged, so a request turned away by the global limit
+        # or a busy Gemini doesn't use up the user's budget
+        self.charged_throttles = []
+        for throttle in self.get_throttles():
+            if not throttle.allow_request(request, self):
+                self.refund_throttles()
+                self.throttled(request, throttle.wait())
+            self.charged_throttles.append(throttle)
+
+    def refund_throttles(self):
+        for throttle in getattr(self, 'charged_throttles', []):
+            throttle.refund()
+        self.charged_throttles = []
 
     def post(self, request, *args, **kwargs):
+        from .dedup import find_duplicate, index_recipe, recipe_signature
+        from .recommendations import schedule_feed_refresh
+
         user = request.user
         # Extract data from the request body (sent from React)
         ingredients_input = request.data.get(
@@ -134,7 +347,15 @@ class GenerateRecipeAPIView(APIView):
         cooking_time = request.data.get('cooking_time', '')
         cuisine = request.data.get('cuisine', '')
         # How many recipes to generate
-        num_recipes = request.data.get('num_recipes', 1)
+        try:
+            num_recipes = int(request.data.get('num_recipes', 1))
+        except (TypeError, ValueError):
+            num_recipes = 0
+        if not 1 <= num_recipes <= settings.GENERATION_MAX_RECIPES:
+            return Response(
+                {"error": f"num_recipes must be between 1 and {settings.GENERATION_MAX_RECIPES}."},
+                status=status.HTTP_400_BAD_REQUEST
+            )
 
         # Construct the prompt for the Gemini API
         prompt = (
@@ -202,23 +423,27 @@ class GenerateRecipeAPIView(APIView):
                 }
             }
 
-            api_url = f"https://generativelanguage.googleapis.com/v1beta/models/gemini-2.0-flash:generateContent?key={api_key}"
-
-            headers = {'Content-Type': 'application/json'}
-            response = requests.post(
-                api_url, headers=headers, data=json.dumps(payload))
-            response.raise_for_status()  # Raise an exception for HTTP errors (4xx or 5xx)
-
-            result = response.json()
-
-            generated_recipes_data = []
-            if result.get('candidates') and result['candidates'][0].get('content') and result['candidates'][0]['content'].get('parts'):
-                # The LLM response is a string that needs to be parsed as JSON
-                json_string = result['candidates'][0]['content']['parts'][0]['text']
-                generated_recipes_data = json.loads(json_string)
+            # Wait for a free Gemini slot, or shed load with a 429
+            with gemini_semaphore.slot():
+                result = gemini.generate_content(payload, api_key)
+            generated_recipes_data = gemini.generated_json(result)
 
             saved_recipes = []
             for recipe_data in generated_recipes_data:
+                # Reuse the user's own near-identical recipe instead of saving
+                # another copy; near-duplicates of other users' recipes are
+                # saved but linked to the original
+                signature = recipe_signature(
+                    recipe_data.get('title', ''),
+                    [ing_data['name'] for ing_data in recipe_data.get('ingredients', [])])
+                duplicate = None
+                duplicate_id = find_duplicate(signature)
+                if duplicate_id is not None:
+                    duplicate = Recipe.objects.get(pk=duplicate_id)
+                    if duplicate.user_id == user.id:
+                        saved_recipes.append(recipe_representations([duplicate])[0])
+                        continue
+
                 # Create or get Ingredients and DietaryPreferences
                 ingredients_list = []
                 for ing_data in recipe_data.pop('ingredients', []):
@@ -244,7 +469,9 @@ class GenerateRecipeAPIView(APIView):
 
                 if recipe_serializer.is_valid():
                     recipe = recipe_serializer.save(
-                        user=user)  # Save with the user object
+                        user=user, duplicate_of=duplicate)  # Save with the user object
+                    if duplicate is None:
+                        index_recipe(recipe, signature)
                     # Add many-to-many ingredients
                     for ing_item in ingredients_list:
                         RecipeIngredient.objects.create(
@@ -267,14 +494,21 @@ class GenerateRecipeAPIView(APIView):
                         status=status.HTTP_400_BAD_REQUEST
                     )
 
+            # The new recipes change what this user is recommended
+            schedule_feed_refresh(user.id)
             return Response(saved_recipes, status=status.HTTP_201_CREATED)
 
-        except requests.exceptions.RequestException as e:
+        except SemaphoreFull as e:
+            self.refund_throttles()
+            # DRF turns this into a 429 with a Retry-After header
+            raise exceptions.Throttled(
+                wait=e.retry_after, detail="Recipe generation is busy, please retry shortly.")
+        except gemini.GeminiRequestError as e:
             return Response(
                 {"error": f"Error communicating with Gemini API: {str(e)}"},
                 status=status.HTTP_500_INTERNAL_SERVER_ERROR
             )
-        except json.JSONDecodeError as e:
+        except gemini.GeminiResponseError as e:
             return Response(
                 {"error": f"Invalid JSON response from Gemini API: {str(e)}"},
                 status=status.HTTP_500_INTERNAL_SERVER_ERROR